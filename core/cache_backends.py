@@ -0,0 +1,276 @@
+# core/cache_backends.py
+"""
+Cache à deux niveaux.
+
+- niveau 1 : LRU en mémoire du processus, avec TTL court (LOCAL_TTL secondes)
+- niveau 2 : cache partagé entre processus (alias SHARED, fichier ou base :
+  pas de service externe)
+
+Lectures : niveau 1, sinon niveau 2 (et recopie en niveau 1).
+Écritures / suppressions / incr : niveau 2 puis niveau 1 du processus courant.
+Les autres processus voient un changement au plus LOCAL_TTL secondes plus tard ;
+les données versionnées (geo:lists:<version>...) ne changent jamais sous une clé
+donnée, seul le compteur de version profite de ce délai.
+
+stats() : hits niveau 1 / niveau 2, misses (compteurs du processus).
+
+aget / aget_many / aset (vues async) : le niveau 1 est lu sur la boucle
+d'événements sans changer de thread ; seul un accès au niveau 2 passe par le
+cache partagé (thread pour un cache fichier).
+
+FileCache : FileBasedCache dont le nettoyage ne liste le dossier qu'au plus
+toutes les CULL_INTERVAL secondes (FileBasedCache le fait à chaque set : coût
+proportionnel au nombre de fichiers).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+
+_MISSING = object()
+
+# Django crée une instance de backend par thread : le niveau 1 et les compteurs
+# sont partagés par LOCATION pour valoir pour tout le processus.
+_stores: dict[str, tuple[OrderedDict, threading.Lock, dict]] = {}
+_stores_lock = threading.Lock()
+# dernier nettoyage par dossier (FileCache)
+_last_culls: dict[str, float] = {}
+
+
+def _store(location: str):
+    with _stores_lock:
+        if location not in _stores:
+            _stores[location] = (
+                OrderedDict(),
+                threading.Lock(),
+                {"local_hits": 0, "shared_hits": 0, "misses": 0},
+            )
+        return _stores[location]
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._shared_alias = options.get("SHARED", "shared")
+        self._local_ttl = float(options.get("LOCAL_TTL", 5))
+        self._local_max = int(options.get("LOCAL_MAX_ENTRIES", 2000))
+
+        self._local, self._lock, self._stats = _store(location or "default")
+
+    @property
+    def shared(self) -> BaseCache:
+        return caches[self._shared_alias]
+
+    # -----------------------------
+    # niveau 1
+    # -----------------------------
+    def _local_get(self, key: str):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return _MISSING
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+            return value
+
+    def _local_set(self, key: str, value, timeout=DEFAULT_TIMEOUT) -> None:
+        ttl = self._local_ttl
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            if timeout <= 0:
+                self._local_delete(key)
+                return
+            ttl = min(ttl, timeout)
+        with self._lock:
+            self._local[key] = (time.monotonic() + ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self._local_max:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, key: str) -> None:
+        with self._lock:
+            self._local.pop(key, None)
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += n
+
+    # -----------------------------
+    # API cache Django
+    # -----------------------------
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self._local_get(local_key)
+        if value is not _MISSING:
+            self._count("local_hits")
+            return value
+
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count("misses")
+            return default
+
+        self._count("shared_hits")
+        self._local_set(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        out = {}
+        remaining = []
+        for k in keys:
+            value = self._local_get(self.make_and_validate_key(k, version=version))
+            if value is _MISSING:
+                remaining.append(k)
+            else:
+                out[k] = value
+        self._count("local_hits", len(out))
+
+        if remaining:
+            found = self.shared.get_many(remaining, version=version)
+            self._count("shared_hits", len(found))
+            self._count("misses", len(remaining) - len(found))
+            for k, value in found.items():
+                self._local_set(self.make_and_validate_key(k, version=version), value)
+            out.update(found)
+        return out
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout=timeout, version=version)
+        self._local_set(self.make_and_validate_key(key, version=version), value, timeout)
+
+    # -----------------------------
+    # API asynchrone
+    # -----------------------------
+    async def aget(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self._local_get(local_key)
+        if value is not _MISSING:
+            self._count("local_hits")
+            return value
+
+        value = await self.shared.aget(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count("misses")
+            return default
+
+        self._count("shared_hits")
+        self._local_set(local_key, value)
+        return value
+
+    async def aget_many(self, keys, version=None):
+        out = {}
+        remaining = []
+        for k in keys:
+            value = self._local_get(self.make_and_validate_key(k, version=version))
+            if value is _MISSING:
+                remaining.append(k)
+            else:
+                out[k] = value
+        self._count("local_hits", len(out))
+
+        if remaining:
+            found = await self.shared.aget_many(remaining, version=version)
+            self._count("shared_hits", len(found))
+            self._count("misses", len(remaining) - len(found))
+            for k, value in found.items():
+                self._local_set(self.make_and_validate_key(k, version=version), value)
+            out.update(found)
+        return out
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        await self.shared.aset(key, value, timeout=timeout, version=version)
+        self._local_set(self.make_and_validate_key(key, version=version), value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout=timeout, version=version)
+        if added:
+            self._local_set(self.make_and_validate_key(key, version=version), value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for k in keys:
+            self._local_delete(self.make_and_validate_key(k, version=version))
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        if self._local_get(self.make_and_validate_key(key, version=version)) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    @contextmanager
+    def _incr_lock(self):
+        # cache fichier : incr = lecture + écriture, on sérialise entre processus
+        directory = getattr(self.shared, "_dir", None)
+        if directory is None:
+            yield
+            return
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, ".incr.lock"), "a+b") as f:
+            locks.lock(f, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(f)
+
+    def incr(self, key, delta=1, version=None):
+        """
+        Les compteurs (versions, séquences) sont conservés sans expiration :
+        BaseCache.incr les réécrirait avec le TIMEOUT par défaut.
+        """
+        with self._incr_lock():
+            value = self.shared.get(key, _MISSING, version=version)
+            if value is _MISSING:
+                raise ValueError("Key '%s' not found" % key)
+            value += delta
+            self.shared.set(key, value, timeout=None, version=version)
+        self._local_set(self.make_and_validate_key(key, version=version), value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
+
+    def clear_local(self) -> None:
+        with self._lock:
+            self._local.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["local_entries"] = len(self._local)
+        lookups = stats["local_hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["local_hits"] + stats["shared_hits"]) / lookups, 4) if lookups else None
+        return stats
+
+
+class FileCache(FileBasedCache):
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._cull_interval = float(params.get("OPTIONS", {}).get("CULL_INTERVAL", 60))
+
+    def _cull(self):
+        now = time.monotonic()
+        last = _last_culls.get(self._dir)
+        if last is not None and now - last < self._cull_interval:
+            return
+        _last_culls[self._dir] = now
+        super()._cull()
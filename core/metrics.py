@@ -0,0 +1,201 @@
+# core/metrics.py
+"""
+Métriques par vue (temps, requêtes SQL, cache, taille des réponses).
+
+- RequestMetricsMiddleware (core/middleware.py) appelle record() à chaque requête
+- agrégats du processus recopiés dans le cache partagé au plus toutes les
+  METRICS_FLUSH_SECONDS : /metrics additionne les workers (gunicorn) au lieu
+  de ne montrer que celui qui répond
+- metrics_view : format texte Prometheus ; accès staff ou
+  "Authorization: Bearer <METRICS_TOKEN>"
+- JsonFormatter : une ligne JSON par log (champs passés dans extra={"fields": {...}})
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+# secondes ; bornes supérieures des classes de l'histogramme de durée
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+WORKERS_KEY = "metrics:workers"
+WORKER_TTL = 24 * 3600
+
+_FIELDS = (
+    "requests", "errors", "duration_sum", "queries", "db_seconds",
+    "cache_hits", "cache_misses", "bytes", "budget_exceeded",
+)
+
+_lock = threading.Lock()
+_views: dict[str, dict] = {}
+_last_flush = 0.0
+
+
+def _empty() -> dict:
+    stats = {f: 0 for f in _FIELDS}
+    stats["buckets"] = [0] * (len(BUCKETS) + 1)
+    return stats
+
+
+def record(view: str, *, status: int, seconds: float, queries: int, db_seconds: float,
+           cache_hits: int, cache_misses: int, size: int, over_budget: bool) -> None:
+    with _lock:
+        stats = _views.setdefault(view, _empty())
+        stats["requests"] += 1
+        stats["errors"] += int(status >= 500)
+        stats["duration_sum"] += seconds
+        stats["queries"] += queries
+        stats["db_seconds"] += db_seconds
+        stats["cache_hits"] += cache_hits
+        stats["cache_misses"] += cache_misses
+        stats["bytes"] += size
+        stats["budget_exceeded"] += int(over_budget)
+        i = next((i for i, b in enumerate(BUCKETS) if seconds <= b), len(BUCKETS))
+        stats["buckets"][i] += 1
+    _maybe_flush()
+
+
+def snapshot() -> dict[str, dict]:
+    with _lock:
+        return {view: {**s, "buckets": list(s["buckets"])} for view, s in _views.items()}
+
+
+def reset() -> None:
+    with _lock:
+        _views.clear()
+
+
+# -----------------------------
+# Agrégation entre processus
+# -----------------------------
+
+def _worker_key(pid: int) -> str:
+    return f"metrics:worker:{pid}"
+
+
+def flush() -> None:
+    global _last_flush
+    _last_flush = time.monotonic()
+    pid = os.getpid()
+    cache.set(_worker_key(pid), snapshot(), WORKER_TTL)
+    workers = cache.get(WORKERS_KEY) or []
+    if pid not in workers:
+        # workers disparus : leur entrée expire, on les retire de la liste à la lecture
+        cache.set(WORKERS_KEY, workers + [pid], WORKER_TTL)
+
+
+def _maybe_flush() -> None:
+    if time.monotonic() - _last_flush >= getattr(settings, "METRICS_FLUSH_SECONDS", 10):
+        flush()
+
+
+def collect() -> dict[str, dict]:
+    """
+    Somme des agrégats de tous les workers connus (dont le processus courant, à jour).
+    """
+    flush()
+    workers = cache.get(WORKERS_KEY) or []
+    found = cache.get_many([_worker_key(pid) for pid in workers])
+    alive = [pid for pid in workers if _worker_key(pid) in found]
+    if len(alive) != len(workers):
+        cache.set(WORKERS_KEY, alive, WORKER_TTL)
+
+    total: dict[str, dict] = {}
+    for views in found.values():
+        for view, s in views.items():
+            agg = total.setdefault(view, _empty())
+            for f in _FIELDS:
+                agg[f] += s[f]
+            agg["buckets"] = [a + b for a, b in zip(agg["buckets"], s["buckets"])]
+    return total
+
+
+# -----------------------------
+# Exposition
+# -----------------------------
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def render_prometheus(views: dict[str, dict]) -> str:
+    lines = []
+
+    def family(name, kind, help_text, rows):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(rows)
+
+    def per_view(name, field):
+        return [f'{name}{{view="{_label(v)}"}} {s[field]}' for v, s in sorted(views.items())]
+
+    family("malitadji_requests_total", "counter", "Requêtes HTTP par vue", per_view("malitadji_requests_total", "requests"))
+    family("malitadji_errors_total", "counter", "Réponses 5xx par vue", per_view("malitadji_errors_total", "errors"))
+
+    rows = []
+    for v, s in sorted(views.items()):
+        cumulative = 0
+        for bound, n in zip([*map(str, BUCKETS), "+Inf"], s["buckets"]):
+            cumulative += n
+            rows.append(f'malitadji_request_duration_seconds_bucket{{view="{_label(v)}",le="{bound}"}} {cumulative}')
+        rows.append(f'malitadji_request_duration_seconds_sum{{view="{_label(v)}"}} {s["duration_sum"]:.6f}')
+        rows.append(f'malitadji_request_duration_seconds_count{{view="{_label(v)}"}} {s["requests"]}')
+    family("malitadji_request_duration_seconds", "histogram", "Durée des requêtes par vue", rows)
+
+    family("malitadji_db_queries_total", "counter", "Requêtes SQL par vue", per_view("malitadji_db_queries_total", "queries"))
+    family("malitadji_db_seconds_total", "counter", "Temps SQL par vue", per_view("malitadji_db_seconds_total", "db_seconds"))
+    family("malitadji_cache_hits_total", "counter", "Hits cache pendant la vue", per_view("malitadji_cache_hits_total", "cache_hits"))
+    family("malitadji_cache_misses_total", "counter", "Misses cache pendant la vue", per_view("malitadji_cache_misses_total", "cache_misses"))
+    family("malitadji_response_bytes_total", "counter", "Octets renvoyés par vue", per_view("malitadji_response_bytes_total", "bytes"))
+    family(
+        "malitadji_query_budget_exceeded_total", "counter", "Dépassements du budget de requêtes SQL",
+        per_view("malitadji_query_budget_exceeded_total", "budget_exceeded"),
+    )
+
+    stats = getattr(cache, "stats", None)
+    if stats is not None:
+        s = stats()
+        family("malitadji_cache_local_entries", "gauge", "Entrées du cache mémoire (processus courant)",
+               [f"malitadji_cache_local_entries {s['local_entries']}"])
+
+    return "\n".join(lines) + "\n"
+
+
+def _authorized(request) -> bool:
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated and user.is_staff:
+        return True
+    token = getattr(settings, "METRICS_TOKEN", "")
+    header = request.headers.get("Authorization", "")
+    return bool(token) and header.startswith("Bearer ") and constant_time_compare(header[7:], token)
+
+
+def metrics_view(request):
+    """
+    GET /metrics/ (format d'exposition texte Prometheus 0.0.4)
+    """
+    if not _authorized(request):
+        return HttpResponse("Forbidden", status=403, content_type="text/plain")
+    return HttpResponse(render_prometheus(collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
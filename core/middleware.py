@@ -0,0 +1,211 @@
+# core/middleware.py
+"""
+Instrumentation des requêtes : temps, requêtes SQL (nombre et durée), hits /
+misses du cache, taille de la réponse, par vue (nom d'URL).
+
+- agrégats exposés sur /metrics/ (core/metrics.py)
+- log structuré "malitadji.requests" : DEBUG pour chaque requête, WARNING si la
+  requête est lente (SLOW_REQUEST_MS) ou dépasse son budget
+- budgets de requêtes SQL par vue (QUERY_BUDGETS) : log, ou exception
+  (QUERY_BUDGET_MODE = "raise", activé explicitement par les tests)
+
+Synchrone et asynchrone : sous ASGI, un middleware seulement synchrone ferait
+passer chaque requête par un thread et annulerait l'intérêt des vues async.
+Les requêtes SQL d'une vue async s'exécutent dans un thread de l'ORM (autre
+connexion) : elles sont comptées par un wrapper posé sur chaque connexion, qui
+alimente le compteur de la requête en cours (ContextVar, copiée dans ces threads).
+
+StaticFilesMiddleware : WhiteNoise, utilisable aussi sans thread sous ASGI.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.backends.signals import connection_created
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metrics
+
+logger = logging.getLogger("malitadji.requests")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+_current_counter: ContextVar[_QueryCounter | None] = ContextVar("malitadji_query_counter", default=None)
+
+
+def _count_queries(execute, sql, params, many, context):
+    counter = _current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter.count += 1
+        counter.seconds += time.perf_counter() - start
+
+
+def _ensure_wrapper(conn) -> None:
+    if _count_queries not in conn.execute_wrappers:
+        conn.execute_wrappers.append(_count_queries)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    _ensure_wrapper(connection)
+
+
+# connexions ouvertes par les threads de l'ORM async (et toutes les suivantes)
+connection_created.connect(_on_connection_created, dispatch_uid="malitadji_query_counter")
+
+
+def _cache_counters() -> tuple[int, int]:
+    stats = getattr(cache, "stats", None)
+    if stats is None:
+        return 0, 0
+    s = stats()
+    return s["local_hits"] + s["shared_hits"], s["misses"]
+
+
+def _view_name(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match else "unresolved"
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        # connexion de ce thread ouverte avant l'import du module
+        _ensure_wrapper(connection)
+        counter = _QueryCounter()
+        token = _current_counter.set(counter)
+        hits0, misses0 = _cache_counters()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_counter.reset(token)
+        return self._finish(request, response, counter, start, hits0, misses0)
+
+    async def __acall__(self, request):
+        counter = _QueryCounter()
+        token = _current_counter.set(counter)
+        hits0, misses0 = _cache_counters()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_counter.reset(token)
+        return self._finish(request, response, counter, start, hits0, misses0)
+
+    def _finish(self, request, response, counter, start, hits0, misses0):
+        seconds = time.perf_counter() - start
+        # compteurs du processus : exacts avec un thread par worker, approchés sinon
+        hits1, misses1 = _cache_counters()
+        size = 0 if response.streaming else len(response.content)
+
+        view = _view_name(request)
+        budget = getattr(settings, "QUERY_BUDGETS", {}).get(view)
+        over_budget = budget is not None and counter.count > budget
+
+        metrics.record(
+            view,
+            status=response.status_code,
+            seconds=seconds,
+            queries=counter.count,
+            db_seconds=counter.seconds,
+            cache_hits=hits1 - hits0,
+            cache_misses=misses1 - misses0,
+            size=size,
+            over_budget=over_budget,
+        )
+
+        fields = {
+            "view": view,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "ms": round(seconds * 1000, 2),
+            "queries": counter.count,
+            "db_ms": round(counter.seconds * 1000, 2),
+            "cache_hits": hits1 - hits0,
+            "cache_misses": misses1 - misses0,
+            "bytes": size,
+        }
+        if over_budget:
+            fields["query_budget"] = budget
+            logger.warning("budget de requêtes dépassé", extra={"fields": fields})
+            if getattr(settings, "QUERY_BUDGET_MODE", "log") == "raise":
+                raise QueryBudgetExceeded(f"{view} : {counter.count} requêtes SQL (budget {budget})")
+        elif seconds * 1000 >= getattr(settings, "SLOW_REQUEST_MS", 1000):
+            logger.warning("requête lente", extra={"fields": fields})
+        else:
+            logger.debug("requête", extra={"fields": fields})
+
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise synchrone et asynchrone : sous ASGI, les requêtes qui ne visent
+    pas un fichier statique (la quasi-totalité) passent sans changer de thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        # autorefresh (DEBUG) lit le disque : pas sur la boucle d'événements
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            response = await sync_to_async(self.serve)(static_file, request)
+            if response.streaming and not response.is_async:
+                # lecture du fichier par blocs hors de la boucle (sinon Django l'avertit et le lit d'un coup)
+                response.streaming_content = _read_async(response.streaming_content)
+            return response
+        return await self.get_response(request)
+
+
+async def _read_async(chunks):
+    iterator = iter(chunks)
+    read = sync_to_async(next, thread_sensitive=False)
+    while (chunk := await read(iterator, None)) is not None:
+        yield chunk
@@ -61,8 +61,9 @@ INSTALLED_APPS = [
 # =========================
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",  # toujours en haut
+    "core.middleware.RequestMetricsMiddleware",  # mesure toute la pile qui suit
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "core.middleware.StaticFilesMiddleware",  # WhiteNoise, sync et async
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -161,7 +162,8 @@ WSGI_APPLICATION = "core.wsgi.application"
 DATABASES = {
     "default": dj_database_url.config(
         default="sqlite:///" + str(BASE_DIR / "db.sqlite3"),
-        conn_max_age=600,
+        # connexions persistantes (WSGI) ; 0 sous ASGI (gunicorn.conf.py)
+        conn_max_age=int(os.environ.get("CONN_MAX_AGE", "600")),
         ssl_require=False,
     )
 }
@@ -191,6 +193,85 @@ STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
+# =========================
+# CACHE
+# =========================
+# "default" : LRU mémoire du processus (TTL court) devant "shared", cache fichier
+# commun aux workers. Les données de référence y sont versionnées et invalidées
+# par signaux (stations/signals.py). Voir core/cache_backends.py.
+CACHES = {
+    "default": {
+        "BACKEND": "core.cache_backends.TieredCache",
+        "LOCATION": "malitadji",
+        "OPTIONS": {
+            "SHARED": "shared",
+            "LOCAL_TTL": float(os.environ.get("CACHE_LOCAL_TTL", "5")),
+            "LOCAL_MAX_ENTRIES": int(os.environ.get("CACHE_LOCAL_MAX_ENTRIES", "2000")),
+        },
+    },
+    "shared": {
+        "BACKEND": "core.cache_backends.FileCache",
+        "LOCATION": os.environ.get("CACHE_DIR", str(BASE_DIR / ".cache")),
+        "TIMEOUT": 3600,
+        "OPTIONS": {"MAX_ENTRIES": 20000, "CULL_INTERVAL": 60},
+    },
+}
+
+# =========================
+# MÉTRIQUES / LOGS
+# =========================
+# /metrics/ : staff connecté ou "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_FLUSH_SECONDS = 10
+SLOW_REQUEST_MS = int(os.environ.get("SLOW_REQUEST_MS", "1000"))
+
+# requêtes SQL max par vue (nom d'URL). "log" par défaut ; les tests qui
+# appellent ces vues passent en "raise" (override_settings, stations/tests.py)
+QUERY_BUDGETS = {
+    "malitadji_admin:index": 6,     # session + user + KPIs StationStatus + listes
+    "stations_geojson": 4,          # session + user + StationStatus + abonnements
+}
+QUERY_BUDGET_MODE = os.environ.get("QUERY_BUDGET_MODE", "log")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "core.metrics.JsonFormatter"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "json"},
+    },
+    "loggers": {
+        "malitadji": {"handlers": ["console"], "level": os.environ.get("LOG_LEVEL", "INFO"), "propagate": False},
+        "notifications": {"handlers": ["console"], "level": os.environ.get("LOG_LEVEL", "INFO"), "propagate": False},
+        "stations": {"handlers": ["console"], "level": os.environ.get("LOG_LEVEL", "INFO"), "propagate": False},
+    },
+}
+
+# =========================
+# FRAÎCHEUR DES STOCKS
+# =========================
+# Au-delà de ce délai sans relevé, un stock est marqué obsolète par
+# `manage.py marquer_stocks_obsoletes` (cron) et affiché "inconnu".
+STOCK_STALE_AFTER_HOURS = {
+    "essence": int(os.environ.get("STOCK_STALE_ESSENCE_HOURS", "48")),
+    "gasoil": int(os.environ.get("STOCK_STALE_GASOIL_HOURS", "48")),
+    "default": 48,
+}
+STOCK_STALE_DOWNGRADE = os.environ.get("STOCK_STALE_DOWNGRADE", "True").lower() == "true"
+
+# =========================
+# DEVICES
+# =========================
+# last_seen_at mis en tampon par processus et écrit par lots (stations/devices.py),
+# au plus tard DEVICE_LAST_SEEN_FLUSH_SECONDS après ; `manage.py desactiver_devices_inactifs`
+# (cron) attend cette durée puis désactive les devices muets depuis
+# DEVICE_INACTIVE_DAYS jours ou aux tokens refusés DEVICE_INVALID_TOKEN_STRIKES fois.
+DEVICE_LAST_SEEN_FLUSH_SECONDS = int(os.environ.get("DEVICE_LAST_SEEN_FLUSH_SECONDS", "60"))
+DEVICE_INACTIVE_DAYS = int(os.environ.get("DEVICE_INACTIVE_DAYS", "90"))
+DEVICE_INVALID_TOKEN_STRIKES = int(os.environ.get("DEVICE_INVALID_TOKEN_STRIKES", "3"))
+
 # =========================
 # DEFAULT PRIMARY KEY
 # =========================
@@ -4,6 +4,7 @@ from django.urls import path, include
 from django.views.generic import TemplateView
 from django.shortcuts import redirect
 
+from core.metrics import metrics_view
 from stations.api_geojson import stations_geojson
 from stations.admin_dashboard import admin_site
 
@@ -26,6 +27,9 @@ urlpatterns = [
     path("api/stations.geojson/", stations_geojson),
     path("api/stations/", lambda r: redirect("/api/stations.geojson", permanent=False)),
 
+    # --- MÉTRIQUES (Prometheus) ---
+    path("metrics/", metrics_view, name="metrics"),
+
     # --- NOTIFICATIONS ---
     path("api/notifications/", include("notifications.urls")),
 
@@ -0,0 +1,53 @@
+# gunicorn.conf.py
+"""
+Configuration gunicorn : gunicorn -c gunicorn.conf.py
+
+Deux modes, choisis par GUNICORN_MODE :
+
+- "asgi" (défaut) : core.asgi:application, workers uvicorn (paquet
+  uvicorn-worker). Les vues async (stations_geojson, API géo, abonnements
+  device, flux SSE) attendent base, cache et client sans bloquer le worker ;
+  les vues sync sont servies dans un pool de threads.
+- "wsgi" : core.wsgi:application, workers sync. Un worker sert une requête à
+  la fois, jusqu'à la fin de l'envoi : un client lent (réseau mobile) l'occupe
+  tout ce temps. Le flux SSE (/api/stations/stream/) y répond 503 (repli sur
+  le rechargement périodique de stations_geojson) : chaque client connecté
+  bloquerait un worker jusqu'au timeout.
+
+Variables : GUNICORN_MODE, PORT, WEB_CONCURRENCY (workers ; défaut 2 x CPU + 1
+en wsgi, CPU en asgi : un worker async n'attend jamais), GUNICORN_TIMEOUT.
+
+Sous ASGI, Django ouvre une connexion par thread de l'ORM : les connexions
+persistantes sont désactivées (CONN_MAX_AGE=0, surchargeable) ; sous
+PostgreSQL, passer par un pooler (pgbouncer) pour ne pas rouvrir une connexion
+par requête.
+
+Sans gunicorn (développement) :
+    python -m uvicorn core.asgi:application --reload
+"""
+import importlib.util
+import multiprocessing
+import os
+
+mode = os.environ.get("GUNICORN_MODE", "asgi").lower()
+cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+
+if mode == "asgi":
+    wsgi_app = "core.asgi:application"
+    # uvicorn-worker : worker maintenu hors d'uvicorn (uvicorn.workers est déprécié)
+    if importlib.util.find_spec("uvicorn_worker") is not None:
+        worker_class = "uvicorn_worker.UvicornWorker"
+    else:
+        worker_class = "uvicorn.workers.UvicornWorker"
+    workers = int(os.environ.get("WEB_CONCURRENCY", cpus))
+    os.environ.setdefault("CONN_MAX_AGE", "0")
+else:
+    wsgi_app = "core.wsgi:application"
+    worker_class = "sync"
+    workers = int(os.environ.get("WEB_CONCURRENCY", 2 * cpus + 1))
@@ -1,8 +1,11 @@
-from firebase_admin import messaging
-from .firebase import init_firebase
+from . import push_client
+
 
 def envoyer_notif_stock(tokens: list[str], title: str, body: str, data: dict | None = None):
-    init_firebase()  # ✅ garantit l’init même si ready() ne tourne pas
+    app = push_client.get_app()
+    if app is None:
+        return {"ok": False, "reason": "firebase_not_configured"}
+    messaging = push_client.messaging()
 
     tokens = [t for t in tokens if t]
     if not tokens:
@@ -16,7 +19,7 @@ def envoyer_notif_stock(tokens: list[str], title: str, body: str, data: dict | N
         data={k: str(v) for k, v in (data or {}).items()},
     )
 
-    resp = messaging.send_each_for_multicast(msg)
+    resp = messaging.send_each_for_multicast(msg, app=app)
 
     failed = []
     for i, r in enumerate(resp.responses):
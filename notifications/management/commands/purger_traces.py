@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from notifications.tracing import RETENTION_DAYS, prune_spans
+
+
+class Command(BaseCommand):
+    help = "Supprime les traces de diffusion (NotificationSpan) plus anciennes que --days jours (cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=RETENTION_DAYS)
+
+    def handle(self, *args, **options):
+        deleted = prune_spans(options["days"])
+        self.stdout.write(self.style.SUCCESS(f"Étapes supprimées : {deleted}"))
@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-19 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_remove_devicetoken_user_devicetoken_device_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationSpan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trace_id', models.CharField(db_index=True, max_length=32)),
+                ('kind', models.CharField(max_length=30)),
+                ('name', models.CharField(max_length=40)),
+                ('started_at', models.DateTimeField(db_index=True)),
+                ('offset_ms', models.FloatField(default=0)),
+                ('duration_ms', models.FloatField()),
+                ('attrs', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['name', 'started_at'], name='notificatio_name_899b5e_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-19 15:56
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_notificationspan'),
+        # tokens fusionnés dans stations.Device avant la suppression
+        ('stations', '0024_device_token_registry'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='DeviceToken',
+        ),
+    ]
@@ -3,19 +3,6 @@ from django.db import models
 from django.utils import timezone
 
 
-class DeviceToken(models.Model):
-    """
-    Token FCM lié à un device (device_id), pas à un user.
-    """
-    device_id = models.CharField(max_length=120, db_index=True)  # ex: UUID / "test-device-001"
-    token = models.CharField(max_length=255, unique=True)
-    platform = models.CharField(max_length=20, default="android")
-    updated_at = models.DateTimeField(auto_now=True)
-
-    def __str__(self):
-        return f"{self.device_id} ({self.platform})"
-
-
 class PushEvent(models.Model):
     """
     Historique d'events push, pour éviter les doublons/spam.
@@ -35,3 +22,26 @@ class PushEvent(models.Model):
 
     def __str__(self):
         return f"{self.kind}:{self.key} station={self.station_id} produit={self.produit} @ {self.created_at:%Y-%m-%d %H:%M}"
+
+
+class NotificationSpan(models.Model):
+    """
+    Étape chronométrée de la diffusion d'un événement de stock (notifications/tracing.py).
+    Une trace = un trace_id (aussi envoyé dans le payload FCM : "event_id") ;
+    l'étape "total" couvre toute la diffusion côté serveur.
+    """
+    trace_id = models.CharField(max_length=32, db_index=True)
+    kind = models.CharField(max_length=30)  # ex: stock_plein
+    name = models.CharField(max_length=40)  # ex: followers, fcm_chunk, total
+    started_at = models.DateTimeField(db_index=True)
+    offset_ms = models.FloatField(default=0)  # début de l'étape depuis le début de la trace
+    duration_ms = models.FloatField()
+    attrs = models.JSONField(default=dict, blank=True)  # ex: {"size": 450, "sent": 448}
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["name", "started_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.trace_id} {self.name} {self.duration_ms:.1f} ms"
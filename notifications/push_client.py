@@ -0,0 +1,94 @@
+# notifications/push_client.py
+"""
+Client Firebase (FCM) unique, initialisé au premier push.
+
+firebase_admin (google-auth, requests, grpc...) n'est importé et les
+identifiants ne sont lus qu'au premier appel de get_app() / messaging() :
+ni les workers gunicorn au démarrage, ni les commandes manage.py qui
+n'envoient rien ne paient ce coût.
+
+Identifiants, dans l'ordre :
+1) fichier settings.FIREBASE_SERVICE_ACCOUNT_FILE (FIREBASE_CREDENTIALS_PATH, Render Secret File)
+2) JSON dans l'env FIREBASE_SERVICE_ACCOUNT_JSON
+Sans identifiants : get_app() retourne None (dev sans push), une seule fois loggé.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_app = None
+_initialized = False
+
+
+def _fix_private_key(data: dict) -> dict:
+    # clé privée collée avec des "\n" littéraux
+    pk = data.get("private_key")
+    if isinstance(pk, str) and "\\n" in pk and "\n" not in pk:
+        data["private_key"] = pk.replace("\\n", "\n")
+    return data
+
+
+def _load_service_account() -> dict | None:
+    path = getattr(settings, "FIREBASE_SERVICE_ACCOUNT_FILE", None)
+    if path and Path(path).exists():
+        try:
+            return _fix_private_key(json.loads(Path(path).read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            logger.exception("fichier de compte de service Firebase illisible", extra={"fields": {"path": str(path)}})
+
+    raw = (os.environ.get("FIREBASE_SERVICE_ACCOUNT_JSON") or "").strip()
+    if raw:
+        try:
+            return _fix_private_key(json.loads(raw))
+        except ValueError:
+            logger.exception("FIREBASE_SERVICE_ACCOUNT_JSON invalide")
+
+    return None
+
+
+def get_app():
+    """
+    App Firebase Admin (initialisée une fois par processus), ou None si non configurée.
+    """
+    global _app, _initialized
+    if _initialized:
+        return _app
+
+    with _lock:
+        if _initialized:
+            return _app
+
+        import firebase_admin
+        from firebase_admin import credentials
+
+        if firebase_admin._apps:
+            _app = firebase_admin.get_app()
+        else:
+            data = _load_service_account()
+            if data is None:
+                logger.warning("Firebase non configuré : les push ne seront pas envoyés")
+            else:
+                try:
+                    _app = firebase_admin.initialize_app(credentials.Certificate(data))
+                    logger.info("Firebase Admin initialisé")
+                except Exception:
+                    logger.exception("Firebase Admin non initialisé")
+        _initialized = True
+        return _app
+
+
+def messaging():
+    """
+    Module firebase_admin.messaging (import différé).
+    """
+    from firebase_admin import messaging as fcm_messaging
+    return fcm_messaging
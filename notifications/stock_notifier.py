@@ -18,9 +18,7 @@ def notifier_devices_station(station_id: int, produit: str | None, title: str, b
     device_ids = follows.values_list("device_id", flat=True)
 
     tokens = list(
-        Device.objects.filter(id__in=device_ids, is_active=True)
-        .exclude(fcm_token__isnull=True)
-        .exclude(fcm_token__exact="")
+        Device.objects.filter(id__in=device_ids, is_active=True, fcm_token_hash__isnull=False)
         .values_list("fcm_token", flat=True)
     )
 
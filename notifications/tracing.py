@@ -0,0 +1,176 @@
+# notifications/tracing.py
+"""
+Traces de diffusion des événements de stock (gérant -> FCM).
+
+    with trace("stock_plein", source="dashboard") as t:
+        with span("followers") as attrs:
+            ...
+            attrs["devices"] = len(device_ids)
+
+- une trace par appel (apply_stock_updates, send_push_to_device_follows) ; les
+  événements de stock d'un même appel ont chacun leur event_id (span "event",
+  payload FCM "event_id"), les autres envois portent l'id de la trace
+- span() hors trace ne fait rien : les fonctions instrumentées restent utilisables seules
+- trace() imbriquée : rejoint la trace en cours
+- les étapes sont écrites en 1 bulk_create à la fin de la trace (table
+  NotificationSpan), sauf si t.discard() (aucun événement à diffuser)
+"""
+from __future__ import annotations
+
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import NotificationSpan
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = 30
+
+
+class Trace:
+    def __init__(self, kind: str, attrs: dict):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.attrs = attrs
+        self.started_at = timezone.now()
+        self.started = time.perf_counter()
+        self.spans: list[NotificationSpan] = []
+        self.keep = True
+
+    def discard(self) -> None:
+        self.keep = False
+
+    def add(self, name: str, start: float, end: float, attrs: dict) -> None:
+        self.spans.append(NotificationSpan(
+            trace_id=self.id,
+            kind=self.kind,
+            name=name,
+            started_at=self.started_at + timedelta(seconds=start - self.started),
+            offset_ms=round((start - self.started) * 1000, 3),
+            duration_ms=round((end - start) * 1000, 3),
+            attrs=attrs,
+        ))
+
+
+_current: ContextVar[Trace | None] = ContextVar("notification_trace", default=None)
+
+
+def current_trace_id() -> str | None:
+    t = _current.get()
+    return t.id if t else None
+
+
+@contextmanager
+def trace(kind: str, **attrs):
+    parent = _current.get()
+    if parent is not None:
+        yield parent
+        return
+
+    t = Trace(kind, attrs)
+    token = _current.set(t)
+    try:
+        yield t
+    finally:
+        _current.reset(token)
+        if t.keep:
+            t.add("total", t.started, time.perf_counter(), t.attrs)
+            try:
+                NotificationSpan.objects.bulk_create(t.spans)
+            except Exception:
+                # la trace ne doit jamais faire échouer une mise à jour de stock
+                logger.exception("traces de notification non enregistrées", extra={"fields": {"trace_id": t.id}})
+
+
+@contextmanager
+def span(name: str, **attrs):
+    t = _current.get()
+    if t is None:
+        yield attrs
+        return
+
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        t.add(name, start, time.perf_counter(), attrs)
+
+
+def prune_spans(days: int = RETENTION_DAYS) -> int:
+    deleted, _ = NotificationSpan.objects.filter(started_at__lt=timezone.now() - timedelta(days=days)).delete()
+    return deleted
+
+
+# -----------------------------
+# Rapport (admin : notifications/latence/)
+# -----------------------------
+
+CHUNK_SIZES = (50, 200, 500)
+
+
+def _percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return round(values[lo] + (values[hi] - values[lo]) * (k - lo), 1)
+
+
+def _summary(durations: list[float]) -> dict:
+    return {
+        "count": len(durations),
+        "p50": _percentile(durations, 50),
+        "p95": _percentile(durations, 95),
+        "max": round(max(durations), 1) if durations else None,
+    }
+
+
+def latency_report(days: int = 7, recent: int = 20) -> dict:
+    """
+    Latence bout en bout (étape "total"), par étape, et des chunks FCM par taille.
+    """
+    since = timezone.now() - timedelta(days=days)
+    rows = NotificationSpan.objects.filter(started_at__gte=since).values_list("name", "duration_ms", "attrs")
+
+    by_stage: dict[str, list[float]] = {}
+    chunks: dict[int, dict[str, list[float]]] = {}
+    for name, duration, attrs in rows.iterator(chunk_size=2000):
+        by_stage.setdefault(name, []).append(duration)
+        if name == "fcm_chunk":
+            size = int((attrs or {}).get("size") or 0)
+            bound = next((b for b in CHUNK_SIZES if size <= b), CHUNK_SIZES[-1])
+            bucket = chunks.setdefault(bound, {"ms": [], "ms_per_token": []})
+            bucket["ms"].append(duration)
+            if size:
+                bucket["ms_per_token"].append(duration / size)
+
+    total = by_stage.pop("total", [])
+    return {
+        "days": days,
+        "total": _summary(total),
+        "stages": sorted(
+            ({"name": name, **_summary(durations)} for name, durations in by_stage.items()),
+            key=lambda s: -(s["p95"] or 0),
+        ),
+        "chunks": [
+            {
+                "max_size": bound,
+                **_summary(chunks[bound]["ms"]),
+                "ms_per_token_p50": _percentile(chunks[bound]["ms_per_token"], 50),
+            }
+            for bound in CHUNK_SIZES if bound in chunks
+        ],
+        "recent": list(
+            NotificationSpan.objects.filter(name="total")
+            .order_by("-started_at")
+            .values("trace_id", "kind", "started_at", "duration_ms", "attrs")[:recent]
+        ),
+    }
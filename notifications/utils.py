@@ -1,14 +1,22 @@
 # notifications/utils.py
 from __future__ import annotations
 
-from typing import Iterable, Any
+import logging
+from typing import TYPE_CHECKING, Any, Iterable
 
 from django.utils import timezone
 
-from firebase_admin import messaging
-
+from stations.devices import prune_tokens
 from stations.models import Device
 
+from . import push_client
+from .tracing import span, trace
+
+if TYPE_CHECKING:
+    from firebase_admin import messaging
+
+logger = logging.getLogger(__name__)
+
 
 def _safe_str(v: Any) -> str:
     # FCM data => dict[str,str] obligatoire
@@ -51,10 +59,15 @@ def _send_multicast(tokens: list[str], notification: messaging.Notification, dat
     invalid = 0
     invalid_tokens: list[str] = []
 
+    app = push_client.get_app()
+    if app is None:
+        return {"sent": 0, "fail": len(tokens), "invalid": 0, "invalid_tokens": [], "error": "firebase non configuré"}
+    messaging = push_client.messaging()
+
     # ✅ méthode moderne
     try:
         msg = messaging.MulticastMessage(notification=notification, data=data, tokens=tokens)
-        resp = messaging.send_each_for_multicast(msg)
+        resp = messaging.send_each_for_multicast(msg, app=app)
 
         sent += int(getattr(resp, "success_count", 0) or 0)
         fail += int(getattr(resp, "failure_count", 0) or 0)
@@ -73,23 +86,23 @@ def _send_multicast(tokens: list[str], notification: messaging.Notification, dat
         return {"sent": sent, "fail": fail, "invalid": invalid, "invalid_tokens": invalid_tokens}
 
     except AttributeError:
-      pass
+        # firebase_admin ancien : pas de send_each_for_multicast
+        pass
     except Exception as e:
-      print("❌ ERREUR FCM multicast :", repr(e))
-    fail += len(tokens)
-    return {
-        "sent": sent,
-        "fail": fail,
-        "invalid": invalid,
-        "invalid_tokens": invalid_tokens,
-        "error": str(e),
-    }
+        logger.exception("FCM multicast en échec", extra={"fields": {"tokens": len(tokens)}})
+        return {
+            "sent": sent,
+            "fail": fail + len(tokens),
+            "invalid": invalid,
+            "invalid_tokens": invalid_tokens,
+            "error": str(e),
+        }
 
     # ✅ fallback: 1 par 1
     for t in tokens:
         msg = messaging.Message(notification=notification, data=data, token=t)
         try:
-            messaging.send(msg)
+            messaging.send(msg, app=app)
             sent += 1
         except Exception as e:
             if _is_invalid_token_error(e):
@@ -97,7 +110,7 @@ def _send_multicast(tokens: list[str], notification: messaging.Notification, dat
                 invalid_tokens.append(t)
             else:
                 fail += 1
-        print("❌ ERREUR FCM token :", t[:20], repr(e))
+                logger.warning("FCM token en échec", extra={"fields": {"token": t[:20], "error": repr(e)}})
 
     return {"sent": sent, "fail": fail, "invalid": invalid, "invalid_tokens": invalid_tokens}
 
@@ -112,15 +125,22 @@ def send_push_to_device_follows(
     device_follows: queryset/iterable de DeviceFollow (avec .device)
     On prend les device_id, puis on récupère tokens depuis stations.Device.fcm_token
     """
-    device_ids: list[str] = []
-    for df in device_follows:
-        dev = getattr(df, "device", None)
-        did = getattr(dev, "device_id", None)
-        if did:
-            device_ids.append(did)
+    with trace("device_follows") as t:
+        with span("followers") as attrs:
+            device_ids: list[str] = []
+            for df in device_follows:
+                dev = getattr(df, "device", None)
+                did = getattr(dev, "device_id", None)
+                if did:
+                    device_ids.append(did)
+
+            device_ids = sorted(set(device_ids))
+            attrs["devices"] = len(device_ids)
 
-    device_ids = sorted(set(device_ids))
-    return send_fcm_to_device_ids(device_ids=device_ids, title=title, body=body, data=data or {})
+        if not device_ids:
+            t.discard()
+        data = {**(data or {}), "event_id": t.id}
+        return send_fcm_to_device_ids(device_ids=device_ids, title=title, body=body, data=data)
 
 
 def send_fcm_to_device_ids(
@@ -136,48 +156,82 @@ def send_fcm_to_device_ids(
     Envoie un push à une liste de device_ids (via stations.Device.fcm_token).
 
     - batch_size: FCM multicast <= 500 tokens; on garde une marge.
-    - cleanup_invalid_tokens: si True, on vide Device.fcm_token pour les tokens invalides détectés.
+    - cleanup_invalid_tokens: si True, les tokens invalides détectés sont retirés du registre.
     """
-    now = timezone.now().isoformat()
+    res = send_fcm_batch(
+        [{"device_ids": device_ids, "title": title, "body": body, "data": data}],
+        cleanup_invalid_tokens=cleanup_invalid_tokens,
+        batch_size=batch_size,
+    )
+    res.pop("messages", None)
+    return {"ok": True, "device_ids": device_ids, **res}
 
-    if not device_ids:
-        return {"ok": True, "device_ids": [], "token_count": 0, "sent": 0, "fail": 0, "invalid": 0, "ts": now}
 
-    qs = (
-        Device.objects.filter(device_id__in=device_ids)
-        .exclude(fcm_token__isnull=True)
-        .exclude(fcm_token__exact="")
-        .values_list("fcm_token", flat=True)
-        .distinct()
-    )
-    tokens = list(qs)
+def send_fcm_batch(
+    messages: list[dict],
+    *,
+    cleanup_invalid_tokens: bool = True,
+    batch_size: int = 450,
+) -> dict:
+    """
+    Envoie plusieurs messages (ex: 1 par station passée à "Plein") en une diffusion:
+    messages = [{"device_ids": [...], "title": "...", "body": "...", "data": {...}}]
+    (device_ids distincts par message)
+
+    - tokens de tous les devices résolus en 1 requête ; un token n'appartient
+      qu'à un device (stations.Device.fcm_token_hash unique) : pas de dédoublonnage
+    - multicast par message, découpé en chunks de batch_size
+    - tokens invalides retirés du registre à la fin (UPDATE par empreinte)
+    """
+    now = timezone.now().isoformat()
 
-    if not tokens:
-        return {"ok": True, "device_ids": device_ids, "token_count": 0, "sent": 0, "fail": 0, "invalid": 0, "ts": now}
+    all_device_ids = {d for m in messages for d in (m.get("device_ids") or [])}
+    empty = {"ok": True, "messages": len(messages), "token_count": 0, "sent": 0, "fail": 0, "invalid": 0, "ts": now}
+    if not all_device_ids:
+        return empty
 
-    safe_data = {str(k): _safe_str(v) for k, v in (data or {}).items()}
-    notif = messaging.Notification(title=title, body=body)
+    with span("token_lookup", devices=len(all_device_ids)) as attrs:
+        token_by_device = dict(
+            Device.objects.filter(device_id__in=all_device_ids, is_active=True, fcm_token_hash__isnull=False)
+            .values_list("device_id", "fcm_token")
+        )
+        attrs["tokens"] = len(token_by_device)
+    if not token_by_device:
+        return empty
 
+    total_tokens = 0
     total_sent = 0
     total_fail = 0
     total_invalid = 0
     all_invalid_tokens: list[str] = []
 
-    for chunk in _chunked(tokens, max(1, int(batch_size))):
-        res = _send_multicast(chunk, notif, safe_data)
-        total_sent += int(res["sent"])
-        total_fail += int(res["fail"])
-        total_invalid += int(res["invalid"])
-        all_invalid_tokens.extend(res["invalid_tokens"])
-
-    # Nettoyage optionnel: invalider ces tokens dans la table Device
+    for index, m in enumerate(messages):
+        tokens = [token_by_device[d] for d in (m.get("device_ids") or []) if d in token_by_device]
+        if not tokens:
+            continue
+        total_tokens += len(tokens)
+
+        safe_data = {str(k): _safe_str(v) for k, v in (m.get("data") or {}).items()}
+        notif = push_client.messaging().Notification(title=m.get("title"), body=m.get("body"))
+
+        for chunk in _chunked(tokens, max(1, int(batch_size))):
+            with span("fcm_chunk", message=index, size=len(chunk)) as attrs:
+                res = _send_multicast(chunk, notif, safe_data)
+                attrs.update(sent=res["sent"], fail=res["fail"], invalid=res["invalid"])
+            total_sent += int(res["sent"])
+            total_fail += int(res["fail"])
+            total_invalid += int(res["invalid"])
+            all_invalid_tokens.extend(res["invalid_tokens"])
+
+    # Nettoyage optionnel: retirer ces tokens du registre
     if cleanup_invalid_tokens and all_invalid_tokens:
-        Device.objects.filter(fcm_token__in=all_invalid_tokens).update(fcm_token="")
+        with span("token_cleanup", tokens=len(all_invalid_tokens)) as attrs:
+            attrs["pruned"] = prune_tokens(all_invalid_tokens)
 
     return {
         "ok": True,
-        "device_ids": device_ids,
-        "token_count": len(tokens),
+        "messages": len(messages),
+        "token_count": total_tokens,
         "sent": total_sent,
         "fail": total_fail,
         "invalid": total_invalid,
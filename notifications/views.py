@@ -1,9 +1,14 @@
 import json
+import logging
+
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 
-from .models import DeviceToken
+from stations.devices import get_device_id, register_token
+from stations.models import Device, fcm_token_hash
+
+logger = logging.getLogger(__name__)
 
 
 @csrf_exempt
@@ -12,24 +17,42 @@ def register_fcm_token(request):
     """
     Enregistre / met à jour un token FCM Android.
     (Sans auth pour l'instant – OK en dev)
+    Registre unique : stations.Device (même chemin que /api/device/register/).
+
+    device_id (corps ou header X-Device-Id) est facultatif : les applications
+    publiées n'envoient que le token. Sans device_id, un token déjà connu est
+    conservé tel quel ; un token inconnu est ignoré (aucun abonnement ne peut le
+    cibler) et la réponse reste 200 avec registered=false.
     """
     try:
         data = json.loads(request.body.decode("utf-8"))
+    except (UnicodeDecodeError, ValueError):
+        return JsonResponse({"ok": False, "error": "invalid json"}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({"ok": False, "error": "invalid json"}, status=400)
 
+    try:
+        device_id = (data.get("device_id") or get_device_id(request) or "").strip()
         token = (data.get("token") or "").strip()
         platform = (data.get("platform") or "android").strip().lower()
 
         if not token:
             return JsonResponse({"ok": False, "error": "missing token"}, status=400)
 
-        obj, created = DeviceToken.objects.update_or_create(
-            token=token,
-            defaults={"platform": platform},
-        )
+        if not device_id:
+            known = Device.objects.filter(fcm_token_hash=fcm_token_hash(token)).exists()
+            if not known:
+                logger.info("token FCM sans device_id ignoré")
+            return JsonResponse({"ok": True, "created": False, "registered": known})
+
+        created = not Device.objects.filter(device_id=device_id).exists()
+        register_token(device_id, token, platform)
 
         return JsonResponse({
             "ok": True,
             "created": created,
+            "registered": True,
         })
-    except Exception as e:
-        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+    except Exception:
+        logger.exception("enregistrement du token FCM en échec")
+        return JsonResponse({"ok": False, "error": "invalid request"}, status=400)
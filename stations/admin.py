@@ -5,6 +5,10 @@ from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 from django.contrib.auth.models import Group
 
 from .admin_dashboard import admin_site  # ✅ ton admin personnalisé
+from .changes import notify_stations_changed
+from .search import bump_search_version
+from .station_refs import invalidate_station_refs
+from .status import refresh_station_status
 from .models import (
     Region, Cercle, Commune,
     Station, Stock,
@@ -79,11 +83,22 @@ class StationAdmin(admin.ModelAdmin):
 
     @admin.action(description="Approuver les stations sélectionnées")
     def approuver_stations(self, request, queryset):
-        queryset.update(is_approved=True)
+        self._set_approval(queryset, True)
 
     @admin.action(description="Mettre les stations sélectionnées en attente")
     def mettre_en_attente(self, request, queryset):
-        queryset.update(is_approved=False)
+        self._set_approval(queryset, False)
+
+    def _set_approval(self, queryset, approved: bool):
+        # ids lus avant l'update : le queryset garde les filtres de la liste
+        # (?is_approved__exact=0) et serait vide une fois les stations modifiées
+        station_ids = list(queryset.values_list("id", flat=True))
+        Station.objects.filter(id__in=station_ids).update(is_approved=approved)
+        # update() ne déclenche pas les signaux
+        invalidate_station_refs(*station_ids)
+        refresh_station_status(station_ids)
+        bump_search_version()
+        notify_stations_changed(station_ids)
 
     @admin.display(description="Cercle")
     def get_cercle(self, obj):
@@ -98,8 +113,8 @@ class StationAdmin(admin.ModelAdmin):
 
 @admin.register(Stock, site=admin_site)
 class StockAdmin(admin.ModelAdmin):
-    list_display = ("station", "produit", "niveau", "date_maj")
-    list_filter = ("produit", "station__commune__cercle__region", "station__commune")
+    list_display = ("station", "produit", "niveau", "date_maj", "is_stale")
+    list_filter = ("produit", "is_stale", "station__commune__cercle__region", "station__commune")
     search_fields = (
         "station__nom",
         "station__commune__nom",
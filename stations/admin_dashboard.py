@@ -1,7 +1,12 @@
 # stations/admin_dashboard.py
 from django.contrib import admin
 from django.db.models import Count
-from .models import Station, Stock
+from django.template.response import TemplateResponse
+from django.urls import path
+
+from notifications.tracing import latency_report
+from .models import StationStatus
+from .status import status_kpis
 
 
 
@@ -17,71 +22,25 @@ class MalitadjiAdminSite(admin.AdminSite):
         IMPORTANT : on appelle super().index(...) pour conserver app_list + log_entries.
         """
 
-        # ---- KPIs ----
-        total_stations = Station.objects.count()
-
-        # Stations avec au moins un stock (ton related_name semble être "stocks" vu ton code)
-        stations_avec_stock = (
-            Station.objects.filter(stocks__isnull=False).distinct().count()
-        )
-
-        # Dernière mise à jour globale
-        last_update = (
-            Stock.objects.order_by("-date_maj")
-            .values_list("date_maj", flat=True)
-            .first()
-        )
-
-        # Helper : convertir niveau texte -> code interne
-        def niveau_to_code(niveau):
-            if not niveau:
-                return ""
-            n = str(niveau).lower()
-            if "rupture" in n or "out" in n:
-                return "rupture"
-            if "faible" in n or "low" in n:
-                return "faible"
-            if "dispo" in n or "disponible" in n or "plein" in n or "full" in n:
-                return "dispo"
-            return ""
-
-        dispo_count = 0
-        faible_count = 0
-        rupture_count = 0
-        inconnu_count = 0
+        # ---- KPIs ---- (1 requête sur la projection StationStatus)
+        kpis = status_kpis()
+        total_stations = kpis["total_stations"]
+        stations_avec_stock = kpis["stations_avec_stock"]
+        last_update = kpis["last_update"]
 
         # Statut global par station (ESSENCE + GASOIL)
-        for s in Station.objects.all():
-            essence_stock = (
-                Stock.objects.filter(station=s, produit__iexact="essence")
-                .order_by("-date_maj")
-                .first()
-            )
-            gasoil_stock = (
-                Stock.objects.filter(station=s, produit__iexact="gasoil")
-                .order_by("-date_maj")
-                .first()
-            )
-
-            essence_statut = niveau_to_code(essence_stock.niveau) if essence_stock else ""
-            gasoil_statut = niveau_to_code(gasoil_stock.niveau) if gasoil_stock else ""
-
-            if "rupture" in (essence_statut, gasoil_statut):
-                rupture_count += 1
-            elif "faible" in (essence_statut, gasoil_statut):
-                faible_count += 1
-            elif "dispo" in (essence_statut, gasoil_statut):
-                dispo_count += 1
-            else:
-                inconnu_count += 1
+        dispo_count = kpis["dispo_count"]
+        faible_count = kpis["faible_count"]
+        rupture_count = kpis["rupture_count"]
+        inconnu_count = kpis["inconnu_count"]
 
         def pct(val):
             return round(val * 100 / total_stations, 1) if total_stations else 0
 
         # Top communes (stations)
         by_commune = (
-            Station.objects.values("commune__nom")
-            .annotate(n=Count("id"))
+            StationStatus.objects.values("commune_nom")
+            .annotate(n=Count("pk"))
             .order_by("-n")[:10]
         )
 
@@ -109,5 +68,29 @@ class MalitadjiAdminSite(admin.AdminSite):
         return super().index(request, extra_context=dashboard_context)
 
 
+    def get_urls(self):
+        urls = [
+            path("notifications/latence/", self.admin_view(self.push_latency_view), name="push_latency"),
+        ]
+        return urls + super().get_urls()
+
+    def push_latency_view(self, request):
+        """
+        /admin/notifications/latence/?days=7
+        Latence des diffusions "Plein" (p50 / p95), par étape et par taille de chunk FCM.
+        """
+        try:
+            days = min(max(int(request.GET.get("days", 7)), 1), 30)
+        except ValueError:
+            days = 7
+
+        context = {
+            **self.each_context(request),
+            "title": "Latence des notifications",
+            "report": latency_report(days=days),
+        }
+        return TemplateResponse(request, "admin/push_latency.html", context)
+
+
 # ✅ Instance unique à importer partout (admin.py et urls.py)
 admin_site = MalitadjiAdminSite(name="malitadji_admin")
@@ -1,45 +1,42 @@
 # stations/api.py
 from __future__ import annotations
 
-from django.utils import timezone
+import json
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 
-from .models import Device, DeviceFollow, Station
-
-
-def _norm_produit(p) -> str | None:
-    if p is None:
-        return None
-
-    s = str(p).strip().lower()
-    if not s:
-        return None
-
-    if "gaso" in s or "diesel" in s:
-        return "gasoil"
-
-    if "ess" in s or "super" in s:
-        return "essence"
-
-    return s
+from .codes import parse_produit
+from .devices import aresolve_device, atouch_device, get_device_id, register_token
+from .follow_counts import ainvalidate_follower_counts
+from .models import DeviceFollow
+from .station_refs import astation_ref
 
 
 def _validate_produit(p: str | None) -> str | None:
     """
-    Autorise: None / essence / gasoil
+    Autorise: None / "" (tous) / essence / gasoil (et variantes : super, diesel...)
     """
-    if p is None:
+    if p is None or not str(p).strip():
         return None
-    p = _norm_produit(p)
-    if p in (None, "essence", "gasoil"):
-        return p
-    return "__invalid__"
+    return parse_produit(p) or "__invalid__"
 
 
-def _get_device_id(request) -> str | None:
-    return request.headers.get("X-DEVICE-ID") or request.META.get("HTTP_X_DEVICE_ID")
+def _body(request) -> dict | None:
+    """
+    Corps JSON ou formulaire (comme request.data de DRF) ; None si JSON invalide.
+    """
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else {}
+    return request.POST
 
 
 @api_view(["POST"])
@@ -58,129 +55,140 @@ def register_device(request):
     if not token:
         return Response({"ok": False, "detail": "fcm_token requis"}, status=400)
 
-    dev, _ = Device.objects.update_or_create(
-        device_id=device_id,
-        defaults={
-            "platform": platform,
-            "fcm_token": token,
-            "is_active": True,
-            "last_seen_at": timezone.now(),
-        },
-    )
+    dev = register_token(device_id, token, platform)
 
     return Response({"ok": True, "device_id": dev.device_id})
 
 
-@api_view(["POST"])
-@permission_classes([AllowAny])
-def follow_station(request, station_id: int):
+# -----------------------------
+# Abonnements device : vues async (ORM et cache asynchrones)
+# Authentification par X-DEVICE-ID, sans session : pas de jeton CSRF.
+# -----------------------------
+
+@csrf_exempt
+@require_POST
+async def follow_station(request, station_id: int):
     """
     POST /api/device/follow/<station_id>/
     Header: X-DEVICE-ID: <uuid>
     Body: {} OR {"produit":"essence"} OR {"produit":"gasoil"} OR {"produit":null}
     """
-    device_id = _get_device_id(request)
-    if not device_id:
-        return Response({"ok": False, "detail": "Header X-DEVICE-ID requis"}, status=400)
+    if not get_device_id(request):
+        return JsonResponse({"ok": False, "detail": "Header X-DEVICE-ID requis"}, status=400)
 
-    station = Station.objects.filter(id=station_id).first()
+    station = await astation_ref(station_id)
     if not station:
-        return Response({"ok": False, "detail": "Station introuvable"}, status=404)
+        return JsonResponse({"ok": False, "detail": "Station introuvable"}, status=404)
 
-    produit = request.data.get("produit", None)
-    produit_norm = _validate_produit(produit)
+    data = _body(request)
+    if data is None:
+        return JsonResponse({"ok": False, "detail": "JSON invalide"}, status=400)
+    produit_norm = _validate_produit(data.get("produit", None))
     if produit_norm == "__invalid__":
-        return Response({"ok": False, "detail": "produit invalide (essence|gasoil|null)"}, status=400)
+        return JsonResponse({"ok": False, "detail": "produit invalide (essence|gasoil|null)"}, status=400)
 
-    dev = Device.objects.filter(device_id=device_id).first()
+    dev = await aresolve_device(request)
     if not dev:
-        return Response({"ok": False, "detail": "Device non enregistré. Appelle /api/device/register/ d'abord."}, status=400)
+        return JsonResponse(
+            {"ok": False, "detail": "Device non enregistré. Appelle /api/device/register/ d'abord."}, status=400,
+        )
 
-    # ping last_seen
-    Device.objects.filter(id=dev.id).update(last_seen_at=timezone.now(), is_active=True)
+    # ping last_seen (coalescé) + réactivation
+    await atouch_device(dev, reactivate=True)
 
-    obj, _ = DeviceFollow.objects.update_or_create(
-        device=dev,
-        station=station,
+    obj, _ = await DeviceFollow.objects.aupdate_or_create(
+        device_id=dev["id"],
+        station_id=station["id"],
         produit=produit_norm,  # None => tous
-        defaults={"is_active": True},
+        defaults={"is_active": True, "deactivated_by_sweep": False},
     )
 
-    return Response({
+    return JsonResponse({
         "ok": True,
         "followed": True,
-        "station_id": station.id,
+        "station_id": station["id"],
         "produit": obj.produit,
     })
 
 
-@api_view(["POST"])
-@permission_classes([AllowAny])
-def unfollow_station(request, station_id: int):
+@csrf_exempt
+@require_POST
+async def unfollow_station(request, station_id: int):
     """
     POST /api/device/unfollow/<station_id>/
     Header: X-DEVICE-ID
     Body: {} OR {"produit":"essence"} OR {"produit":"gasoil"} OR {"produit":null}
     """
-    device_id = _get_device_id(request)
-    if not device_id:
-        return Response({"ok": False, "detail": "Header X-DEVICE-ID requis"}, status=400)
+    if not get_device_id(request):
+        return JsonResponse({"ok": False, "detail": "Header X-DEVICE-ID requis"}, status=400)
 
-    station = Station.objects.filter(id=station_id).first()
+    station = await astation_ref(station_id)
     if not station:
-        return Response({"ok": False, "detail": "Station introuvable"}, status=404)
+        return JsonResponse({"ok": False, "detail": "Station introuvable"}, status=404)
 
-    produit = request.data.get("produit", None)
-    produit_norm = _validate_produit(produit)
+    data = _body(request)
+    if data is None:
+        return JsonResponse({"ok": False, "detail": "JSON invalide"}, status=400)
+    produit_norm = _validate_produit(data.get("produit", None))
     if produit_norm == "__invalid__":
-        return Response({"ok": False, "detail": "produit invalide (essence|gasoil|null)"}, status=400)
+        return JsonResponse({"ok": False, "detail": "produit invalide (essence|gasoil|null)"}, status=400)
 
-    dev = Device.objects.filter(device_id=device_id).first()
+    dev = await aresolve_device(request)
     if not dev:
-        return Response({"ok": False, "detail": "Device non enregistré"}, status=400)
+        return JsonResponse({"ok": False, "detail": "Device non enregistré"}, status=400)
 
-    Device.objects.filter(id=dev.id).update(last_seen_at=timezone.now())
+    await atouch_device(dev)
 
-    updated = DeviceFollow.objects.filter(
-        device=dev, station=station, produit=produit_norm
-    ).update(is_active=False)
+    updated = await DeviceFollow.objects.filter(
+        device_id=dev["id"], station_id=station["id"], produit=produit_norm
+    ).aupdate(is_active=False, deactivated_by_sweep=False)
+    await ainvalidate_follower_counts(station["id"])
 
-    return Response({"ok": True, "unfollowed": True, "count": updated})
+    return JsonResponse({"ok": True, "unfollowed": True, "count": updated})
 
 
-@api_view(["GET"])
-@permission_classes([AllowAny])
-def my_follows(request):
+@require_GET
+async def my_follows(request):
     """
     GET /api/device/follows/
     Header: X-DEVICE-ID
     -> liste les abonnements actifs du device
     """
-    device_id = _get_device_id(request)
-    if not device_id:
-        return Response({"ok": False, "detail": "Header X-DEVICE-ID requis"}, status=400)
+    if not get_device_id(request):
+        return JsonResponse({"ok": False, "detail": "Header X-DEVICE-ID requis"}, status=400)
 
-    dev = Device.objects.filter(device_id=device_id).first()
+    dev = await aresolve_device(request)
     if not dev:
-        return Response({"ok": False, "detail": "Device non enregistré"}, status=400)
+        return JsonResponse({"ok": False, "detail": "Device non enregistré"}, status=400)
 
-    Device.objects.filter(id=dev.id).update(last_seen_at=timezone.now())
+    await atouch_device(dev)
 
-    qs = (
+    # 1 requête : pas de str(commune) qui relirait cercle et région par ligne
+    rows = (
         DeviceFollow.objects
-        .filter(device=dev, is_active=True)
-        .select_related("station", "station__commune")
+        .filter(device_id=dev["id"], is_active=True)
         .order_by("station__nom")
+        .values(
+            "id", "station_id", "produit", "station__nom", "station__commune__nom",
+            "station__commune__cercle__nom", "station__commune__cercle__region__nom",
+        )
     )
 
     items = []
-    for df in qs:
+    async for r in rows:
+        commune = None
+        if r["station__commune__nom"] is not None:
+            # même format que Commune.__str__
+            commune = (
+                f'{r["station__commune__nom"]} '
+                f'({r["station__commune__cercle__nom"]}, {r["station__commune__cercle__region__nom"]})'
+            )
         items.append({
-            "id": df.id,
-            "station_id": df.station_id,
-            "station_nom": df.station.nom,
-            "commune": str(df.station.commune),
-            "produit": df.produit,  # None => tous
+            "id": r["id"],
+            "station_id": r["station_id"],
+            "station_nom": r["station__nom"],
+            "commune": commune,
+            "produit": r["produit"],  # None => tous
         })
 
-    return Response({"ok": True, "device_id": dev.device_id, "count": len(items), "items": items})
+    return JsonResponse({"ok": True, "device_id": dev["device_id"], "count": len(items), "items": items})
@@ -1,54 +1,94 @@
 # stations/api_admin_geo.py
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import redirect
+from django.urls import reverse
 from django.views.decorators.http import require_GET
-from django.db.models import Q
 
-from .models import Region, Cercle, Commune
+from .compression import aprecompressed_response
+from .geo_cache import ageo_bundle, ageo_reference_lists, ahierarchy_version
+from .params import as_int
 
+# Vues async : servies depuis le cache sans occuper de thread sous ASGI
+# (core/asgi.py) ; l'ORM n'est lu qu'au changement de version de la hiérarchie.
 
-def _as_int(v):
-    try:
-        return int(v)
-    except (TypeError, ValueError):
-        return None
+# URL à empreinte : le contenu ne change jamais pour une empreinte donnée
+IMMUTABLE = "public, max-age=31536000, immutable"
 
 
 @require_GET
-def api_regions(request):
+async def api_regions(request):
     """
     Retourne toutes les régions: [{id, nom}]
     """
-    regions = Region.objects.all().values("id", "nom").order_by("nom")
-    return JsonResponse({"results": list(regions)})
+    async def build():
+        return JsonResponse({"results": (await ageo_reference_lists())["regions"]})
+
+    return await aprecompressed_response(request, f"api_regions:{await ahierarchy_version()}", build)
 
 
 @require_GET
-def api_cercles(request):
+async def api_cercles(request):
     """
     Filtrable par region_id: /api/cercles/?region_id=1
     Retourne: [{id, nom, region_id}]
     """
-    region_id = _as_int(request.GET.get("region_id"))
+    region_id = as_int(request.GET.get("region_id"))
 
-    qs = Cercle.objects.all()
-    if region_id:
-        qs = qs.filter(region_id=region_id)
+    async def build():
+        cercles = (await ageo_reference_lists())["cercles"]
+        if region_id:
+            cercles = [c for c in cercles if c["region_id"] == region_id]
+        return JsonResponse({"results": cercles})
 
-    cercles = qs.values("id", "nom", "region_id").order_by("nom")
-    return JsonResponse({"results": list(cercles)})
+    return await aprecompressed_response(request, f"api_cercles:{await ahierarchy_version()}:{region_id or ''}", build)
 
 
 @require_GET
-def api_communes(request):
+async def api_communes(request):
     """
     Filtrable par cercle_id: /api/communes/?cercle_id=10
     Retourne: [{id, nom, cercle_id}]
     """
-    cercle_id = _as_int(request.GET.get("cercle_id"))
+    cercle_id = as_int(request.GET.get("cercle_id"))
+
+    async def build():
+        communes = (await ageo_reference_lists())["communes"]
+        if cercle_id:
+            communes = [c for c in communes if c["cercle_id"] == cercle_id]
+        return JsonResponse({"results": communes})
+
+    return await aprecompressed_response(request, f"api_communes:{await ahierarchy_version()}:{cercle_id or ''}", build)
+
+
+@require_GET
+async def api_geo_latest(request):
+    """
+    GET /api/geo/ -> {"version", "digest", "url"}
+    Les applis comparent digest à celui en cache et ne téléchargent le bundle que s'il a changé.
+    """
+    bundle = await ageo_bundle()
+    resp = JsonResponse({
+        "version": bundle["version"],
+        "digest": bundle["digest"],
+        "url": reverse("api_geo_bundle", args=[bundle["digest"]]),
+    })
+    resp["Cache-Control"] = "public, max-age=60"
+    return resp
+
+
+@require_GET
+async def api_geo_bundle(request, digest: str):
+    """
+    GET /api/geo/<digest>.json -> {"regions": [...], "cercles": [...], "communes": [...]}
+    Empreinte périmée => redirection vers le bundle courant.
+    """
+    bundle = await ageo_bundle()
+    if digest != bundle["digest"]:
+        return redirect("api_geo_bundle", bundle["digest"])
 
-    qs = Commune.objects.all()
-    if cercle_id:
-        qs = qs.filter(cercle_id=cercle_id)
+    async def build():
+        resp = HttpResponse(bundle["body"], content_type="application/json")
+        resp["Cache-Control"] = IMMUTABLE
+        return resp
 
-    communes = qs.values("id", "nom", "cercle_id").order_by("nom")
-    return JsonResponse({"results": list(communes)})
+    return await aprecompressed_response(request, f"geo_bundle:{digest}", build, ttl=None)
@@ -0,0 +1,45 @@
+# stations/api_clusters.py
+from __future__ import annotations
+
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from .api_geojson import _parse_bbox
+from .clustering import MAX_CLUSTER_ZOOM, STATUTS, query_clusters
+
+MALI_BBOX = (-12.3, 10.1, 4.3, 25.0)
+
+
+@require_GET
+def stations_clusters(request):
+    """
+    GET /api/stations/clusters/?bbox=minLon,minLat,maxLon,maxLat&zoom=6&statut=rupture
+    -> FeatureCollection :
+       - clusters : properties {cluster: true, count, dispo, faible, rupture, inconnu}
+       - stations isolées (ou zoom > MAX_CLUSTER_ZOOM) : {cluster: false, id, nom, essence, gasoil, status}
+    statut : seules les stations dont l'essence ou le gasoil a ce statut sont
+    comptées et placées (centroïde), comme pour /api/stations.geojson.
+    """
+    raw_bbox = request.GET.get("bbox")
+    bbox = _parse_bbox(raw_bbox) if raw_bbox else MALI_BBOX
+    if bbox is None:
+        return JsonResponse({"ok": False, "error": "bbox invalide (minLon,minLat,maxLon,maxLat)"}, status=400)
+
+    try:
+        zoom = int(request.GET.get("zoom", "6"))
+    except ValueError:
+        return JsonResponse({"ok": False, "error": "zoom invalide"}, status=400)
+    zoom = max(0, min(zoom, 22))
+
+    statut = (request.GET.get("statut") or "").strip().lower() or None
+    if statut not in (None, *STATUTS):
+        return JsonResponse({"ok": False, "error": "statut invalide (dispo|faible|rupture|inconnu)"}, status=400)
+
+    features = query_clusters(bbox, zoom, statut)
+
+    return JsonResponse({
+        "type": "FeatureCollection",
+        "zoom": zoom,
+        "clustered": zoom <= MAX_CLUSTER_ZOOM,
+        "features": features,
+    })
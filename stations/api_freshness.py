@@ -0,0 +1,44 @@
+# stations/api_freshness.py
+from __future__ import annotations
+
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .freshness import stale_after, stale_stations, stale_stocks_for
+from .params import as_int
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def stale_stations_list(request):
+    """
+    GET /api/stations/stale/?commune=<id>
+    -> stations dont au moins un stock n'a pas été relevé depuis le seuil du produit.
+    Un gérant ne voit que ses stations ; un superuser voit tout.
+    """
+    commune_id = as_int(request.GET.get("commune"))
+    gerant = None if request.user.is_superuser else request.user
+
+    stations = list(stale_stations(gerant=gerant, commune_id=commune_id))
+    stale_by_station = stale_stocks_for(stations)
+
+    items = []
+    for s in stations:
+        items.append({
+            "station_id": s.id,
+            "station_nom": s.nom,
+            "commune_id": s.commune_id,
+            "commune": s.commune.nom if s.commune else None,
+            "gerant": s.gerant.get_username() if s.gerant else None,
+            "stocks": stale_by_station.get(s.id, []),
+        })
+
+    return Response({
+        "ok": True,
+        "count": len(items),
+        "thresholds_hours": {
+            p: stale_after(p).total_seconds() / 3600 for p in ("essence", "gasoil")
+        },
+        "items": items,
+    })
@@ -3,186 +3,194 @@ from __future__ import annotations
 
 from django.http import JsonResponse
 from django.views.decorators.http import require_GET
-from django.db.models import Exists, OuterRef, Max, Q
+from django.db.models import F
 
-from .models import Station, Stock, StationFollow
+from .changes import acurrent_seq
+from .codes import STATUTS, statut_filtre_q
+from .compression import acompressed_response, aprecompressed_response
+from .feed_compact import CompactFeed, compact_response, negotiate_format
+from .geo_cache import ahierarchy_version
+from .models import StationFollow, StationStatus
+from .params import as_int
 
 
-def _map_niveau_to_statut(niveau: str | None) -> str:
+def _parse_bbox(raw: str | None) -> tuple[float, float, float, float] | None:
     """
-    Tes niveaux: Bas, Faible, Plein, Rupture
-    -> on renvoie: dispo, faible, rupture, inconnu
+    "minLon,minLat,maxLon,maxLat" -> tuple, ou None si absent / invalide.
     """
-    if not niveau:
-        return "inconnu"
+    if not raw:
+        return None
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(v) for v in raw.split(","))
+    except ValueError:
+        return None
+    if min_lng > max_lng or min_lat > max_lat:
+        return None
+    return min_lng, min_lat, max_lng, max_lat
 
-    n = str(niveau).strip().lower()
 
-    if n == "rupture":
-        return "rupture"
-    if n in ("faible", "bas"):
-        return "faible"
-    if n == "plein":
-        return "dispo"
-    return "inconnu"
+MAX_LIMIT = 5000
+STATUS_LABELS = dict(StationStatus.STATUTS)
 
 
-def _status_global(essence_statut: str, gasoil_statut: str) -> str:
+def _feed_filters(params) -> dict:
     """
-    Pour la couleur globale (optionnel dans properties["status"]):
-    - si rupture (un des deux) => Rupture
-    - sinon si faible (un des deux) => Faible
-    - sinon si dispo (un des deux) => Disponible
-    - sinon => Inconnu
+    Filtres reconnus du flux, normalisés : ils forment aussi la clé de cache
+    anonyme (un paramètre inconnu ou invalide ne crée pas de nouvelle entrée).
     """
-    e = (essence_statut or "inconnu").lower()
-    g = (gasoil_statut or "inconnu").lower()
-
-    if e == "rupture" or g == "rupture":
-        return "Rupture"
-    if e == "faible" or g == "faible":
-        return "Faible"
-    if e == "dispo" or g == "dispo":
-        return "Disponible"
-    return "Inconnu"
+    statut = (params.get("statut") or "").strip().lower()
+    return {
+        "region": as_int(params.get("region")),
+        "cercle": as_int(params.get("cercle")),
+        "commune": as_int(params.get("commune")),
+        "statut": statut if statut in STATUTS else None,
+    }
 
 
 @require_GET
-def stations_geojson(request):
-    # --- filtres IDs (ceux de ta carte.html) ---
-    region_id = request.GET.get("region")
-    cercle_id = request.GET.get("cercle")
-    commune_id = request.GET.get("commune")
-    statut = request.GET.get("statut")  # dispo/faible/rupture (optionnel)
-
-    qs = (
-    Station.objects
-    .filter(is_approved=True)
-    .select_related("commune__cercle__region")
-    .exclude(Q(latitude__isnull=True) | Q(longitude__isnull=True))
-    .annotate(derniere_maj=Max("stocks__date_maj"))
-)
+async def stations_geojson(request):
+    """
+    GeoJSON par défaut ; encodage compact (colonnes + hiérarchie dictionnaire)
+    si Accept: application/msgpack, Accept: application/vnd.malitadji.packed+json
+    ou ?format=msgpack|packed (voir stations/feed_compact.py).
+
+    Anonyme : réponse mise en cache (gzip/brotli compris) par version des stations
+    et de la hiérarchie. bbox / limit (fenêtres de carte, presque jamais
+    redemandées à l'identique) : compressées sans entrée de cache.
+    Connecté : is_followed dépend de l'utilisateur, pas de cache.
+
+    Vue async (ORM et cache asynchrones) : sous ASGI, un client lent n'occupe
+    pas de worker pendant l'envoi de la réponse.
+    """
+    fmt = negotiate_format(request)
+    user = await request.auser()
+    if user.is_authenticated:
+        return await _stations_feed(request, fmt, user)
+    if request.GET.get("bbox") or request.GET.get("limit"):
+        return await acompressed_response(request, lambda: _stations_feed(request, fmt))
+
+    filters = ":".join(str(v or "") for v in _feed_filters(request.GET).values())
+    key = f"stations_feed:{await acurrent_seq()}:{await ahierarchy_version()}:{fmt}:{filters}"
+    return await aprecompressed_response(request, key, lambda: _stations_feed(request, fmt))
+
+
+async def _stations_feed(request, fmt: str, user=None):
+    # --- filtres IDs (ceux de ta carte.html) + statut dispo/faible/rupture/inconnu (optionnel) ---
+    filters = _feed_filters(request.GET)
+    region_id, cercle_id, commune_id = filters["region"], filters["cercle"], filters["commune"]
+
+    # --- viewport (optionnel) : bbox=minLon,minLat,maxLon,maxLat ---
+    raw_bbox = request.GET.get("bbox")
+    bbox = _parse_bbox(raw_bbox)
+    if raw_bbox and bbox is None:
+        return JsonResponse({"ok": False, "error": "bbox invalide (minLon,minLat,maxLon,maxLat)"}, status=400)
+
+    # --- limit (optionnel) : stations mises à jour le plus récemment d'abord ---
+    limit = None
+    if request.GET.get("limit"):
+        try:
+            limit = max(1, min(int(request.GET["limit"]), MAX_LIMIT))
+        except ValueError:
+            return JsonResponse({"ok": False, "error": "limit invalide"}, status=400)
+
+    # Projection dénormalisée : 1 table, ni jointure ni agrégat (stations/status.py)
+    qs = StationStatus.objects.filter(
+        is_approved=True, latitude__isnull=False, longitude__isnull=False,
+    )
 
     if region_id:
-        qs = qs.filter(commune__cercle__region_id=region_id)
+        qs = qs.filter(region_id=region_id)
     if cercle_id:
-        qs = qs.filter(commune__cercle_id=cercle_id)
+        qs = qs.filter(cercle_id=cercle_id)
     if commune_id:
         qs = qs.filter(commune_id=commune_id)
+    if bbox:
+        min_lng, min_lat, max_lng, max_lat = bbox
+        # index StationStatus(latitude, longitude)
+        qs = qs.filter(latitude__range=(min_lat, max_lat), longitude__range=(min_lng, max_lng))
+
+    # filtre statut optionnel : essence OU gasoil (même règle que les clusters)
+    wanted = filters["statut"]
+    if wanted:
+        qs = qs.filter(statut_filtre_q(wanted))
+
+    truncated = False
+    if limit:
+        qs = qs.order_by(F("derniere_maj").desc(nulls_last=True), "station_id")[: limit + 1]
+    else:
+        qs = qs.order_by("region_nom", "commune_nom", "nom")
+
+    rows = [r async for r in qs]
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        truncated = True
 
     # is_followed: true si l'utilisateur suit la station (peu importe produit)
-    if request.user.is_authenticated:
-        qs = qs.annotate(
-            is_followed=Exists(
-                StationFollow.objects.filter(
-                    user=request.user,
-                    station_id=OuterRef("pk"),
-                    is_active=True,
-                )
-            )
-        )
+    followed: set[int] = set()
+    if user is not None and rows:
+        followed = {
+            sid async for sid in StationFollow.objects.filter(
+                user=user,
+                is_active=True,
+                station_id__in=[r.station_id for r in rows],
+            ).values_list("station_id", flat=True)
+        }
+
+    if fmt != "geojson":
+        compact = CompactFeed()
+        for r in rows:
+            compact.add(r, r.station_id in followed)
+        payload = compact.payload()
     else:
-        qs = qs.annotate(is_followed=Exists(StationFollow.objects.none()))
-
-    # On récupère les stocks actuels (1 par produit)
-    station_ids = list(qs.values_list("id", flat=True))
-
-    stock_by_station: dict[int, dict[str, dict[str, object]]] = {}
-
-    if station_ids:
-        stocks = (
-            Stock.objects
-            .filter(station_id__in=station_ids)
-            .values("station_id", "produit", "niveau", "date_maj")
-        )
-
-        for row in stocks:
-            sid = row["station_id"]
-            prod = row["produit"]  # attendu: "essence" ou "gasoil"
-            niveau = row["niveau"]
-            date_maj = row["date_maj"]
-
-            if sid not in stock_by_station:
-                stock_by_station[sid] = {
-                    "essence": {"statut": "inconnu", "date_maj": None},
-                    "gasoil": {"statut": "inconnu", "date_maj": None},
-                }
-
-            # on ne remplit que si prod est bien "essence" ou "gasoil"
-            if prod in ("essence", "gasoil"):
-                stock_by_station[sid][prod] = {
-                    "statut": _map_niveau_to_statut(niveau),
-                    "date_maj": date_maj,
-                }
-
-    features = []
-
-    wanted = (statut or "").strip().lower()  # dispo/faible/rupture/""
-
-    for s in qs:
-        st = stock_by_station.get(
-            s.id,
-            {
-                "essence": {"statut": "inconnu", "date_maj": None},
-                "gasoil": {"statut": "inconnu", "date_maj": None},
-            },
-        )
-
-        essence_statut = (st.get("essence") or {}).get("statut", "inconnu")
-        gasoil_statut = (st.get("gasoil") or {}).get("statut", "inconnu")
-
-        # filtre statut optionnel (statut = dispo/faible/rupture)
-        if wanted:
-            if wanted == "dispo" and not (essence_statut == "dispo" or gasoil_statut == "dispo"):
-                continue
-            if wanted == "faible" and not (essence_statut == "faible" or gasoil_statut == "faible"):
-                continue
-            if wanted == "rupture" and not (essence_statut == "rupture" or gasoil_statut == "rupture"):
-                continue
-
-        status_pin = _status_global(essence_statut, gasoil_statut)
-
-        # sécurité conversion float
-        try:
-            lng = float(s.longitude)
-            lat = float(s.latitude)
-        except (TypeError, ValueError):
-            continue
-
-        features.append({
-            "type": "Feature",
-            "geometry": {
-                "type": "Point",
-                "coordinates": [lng, lat],
-            },
-            "properties": {
-                "id": s.id,
-                "nom": s.nom,
-                "adresse": s.adresse,
-
-                # Noms
-                "region": s.commune.cercle.region.nom if s.commune and s.commune.cercle and s.commune.cercle.region else None,
-                "cercle": s.commune.cercle.nom if s.commune and s.commune.cercle else None,
-                "commune": s.commune.nom if s.commune else None,
-
-                # IDs (pour filtrage fiable)
-                "region_id": s.commune.cercle.region_id if s.commune and s.commune.cercle else None,
-                "cercle_id": s.commune.cercle_id if s.commune else None,
-                "commune_id": s.commune_id,
-
-                # Stocks normalisés pour ton JS (dispo/faible/rupture/inconnu)
-                "essence": essence_statut,
-                "gasoil": gasoil_statut,
-
-                # Dernière MAJ globale
-                "derniere_maj": s.derniere_maj.isoformat() if getattr(s, "derniere_maj", None) else None,
-
-                # Statut global lisible (optionnel)
-                "status": status_pin,
-
-                # Suivi (popup)
-                "is_followed": bool(getattr(s, "is_followed", False)),
-            },
-        })
-
-    return JsonResponse({"type": "FeatureCollection", "features": features})
+        payload = {
+            "type": "FeatureCollection",
+            "features": [_feature(r, r.station_id in followed) for r in rows],
+        }
+
+    if limit:
+        payload["truncated"] = truncated
+
+    resp = compact_response(payload, fmt) if fmt != "geojson" else JsonResponse(payload)
+    resp["Vary"] = "Accept"
+    return resp
+
+
+def _feature(r: StationStatus, is_followed: bool) -> dict:
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "Point",
+            "coordinates": [r.longitude, r.latitude],
+        },
+        "properties": {
+            "id": r.station_id,
+            "nom": r.nom,
+            "adresse": r.adresse,
+
+            # Noms
+            "region": r.region_nom,
+            "cercle": r.cercle_nom,
+            "commune": r.commune_nom,
+
+            # IDs (pour filtrage fiable)
+            "region_id": r.region_id,
+            "cercle_id": r.cercle_id,
+            "commune_id": r.commune_id,
+
+            # Stocks normalisés pour ton JS (dispo/faible/rupture/inconnu)
+            "essence": r.essence,
+            "gasoil": r.gasoil,
+
+            # Dernière MAJ globale
+            "derniere_maj": r.derniere_maj.isoformat() if r.derniere_maj else None,
+
+            # Au moins un relevé plus vieux que le seuil du produit
+            "stale": r.stale,
+
+            # Statut global lisible (optionnel)
+            "status": STATUS_LABELS[r.status],
+
+            # Suivi (popup)
+            "is_followed": is_followed,
+        },
+    }
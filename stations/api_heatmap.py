@@ -0,0 +1,31 @@
+# stations/api_heatmap.py
+from __future__ import annotations
+
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from .heatmap import WINDOWS, heatmap_payload
+
+
+@require_GET
+def shortages_heatmap(request):
+    """
+    GET /api/shortages/heatmap/?window=24h|7d&zone=commune|geohash&produit=essence&format=grid|geojson
+    Sert les agrégats pré-calculés par `manage.py agreger_ruptures`.
+    """
+    window = (request.GET.get("window") or "24h").strip().lower()
+    zone_type = (request.GET.get("zone") or "commune").strip().lower()
+    produit = (request.GET.get("produit") or "").strip().lower() or None
+    fmt = (request.GET.get("format") or "grid").strip().lower()
+
+    if window not in WINDOWS:
+        return JsonResponse({"ok": False, "error": "window invalide (24h|7d)"}, status=400)
+    if zone_type not in ("commune", "geohash"):
+        return JsonResponse({"ok": False, "error": "zone invalide (commune|geohash)"}, status=400)
+    if produit not in (None, "essence", "gasoil"):
+        return JsonResponse({"ok": False, "error": "produit invalide (essence|gasoil)"}, status=400)
+    if fmt not in ("grid", "geojson"):
+        return JsonResponse({"ok": False, "error": "format invalide (grid|geojson)"}, status=400)
+
+    payload = heatmap_payload(window=window, zone_type=zone_type, produit=produit, fmt=fmt)
+    return JsonResponse(payload)
@@ -0,0 +1,94 @@
+# stations/api_manager.py
+from __future__ import annotations
+
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .codes import NIVEAUX, parse_niveau, parse_produit
+from .models import Station
+from .stock_updates import apply_stock_updates
+
+MAX_UPDATES = 200
+
+
+@api_view(["POST"])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAuthenticated])
+def manager_stock_updates(request):
+    """
+    POST /api/manager/stocks/
+    Header: Authorization: Bearer <access token de /api/token/>
+    Body: {"updates": [{"station_id": 12, "produit": "essence", "niveau": "Plein"}, ...]}
+
+    Toutes les mises à jour sont appliquées dans une seule transaction,
+    ou aucune si une ligne est invalide.
+    """
+    updates = request.data.get("updates") if isinstance(request.data, dict) else None
+    if not isinstance(updates, list) or not updates:
+        return Response({"ok": False, "detail": "updates requis (liste non vide)"}, status=400)
+    if len(updates) > MAX_UPDATES:
+        return Response({"ok": False, "detail": f"maximum {MAX_UPDATES} mises à jour par appel"}, status=400)
+
+    errors = []
+    parsed = []
+    for i, item in enumerate(updates):
+        if not isinstance(item, dict):
+            errors.append({"index": i, "detail": "objet attendu"})
+            continue
+
+        try:
+            station_id = int(item.get("station_id"))
+        except (TypeError, ValueError):
+            errors.append({"index": i, "detail": "station_id invalide"})
+            continue
+
+        produit = parse_produit(item.get("produit"))
+        if produit is None:
+            errors.append({"index": i, "detail": "produit invalide (essence|gasoil)"})
+            continue
+
+        niveau = parse_niveau(item.get("niveau"))
+        if niveau is None:
+            errors.append({"index": i, "detail": f"niveau invalide ({'|'.join(v for v, _ in NIVEAUX)})"})
+            continue
+
+        parsed.append((station_id, produit, niveau))
+
+    if errors:
+        return Response({"ok": False, "errors": errors}, status=400)
+
+    # 1 requête pour toutes les stations (+ hiérarchie pour le texte des notifications)
+    stations_qs = Station.objects.select_related("commune__cercle__region").filter(
+        id__in={station_id for station_id, _, _ in parsed}
+    )
+    if not request.user.is_superuser:
+        stations_qs = stations_qs.filter(gerant=request.user)
+    stations = {s.id: s for s in stations_qs}
+
+    forbidden = sorted({station_id for station_id, _, _ in parsed if station_id not in stations})
+    if forbidden:
+        return Response(
+            {"ok": False, "detail": "Station introuvable ou non gérée par ce compte", "station_ids": forbidden},
+            status=403,
+        )
+
+    result = apply_stock_updates(
+        user=request.user,
+        updates=[(stations[station_id], produit, niveau) for station_id, produit, niveau in parsed],
+    )
+
+    push = result["push"] or {}
+    return Response({
+        "ok": True,
+        "updated": result["updated"],
+        "created": result["created"],
+        "history": result["history"],
+        "notified_events": result["events"],
+        "push": {
+            "sent": push.get("sent", 0),
+            "fail": push.get("fail", 0),
+            "token_count": push.get("token_count", 0),
+        },
+    })
@@ -0,0 +1,26 @@
+# stations/api_search.py
+from __future__ import annotations
+
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from .params import as_int
+from .search import search_stations
+
+
+@require_GET
+def stations_search(request):
+    """
+    GET /api/stations/search/?q=segou&page=1&page_size=20
+    Typeahead public (stations approuvées), insensible aux accents, classé.
+    """
+    q = (request.GET.get("q") or "").strip()
+    if len(q) < 2:
+        return JsonResponse({"count": 0, "page": 1, "page_size": 0, "results": []})
+
+    payload = search_stations(
+        q,
+        page=as_int(request.GET.get("page"), 1),
+        page_size=as_int(request.GET.get("page_size"), 20),
+    )
+    return JsonResponse(payload)
@@ -0,0 +1,35 @@
+# stations/api_tiles.py
+from __future__ import annotations
+
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import condition, require_GET
+
+from .tiles import MAX_ZOOM, station_tile, tile_version
+
+MVT_CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
+
+
+def _valid(z: int, x: int, y: int) -> bool:
+    return z <= MAX_ZOOM and x < (1 << z) and y < (1 << z)
+
+
+def _tile_etag(request, z: int, x: int, y: int) -> str | None:
+    # même version dans tous les workers : If-None-Match -> 304 sans rendu
+    return f"{z}-{x}-{y}-{tile_version(z, x, y)}" if _valid(z, x, y) else None
+
+
+@require_GET
+@condition(etag_func=_tile_etag)
+def station_tiles(request, z: int, x: int, y: int):
+    """
+    GET /tiles/stations/{z}/{x}/{y}.pbf
+    -> couche "stations" : points avec {id, nom, essence, gasoil, status}
+    """
+    if not _valid(z, x, y):
+        return JsonResponse({"ok": False, "error": "tuile invalide"}, status=400)
+
+    data, _ = station_tile(z, x, y)
+
+    resp = HttpResponse(data, content_type=MVT_CONTENT_TYPE)
+    resp["Cache-Control"] = "public, max-age=60"
+    return resp
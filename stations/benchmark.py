@@ -0,0 +1,628 @@
+# stations/benchmark.py
+"""
+Banc de mesure des chemins de lecture publics (manage.py mesurer_performances).
+
+- jeu de données synthétique identifié par le préfixe BENCH_PREFIX (régions,
+  stations, devices) : seed_dataset(n) complète jusqu'à n stations, purge_dataset()
+  le supprime
+- volumes par station : 2 stocks (90 % des stations), N historiques, 1 device
+  pour 5 stations qui suit 3 stations, 1 utilisateur pour 20 stations qui en
+  suit 3 (1 notification interne par suivi), 1 % de stations en attente de validation
+- run_benchmark() appelle chaque endpoint via le client de test Django et mesure,
+  par endpoint : latence à froid (cache vidé) puis percentiles à chaud, requêtes
+  SQL par appel, octets renvoyés et pic mémoire Python (tracemalloc) à froid
+- measure_startup() chronomètre le démarrage d'un worker (django.setup + WSGI +
+  URLconf) et de commandes manage.py dans des processus neufs
+- measure_concurrency() lance gunicorn (gunicorn.conf.py) en mode WSGI puis
+  ASGI sur la même machine, et mesure débit et latences sous N clients HTTP
+  simultanés (httpx), avec en option des clients du flux SSE connectés pendant
+  la mesure (clients lents) ; ASGI ignoré si uvicorn n'est pas installé
+
+Le cache est vidé avant chaque mesure à froid : à lancer sur une base et un
+cache locaux, pas en production.
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .changes import notify_stations_changed
+from .models import (
+    Cercle,
+    Commune,
+    Device,
+    DeviceFollow,
+    InAppNotification,
+    Region,
+    Station,
+    StationFollow,
+    Stock,
+    StockHistory,
+    fcm_token_hash,
+)
+from .search import refresh_search_text
+from .status import refresh_station_status
+
+BENCH_PREFIX = "Bench"
+
+REGIONS = 10
+CERCLES_PER_REGION = 5
+COMMUNES_PER_CERCLE = 8
+
+# villes où se concentrent les stations (lat, lng, poids)
+_CENTRES = [
+    (12.64, -8.00, 0.45),   # Bamako
+    (13.45, -6.26, 0.10),   # Ségou
+    (11.32, -5.67, 0.10),   # Sikasso
+    (14.45, -11.44, 0.08),  # Kayes
+    (14.49, -4.19, 0.08),   # Mopti
+    (16.77, -3.01, 0.05),   # Tombouctou
+    (16.27, -0.04, 0.05),   # Gao
+    (13.30, -9.48, 0.09),   # Kita / axe Dakar
+]
+
+_NIVEAUX = ["Plein", "Plein", "Bas", "Faible", "Rupture"]
+_PRODUITS = ["essence", "gasoil"]
+
+
+def dataset_size() -> int:
+    return Station.objects.filter(nom__startswith=BENCH_PREFIX).count()
+
+
+def _ensure_hierarchy() -> list[int]:
+    communes = list(
+        Commune.objects.filter(nom__startswith=BENCH_PREFIX).order_by("id").values_list("id", flat=True)
+    )
+    if communes:
+        return communes
+
+    for r in range(REGIONS):
+        region = Region.objects.create(nom=f"{BENCH_PREFIX} Région {r}")
+        for c in range(CERCLES_PER_REGION):
+            cercle = Cercle.objects.create(region=region, nom=f"{BENCH_PREFIX} Cercle {r}-{c}")
+            Commune.objects.bulk_create([
+                Commune(cercle=cercle, nom=f"{BENCH_PREFIX} Commune {r}-{c}-{k}")
+                for k in range(COMMUNES_PER_CERCLE)
+            ])
+    return list(
+        Commune.objects.filter(nom__startswith=BENCH_PREFIX).order_by("id").values_list("id", flat=True)
+    )
+
+
+def _random_point(rng: random.Random) -> tuple[float, float]:
+    lat, lng, _ = rng.choices(_CENTRES, weights=[w for *_, w in _CENTRES])[0]
+    return lat + rng.gauss(0, 0.35), lng + rng.gauss(0, 0.35)
+
+
+def seed_dataset(target: int, *, history_per_station: int = 5, batch_size: int = 2000, seed: int = 42, log=None) -> int:
+    """
+    Complète le jeu de données jusqu'à `target` stations (incrémental : 1k puis
+    10k ne recrée pas les 1k premières). Retourne le nombre de stations créées.
+    """
+    existing = dataset_size()
+    if existing >= target:
+        return 0
+
+    rng = random.Random(seed + existing)
+    communes = _ensure_hierarchy()
+    now = timezone.now()
+    created = 0
+
+    for start in range(existing, target, batch_size):
+        stop = min(start + batch_size, target)
+        with transaction.atomic():
+            stations = []
+            for i in range(start, stop):
+                lat, lng = _random_point(rng)
+                stations.append(Station(
+                    nom=f"{BENCH_PREFIX} Station {i}",
+                    adresse=f"Rue {i % 500}",
+                    commune_id=rng.choice(communes),
+                    latitude=lat,
+                    longitude=lng,
+                    is_approved=rng.random() >= 0.01,
+                ))
+            stations = Station.objects.bulk_create(stations)
+            ids = [s.id for s in stations]
+
+            stocks, history = [], []
+            for sid in ids:
+                if rng.random() < 0.9:
+                    for produit in _PRODUITS:
+                        stocks.append(Stock(station_id=sid, produit=produit, niveau=rng.choice(_NIVEAUX)))
+                for _ in range(history_per_station):
+                    history.append(StockHistory(
+                        station_id=sid,
+                        produit=rng.choice(_PRODUITS),
+                        ancien_niveau=rng.choice(_NIVEAUX),
+                        nouveau_niveau=rng.choice(_NIVEAUX),
+                    ))
+            Stock.objects.bulk_create(stocks, batch_size=batch_size)
+            StockHistory.objects.bulk_create(history, batch_size=batch_size)
+
+            # dates étalées sur 30 jours (auto_now / auto_now_add à la création)
+            for h in history:
+                h.date_maj = now - timedelta(minutes=rng.randint(0, 30 * 24 * 60))
+            StockHistory.objects.bulk_update(history, ["date_maj"], batch_size=batch_size)
+
+            # bulk_create n'appelle pas Device.save() : empreinte du token calculée ici
+            devices = Device.objects.bulk_create([
+                Device(
+                    device_id=f"{BENCH_PREFIX.lower()}-{i}",
+                    fcm_token=f"{BENCH_PREFIX.lower()}-tok-{i}",
+                    fcm_token_hash=fcm_token_hash(f"{BENCH_PREFIX.lower()}-tok-{i}"),
+                )
+                for i in range(start // 5, stop // 5)
+            ])
+            DeviceFollow.objects.bulk_create([
+                DeviceFollow(device_id=d.id, station_id=sid, produit=rng.choice([None, "essence", "gasoil"]))
+                for d in devices
+                for sid in rng.sample(ids, min(3, len(ids)))
+            ], batch_size=batch_size, ignore_conflicts=True)
+
+            User = get_user_model()
+            users = User.objects.bulk_create([
+                User(username=f"{BENCH_PREFIX.lower()}-user-{i}", password="!")
+                for i in range(start // 20, stop // 20)
+            ])
+            follows = [
+                (u.id, sid)
+                for u in users
+                for sid in rng.sample(ids, min(3, len(ids)))
+            ]
+            StationFollow.objects.bulk_create([
+                StationFollow(user_id=uid, station_id=sid, produit=rng.choice([None, "essence", "gasoil"]))
+                for uid, sid in follows
+            ], batch_size=batch_size, ignore_conflicts=True)
+            InAppNotification.objects.bulk_create([
+                InAppNotification(
+                    user_id=uid,
+                    station_id=sid,
+                    produit=rng.choice(_PRODUITS),
+                    title="Carburant disponible",
+                    message="Plein",
+                    event_key=f"{BENCH_PREFIX.lower()}-{uid}-{sid}",
+                    created_at=now - timedelta(minutes=rng.randint(0, 30 * 24 * 60)),
+                )
+                for uid, sid in follows
+            ], batch_size=batch_size, ignore_conflicts=True)
+
+            # bulk_create ne déclenche pas les signaux : projections recalculées ici
+            refresh_station_status(ids)
+            refresh_search_text(Q(id__in=ids))
+
+        created += len(ids)
+        if log:
+            log(f"  {stop}/{target} stations")
+
+    notify_stations_changed()
+    return created
+
+
+def purge_dataset(*, batch_size: int = 2000) -> int:
+    """
+    Supprime stations, devices, utilisateurs et hiérarchie du jeu de données (par lots).
+    """
+    deleted = 0
+    qs = Station.objects.filter(nom__startswith=BENCH_PREFIX)
+    while True:
+        ids = list(qs.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            Station.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+
+    Device.objects.filter(device_id__startswith=f"{BENCH_PREFIX.lower()}-").delete()
+    get_user_model().objects.filter(username__startswith=f"{BENCH_PREFIX.lower()}-user-").delete()
+    Region.objects.filter(nom__startswith=BENCH_PREFIX).delete()
+    notify_stations_changed()
+    return deleted
+
+
+# -----------------------------
+# Mesure
+# -----------------------------
+
+def endpoints() -> list[dict]:
+    """
+    Chemins mesurés (lecture publique + API device).
+    """
+    region_id = Region.objects.filter(nom__startswith=BENCH_PREFIX).order_by("id").values_list("id", flat=True).first()
+    cercle_id = Cercle.objects.filter(region_id=region_id).order_by("id").values_list("id", flat=True).first()
+    station_id = Station.objects.filter(nom__startswith=BENCH_PREFIX).order_by("id").values_list("id", flat=True).first()
+    device = {"HTTP_X_DEVICE_ID": f"{BENCH_PREFIX.lower()}-0"}
+
+    return [
+        {"name": "stations_geojson", "path": "/api/stations.geojson"},
+        {"name": "stations_geojson_msgpack", "path": "/api/stations.geojson?format=msgpack"},
+        {"name": "stations_geojson_bbox", "path": "/api/stations.geojson?bbox=-8.2,12.4,-7.8,12.8"},
+        {"name": "stations_geojson_gzip", "path": "/api/stations.geojson", "headers": {"HTTP_ACCEPT_ENCODING": "gzip"}},
+        {"name": "home", "path": "/"},
+        {"name": "carte", "path": "/carte/"},
+        {"name": "api_regions", "path": "/api/regions/"},
+        {"name": "api_cercles", "path": f"/api/cercles/?region_id={region_id}"},
+        {"name": "api_communes", "path": f"/api/communes/?cercle_id={cercle_id}"},
+        {"name": "device_follows", "path": "/api/device/follows/", "headers": device},
+        {"name": "device_follow", "path": f"/api/device/follow/{station_id}/", "method": "post", "headers": device},
+    ]
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def _call(client: Client, ep: dict):
+    method = getattr(client, ep.get("method", "get"))
+    kwargs = dict(ep.get("headers") or {})
+    if ep.get("method") == "post":
+        kwargs["content_type"] = "application/json"
+        return method(ep["path"], {}, **kwargs)
+    return method(ep["path"], **kwargs)
+
+
+def _body_size(response) -> int:
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def measure_endpoint(client: Client, ep: dict, *, iterations: int) -> dict:
+    # à froid : cache vidé, requêtes comptées
+    cache.clear()
+    with CaptureQueriesContext(connection) as ctx:
+        t0 = time.perf_counter()
+        response = _call(client, ep)
+        size = _body_size(response)
+        cold_ms = (time.perf_counter() - t0) * 1000
+    cold_queries = len(ctx.captured_queries)
+
+    # à chaud
+    latencies = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        r = _call(client, ep)
+        _body_size(r)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+
+    with CaptureQueriesContext(connection) as ctx:
+        _body_size(_call(client, ep))
+    warm_queries = len(ctx.captured_queries)
+
+    # pic mémoire à froid (mesure séparée : tracemalloc ralentit l'appel)
+    cache.clear()
+    tracemalloc.start()
+    try:
+        _body_size(_call(client, ep))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "endpoint": ep["name"],
+        "path": ep["path"],
+        "status": response.status_code,
+        "bytes": size,
+        "cold_ms": round(cold_ms, 2),
+        "p50_ms": round(_percentile(latencies, 50), 2),
+        "p95_ms": round(_percentile(latencies, 95), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        "cold_queries": cold_queries,
+        "warm_queries": warm_queries,
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def run_benchmark(*, iterations: int = 50, host: str = "localhost", only: list[str] | None = None) -> list[dict]:
+    client = Client(HTTP_HOST=host)
+    results = []
+    for ep in endpoints():
+        if only and ep["name"] not in only:
+            continue
+        results.append(measure_endpoint(client, ep, iterations=iterations))
+    return results
+
+
+def compare_runs(baseline: dict, current: dict, *, tolerance: float = 0.25, min_delta_ms: float = 2.0) -> list[str]:
+    """
+    Régressions de `current` par rapport à `baseline` (même format JSON) :
+    p95 au-delà de la tolérance (et d'un écart absolu minimal, contre le bruit),
+    requêtes SQL à chaud en hausse, démarrage plus lent ou modules lourds chargés.
+    """
+    def index(run):
+        return {
+            (size["stations"], r["endpoint"]): r
+            for size in run.get("datasets", [])
+            for r in size["results"]
+        }
+
+    before = index(baseline)
+    regressions = []
+    for key, r in sorted(index(current).items()):
+        old = before.get(key)
+        if old is None:
+            continue
+        stations, name = key
+        if r["p95_ms"] > old["p95_ms"] * (1 + tolerance) and r["p95_ms"] - old["p95_ms"] >= min_delta_ms:
+            regressions.append(f"{name} @{stations}: p95 {old['p95_ms']} -> {r['p95_ms']} ms")
+        if r["warm_queries"] > old["warm_queries"]:
+            regressions.append(f"{name} @{stations}: requêtes {old['warm_queries']} -> {r['warm_queries']}")
+        if r["bytes"] > old["bytes"] * (1 + tolerance):
+            regressions.append(f"{name} @{stations}: octets {old['bytes']} -> {r['bytes']}")
+
+    # démarrage : bruit plus élevé (processus neufs), écart minimal de 50 ms
+    before_startup = {r["name"]: r for r in baseline.get("startup", [])}
+    for r in current.get("startup", []):
+        old = before_startup.get(r["name"])
+        if old is None:
+            continue
+        if r["median_ms"] > old["median_ms"] * (1 + tolerance) and r["median_ms"] - old["median_ms"] >= 50:
+            regressions.append(f"démarrage {r['name']}: {old['median_ms']} -> {r['median_ms']} ms")
+        added = set(r["heavy_modules"]) - set(old["heavy_modules"])
+        if added:
+            regressions.append(f"démarrage {r['name']}: modules lourds chargés {sorted(added)}")
+    return regressions
+
+
+# -----------------------------
+# Démarrage
+# -----------------------------
+
+# modules lourds qui ne doivent pas être chargés au démarrage d'un worker
+HEAVY_MODULES = ("firebase_admin", "google.auth", "google.cloud", "grpc")
+
+_WORKER_BOOT = """
+import json, os, sys, time
+t0 = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+from core.wsgi import application
+import core.urls
+print(json.dumps({
+    "ms": (time.perf_counter() - t0) * 1000,
+    "heavy": [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def _startup_commands() -> dict[str, list[str]]:
+    manage = str(settings.BASE_DIR / "manage.py")
+    return {
+        "worker_boot": [sys.executable, "-c", _WORKER_BOOT],
+        "manage_check": [sys.executable, manage, "check"],
+        "manage_import_decoupage_help": [sys.executable, manage, "import_decoupage_mali", "--help"],
+    }
+
+
+def measure_startup(*, runs: int = 5) -> list[dict]:
+    """
+    Temps de démarrage (processus neufs, médiane / min sur `runs` lancements).
+    """
+    results = []
+    for name, cmd in _startup_commands().items():
+        timings = []
+        heavy: list[str] = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            proc = subprocess.run(
+                cmd, cwd=settings.BASE_DIR, capture_output=True, text=True, env=os.environ.copy(), check=True,
+            )
+            elapsed = (time.perf_counter() - t0) * 1000
+            if name == "worker_boot":
+                out = json.loads(proc.stdout.strip().splitlines()[-1])
+                heavy = out["heavy"]
+            timings.append(elapsed)
+        results.append({
+            "name": name,
+            "median_ms": round(statistics.median(timings), 1),
+            "min_ms": round(min(timings), 1),
+            "heavy_modules": heavy,
+        })
+    return results
+
+
+# -----------------------------
+# Concurrence (serveur réel)
+# -----------------------------
+
+# lectures publiques servies en async (stations/api_geojson.py, api_admin_geo.py, api.py)
+CONCURRENCY_ENDPOINTS = ("stations_geojson", "api_regions", "api_cercles", "device_follows")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, proc: subprocess.Popen, host: str, *, timeout: float = 30.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn arrêté au démarrage (code {proc.returncode})")
+        try:
+            httpx.get(url, headers={"Host": host}, timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn ne répond pas")
+
+
+async def _hold_stream(client, path: str) -> None:
+    """
+    Client du flux SSE : reste connecté, se reconnecte comme EventSource.
+    """
+    import httpx
+
+    while True:
+        try:
+            async with client.stream("GET", path) as r:
+                async for _ in r.aiter_bytes():
+                    pass
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(1)
+
+
+async def _drive(
+    base_url: str,
+    targets: list[dict],
+    *,
+    host: str,
+    concurrency: int,
+    total: int,
+    streams: int = 0,
+    max_seconds: float = 60.0,
+) -> dict:
+    import httpx
+
+    latencies: list[float] = []
+    errors = 0
+    next_index = 0
+    deadline = time.monotonic() + max_seconds
+
+    async def client_loop(client):
+        nonlocal errors, next_index
+        while next_index < total and time.monotonic() < deadline:
+            ep = targets[next_index % len(targets)]
+            next_index += 1
+            t0 = time.perf_counter()
+            try:
+                r = await client.get(ep["path"], headers=ep["headers"])
+                await r.aread()
+                if r.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with (
+        httpx.AsyncClient(
+            base_url=base_url, headers={"Host": host, "Accept-Encoding": "gzip"}, limits=limits, timeout=10.0,
+        ) as client,
+        httpx.AsyncClient(
+            base_url=base_url, headers={"Host": host}, limits=httpx.Limits(max_connections=streams or 1),
+            timeout=httpx.Timeout(10.0, read=None),
+        ) as stream_client,
+    ):
+        holders = [asyncio.create_task(_hold_stream(stream_client, "/api/stations/stream/")) for _ in range(streams)]
+        if holders:
+            # flux établis (ou en attente d'un worker) avant la mesure
+            await asyncio.sleep(1)
+        t0 = time.perf_counter()
+        try:
+            await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        finally:
+            elapsed = time.perf_counter() - t0
+            for task in holders:
+                task.cancel()
+            await asyncio.gather(*holders, return_exceptions=True)
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        # réponses réussies par seconde
+        "rps": round((len(latencies) - errors) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 50), 1),
+        "p95_ms": round(_percentile(latencies, 95), 1),
+        "p99_ms": round(_percentile(latencies, 99), 1),
+        "max_ms": round(latencies[-1], 1) if latencies else 0.0,
+    }
+
+
+def measure_concurrency(
+    *,
+    concurrency: int = 200,
+    requests: int = 2000,
+    workers: int = 2,
+    streams: int = 0,
+    max_seconds: float = 60.0,
+    modes: tuple[str, ...] = ("wsgi", "asgi"),
+    host: str = "localhost",
+) -> list[dict]:
+    """
+    Débit et latences de gunicorn en WSGI (workers sync) puis ASGI (workers
+    uvicorn), même nombre de workers, mêmes endpoints, même base et cache
+    (DATABASE_URL / CACHE_DIR hérités). Le serveur est chauffé avant la mesure.
+
+    streams : clients du flux SSE connectés pendant la mesure. En WSGI le flux
+    répond 503 et ces clients se reconnectent chaque seconde (EventSource) ;
+    requêtes limitées à 10 s, mesure à max_seconds.
+    """
+    http_headers = {
+        ep["name"]: {k[5:].replace("_", "-").title(): v for k, v in (ep.get("headers") or {}).items()}
+        for ep in endpoints()
+    }
+    targets = [
+        {"path": ep["path"], "headers": http_headers[ep["name"]]}
+        for ep in endpoints()
+        if ep["name"] in CONCURRENCY_ENDPOINTS
+    ]
+
+    results = []
+    for mode in modes:
+        if mode == "asgi" and importlib.util.find_spec("uvicorn") is None:
+            results.append({"mode": mode, "skipped": "uvicorn non installé"})
+            continue
+
+        port = _free_port()
+        env = dict(
+            os.environ,
+            GUNICORN_MODE=mode,
+            WEB_CONCURRENCY=str(workers),
+            PORT=str(port),
+            LOG_LEVEL="WARNING",
+        )
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", str(settings.BASE_DIR / "gunicorn.conf.py"),
+             "--bind", f"127.0.0.1:{port}", "--access-logfile", "/dev/null"],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            _wait_ready(base_url + targets[0]["path"], proc, host)
+            # chauffe : caches de chaque worker remplis, connexions ouvertes
+            asyncio.run(_drive(base_url, targets, host=host, concurrency=workers * 2, total=len(targets) * workers * 4))
+            r = asyncio.run(_drive(
+                base_url, targets, host=host, concurrency=concurrency, total=requests,
+                streams=streams, max_seconds=max_seconds,
+            ))
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        results.append({"mode": mode, "workers": workers, "concurrency": concurrency, "streams": streams, **r})
+    return results
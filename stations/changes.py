@@ -0,0 +1,103 @@
+# stations/changes.py
+"""
+Journal des stations modifiées (stock, position, approbation...).
+
+Chaque écriture publie un numéro de séquence et la liste des stations touchées
+dans le cache. Les structures précalculées d'un processus (grille de clusters,
+tuiles...) retiennent le dernier numéro vu et ne rechargent que ces stations ;
+si une entrée a expiré, elles se reconstruisent entièrement.
+
+add_listener() : appelé dans le processus qui publie, juste après la
+publication (flux SSE, stations/live.py : réveil immédiat au lieu d'attendre
+son prochain relevé du journal).
+"""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Callable, Iterable
+
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+SEQ_KEY = "stations:changes:seq"
+LOG_TTL = 3600
+
+_listeners: list[Callable[[int], None]] = []
+
+
+def add_listener(fn: Callable[[int], None]) -> None:
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def _entry_key(seq: int) -> str:
+    return f"stations:changes:{seq}"
+
+
+def current_seq() -> int:
+    seq = cache.get(SEQ_KEY)
+    if seq is None:
+        # départ horodaté : après un vidage du cache la séquence reste croissante
+        cache.add(SEQ_KEY, time.time_ns(), None)
+        seq = cache.get(SEQ_KEY, 0)
+    return int(seq)
+
+
+async def acurrent_seq() -> int:
+    seq = await cache.aget(SEQ_KEY)
+    if seq is None:
+        await cache.aadd(SEQ_KEY, time.time_ns(), None)
+        seq = await cache.aget(SEQ_KEY, 0)
+    return int(seq)
+
+
+def _publish(station_ids: list[int] | None) -> int:
+    current_seq()
+    try:
+        seq = cache.incr(SEQ_KEY)
+    except ValueError:
+        seq = time.time_ns()
+        cache.set(SEQ_KEY, seq, None)
+    cache.set(_entry_key(seq), station_ids, LOG_TTL)
+    for fn in _listeners:
+        try:
+            fn(seq)
+        except Exception:
+            logger.exception("écouteur du journal des stations en échec")
+    return seq
+
+
+def notify_stations_changed(station_ids: Iterable[int] | None = None) -> None:
+    """
+    station_ids=None => "tout a pu changer" (balayage, import...).
+    Publié après le commit de la transaction courante.
+    """
+    ids = None if station_ids is None else sorted({int(i) for i in station_ids if i})
+    if ids == []:
+        return
+    transaction.on_commit(lambda: _publish(ids))
+
+
+def changes_since(seq: int) -> tuple[int, set[int] | None]:
+    """
+    Retourne (séquence courante, stations modifiées depuis seq).
+    None => reconstruction complète nécessaire (journal expiré, changement global).
+    """
+    cur = current_seq()
+    if cur == seq:
+        return cur, set()
+    if cur < seq or cur - seq > 1000:
+        return cur, None
+
+    keys = [_entry_key(s) for s in range(seq + 1, cur + 1)]
+    entries = cache.get_many(keys)
+
+    changed: set[int] = set()
+    for key in keys:
+        if key not in entries or entries[key] is None:
+            return cur, None
+        changed.update(entries[key])
+    return cur, changed
@@ -0,0 +1,229 @@
+# stations/clustering.py
+"""
+Clusters de stations pour la carte (Leaflet).
+
+Grille hiérarchique en mémoire (par processus) : à chaque zoom z, une cellule
+correspond à 1/4 de tuile web-mercator (~64 px). Chaque cellule garde, pour
+l'ensemble des stations, par statut global (répartition des clusters) puis par
+statut filtré, le nombre de stations et la somme des coordonnées (centroïde) :
+un filtre ?statut= compte et place les clusters sur les seules stations qu'il
+retient, selon la règle du flux GeoJSON (codes.statuts_filtre). La grille est
+construite une fois puis mise à jour station par station à partir du journal
+stations/changes.py : une station modifiée est retirée puis réinsérée à chaque
+niveau, sans relire les autres.
+"""
+from __future__ import annotations
+
+import math
+import threading
+
+from .changes import changes_since, current_seq
+from .codes import STATUTS, statuts_filtre
+from .models import StationStatus
+
+# Au-delà, l'endpoint renvoie les stations individuelles
+MAX_CLUSTER_ZOOM = 14
+# cellule = tuile / 2**CELL_SHIFT
+CELL_SHIFT = 2
+
+# une cellule = un groupe de compteurs pour toutes les stations (None), un par
+# statut global ("status", s), puis un par valeur du filtre ?statut= ("statut", s)
+_N, _SUM_LAT, _SUM_LNG, _SUM_ID = 0, 1, 2, 3
+_GROUP_SIZE = 4
+_GROUPS = (None, *(("status", s) for s in STATUTS), *(("statut", s) for s in STATUTS))
+_OFFSET = {g: _GROUP_SIZE * i for i, g in enumerate(_GROUPS)}
+
+
+def _cell(lat: float, lng: float, level: int) -> tuple[int, int]:
+    """
+    Coordonnées de tuile web-mercator au niveau donné.
+    """
+    n = 1 << level
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = int((lng + 180.0) / 360.0 * n)
+    rad = math.radians(lat)
+    y = int((1.0 - math.log(math.tan(rad) + 1.0 / math.cos(rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def _load_stations(station_ids: set[int] | None = None) -> dict[int, dict]:
+    """
+    Stations visibles (approuvées, avec coordonnées) et leur statut (StationStatus).
+    """
+    qs = StationStatus.objects.filter(is_approved=True, latitude__isnull=False, longitude__isnull=False)
+    if station_ids is not None:
+        qs = qs.filter(station_id__in=station_ids)
+
+    return {
+        sid: {
+            "id": sid,
+            "nom": nom,
+            "lat": float(lat),
+            "lng": float(lng),
+            "essence": essence,
+            "gasoil": gasoil,
+            "status": status,
+        }
+        for sid, nom, lat, lng, essence, gasoil, status in qs.values_list(
+            "station_id", "nom", "latitude", "longitude", "essence", "gasoil", "status",
+        )
+    }
+
+
+class ClusterGrid:
+    def __init__(self, seq: int):
+        self.seq = seq
+        self.stations: dict[int, dict] = {}
+        # levels[z][(cx, cy)] = [n, sum_lat, sum_lng, sum_id] * len(_GROUPS)
+        self.levels: list[dict[tuple[int, int], list]] = [dict() for _ in range(MAX_CLUSTER_ZOOM + 1)]
+
+        for st in _load_stations().values():
+            self._add(st)
+
+    def _apply(self, st: dict, sign: int) -> None:
+        finest = MAX_CLUSTER_ZOOM + CELL_SHIFT
+        fx, fy = _cell(st["lat"], st["lng"], finest)
+        groups = (
+            _OFFSET[None],
+            _OFFSET[("status", st["status"])],
+            *(_OFFSET[("statut", s)] for s in statuts_filtre(st["essence"], st["gasoil"])),
+        )
+
+        for z in range(MAX_CLUSTER_ZOOM + 1):
+            shift = MAX_CLUSTER_ZOOM - z
+            key = (fx >> shift, fy >> shift)
+            cells = self.levels[z]
+            c = cells.get(key)
+            if c is None:
+                c = cells[key] = [0, 0.0, 0.0, 0] * len(_OFFSET)
+            for off in groups:
+                c[off + _N] += sign
+                if c[off + _N] <= 0:
+                    # groupe vide : pas de résidu flottant dans les sommes
+                    c[off:off + _GROUP_SIZE] = [0, 0.0, 0.0, 0]
+                    continue
+                c[off + _SUM_LAT] += sign * st["lat"]
+                c[off + _SUM_LNG] += sign * st["lng"]
+                # quand n == 1, sum_id est l'id de l'unique station
+                c[off + _SUM_ID] += sign * st["id"]
+            if c[_N] <= 0:
+                del cells[key]
+
+    def _add(self, st: dict) -> None:
+        self.stations[st["id"]] = st
+        self._apply(st, +1)
+
+    def _remove(self, station_id: int) -> None:
+        st = self.stations.pop(station_id, None)
+        if st is not None:
+            self._apply(st, -1)
+
+    def update(self, seq: int, station_ids: set[int]) -> None:
+        fresh = _load_stations(station_ids)
+        for sid in station_ids:
+            self._remove(sid)
+            if sid in fresh:
+                self._add(fresh[sid])
+        self.seq = seq
+
+    def query(self, bbox: tuple[float, float, float, float], zoom: int, statut: str | None = None) -> list[dict]:
+        min_lng, min_lat, max_lng, max_lat = bbox
+
+        if zoom > MAX_CLUSTER_ZOOM:
+            return [
+                _station_feature(st) for st in self.stations.values()
+                if min_lat <= st["lat"] <= max_lat and min_lng <= st["lng"] <= max_lng
+                and (not statut or statut in statuts_filtre(st["essence"], st["gasoil"]))
+            ]
+
+        level = zoom + CELL_SHIFT
+        x0, y0 = _cell(max_lat, min_lng, level)
+        x1, y1 = _cell(min_lat, max_lng, level)
+        cells = self.levels[zoom]
+
+        if (x1 - x0 + 1) * (y1 - y0 + 1) < len(cells):
+            keys = ((x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+            items = ((k, cells[k]) for k in keys if k in cells)
+        else:
+            items = ((k, c) for k, c in cells.items() if x0 <= k[0] <= x1 and y0 <= k[1] <= y1)
+
+        off = _OFFSET[("statut", statut) if statut else None]
+
+        features = []
+        for _, c in items:
+            n = c[off + _N]
+            if not n:
+                continue
+            if n == 1:
+                features.append(_station_feature(self.stations[c[off + _SUM_ID]]))
+                continue
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [c[off + _SUM_LNG] / n, c[off + _SUM_LAT] / n]},
+                "properties": {
+                    "cluster": True,
+                    "count": n,
+                    # répartition par statut global ; filtrée : les n stations retenues
+                    **{
+                        s: (n if s == statut else 0) if statut else c[_OFFSET[("status", s)] + _N]
+                        for s in STATUTS
+                    },
+                },
+            })
+        return features
+
+
+def _station_feature(st: dict) -> dict:
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [st["lng"], st["lat"]]},
+        "properties": {
+            "cluster": False,
+            "id": st["id"],
+            "nom": st["nom"],
+            "essence": st["essence"],
+            "gasoil": st["gasoil"],
+            "status": st["status"],
+        },
+    }
+
+
+_grid: ClusterGrid | None = None
+_grid_lock = threading.Lock()
+
+
+def _caught_up_grid() -> ClusterGrid:
+    """
+    Grille du processus, rattrapée sur le journal des changements (appelant : _grid_lock tenu).
+    """
+    global _grid
+    if _grid is None:
+        _grid = ClusterGrid(current_seq())
+        return _grid
+
+    seq, changed = changes_since(_grid.seq)
+    if changed is None:
+        _grid = ClusterGrid(seq)
+    elif changed:
+        _grid.update(seq, changed)
+    else:
+        _grid.seq = seq
+    return _grid
+
+
+def get_grid() -> ClusterGrid:
+    """
+    Grille du processus, rattrapée. update() la modifie sur place : ne la lire
+    que sous _grid_lock (voir query_clusters).
+    """
+    with _grid_lock:
+        return _caught_up_grid()
+
+
+def query_clusters(bbox: tuple[float, float, float, float], zoom: int, statut: str | None = None) -> list[dict]:
+    """
+    ClusterGrid.query sous le verrou : les vues sync tournent dans des threads
+    (ASGI), une mise à jour concurrente ne doit pas changer les dicts parcourus.
+    """
+    with _grid_lock:
+        return _caught_up_grid().query(bbox, zoom, statut)
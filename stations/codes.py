@@ -0,0 +1,161 @@
+# stations/codes.py
+"""
+Produits et niveaux de stock : petits entiers en base, valeurs canoniques en Python.
+
+- parse_produit / parse_niveau : toute saisie (API, formulaires, imports,
+  anciennes lignes) -> valeur canonique ("essence", "Plein"...), None si
+  inconnue ; seul endroit où ces chaînes sont normalisées
+- niveau_statut : niveau -> statut carte (dispo / faible / rupture / inconnu)
+- statut_global : statuts essence + gasoil -> statut global de la station
+- statuts_filtre / statut_filtre_q : règle du filtre ?statut= (flux GeoJSON,
+  clusters), en Python et en SQL
+- ProduitField / NiveauField : colonnes smallint ; les instances et values()
+  exposent la valeur canonique, les filtres (produit="Gasoil") deviennent des
+  égalités entières servies par les index
+
+Les codes sont stockés : ne jamais renuméroter, seulement en ajouter.
+"""
+from __future__ import annotations
+
+from typing import Callable
+
+from django.core.exceptions import ValidationError
+from django.db import models
+
+ESSENCE = "essence"
+GASOIL = "gasoil"
+
+PLEIN = "Plein"
+BAS = "Bas"
+FAIBLE = "Faible"
+RUPTURE = "Rupture"
+
+PRODUIT_CODES = {ESSENCE: 1, GASOIL: 2}
+NIVEAU_CODES = {PLEIN: 1, BAS: 2, FAIBLE: 3, RUPTURE: 4}
+_PRODUIT_LABELS = {code: value for value, code in PRODUIT_CODES.items()}
+_NIVEAU_LABELS = {code: value for value, code in NIVEAU_CODES.items()}
+
+PRODUITS = [(ESSENCE, "Essence"), (GASOIL, "Gasoil")]
+NIVEAUX = [(BAS, "Bas"), (FAIBLE, "Faible"), (PLEIN, "Plein"), (RUPTURE, "Rupture")]
+
+_NIVEAU_ALIASES = {
+    "plein": PLEIN, "dispo": PLEIN, "disponible": PLEIN, "full": PLEIN,
+    "bas": BAS, "moyen": BAS,
+    "faible": FAIBLE, "low": FAIBLE,
+    "rupture": RUPTURE, "out": RUPTURE,
+}
+
+# statuts carte d'un produit / d'une station
+STATUTS = ("dispo", "faible", "rupture", "inconnu")
+
+_STATUTS = {PLEIN: "dispo", BAS: "faible", FAIBLE: "faible", RUPTURE: "rupture"}
+
+
+def parse_produit(value) -> str | None:
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return _PRODUIT_LABELS.get(value)
+    if value in PRODUIT_CODES:
+        return value
+
+    s = str(value).strip().lower()
+    if "gaso" in s or "diesel" in s:
+        return GASOIL
+    if "ess" in s or "super" in s:
+        return ESSENCE
+    return None
+
+
+def parse_niveau(value) -> str | None:
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return _NIVEAU_LABELS.get(value)
+    if value in NIVEAU_CODES:
+        return value
+    return _NIVEAU_ALIASES.get(str(value).strip().lower())
+
+
+def niveau_statut(niveau) -> str:
+    """
+    Plein -> dispo ; Bas, Faible -> faible ; Rupture -> rupture ; sinon inconnu.
+    """
+    return _STATUTS.get(parse_niveau(niveau), "inconnu")
+
+
+def statut_global(essence: str, gasoil: str) -> str:
+    """
+    Statut global (couleur de la carte) : rupture si l'un des deux est en
+    rupture, sinon faible, sinon dispo, sinon inconnu.
+    """
+    statuts = {(essence or "inconnu").lower(), (gasoil or "inconnu").lower()}
+    for statut in ("rupture", "faible", "dispo"):
+        if statut in statuts:
+            return statut
+    return "inconnu"
+
+
+def statuts_filtre(essence: str, gasoil: str) -> set[str]:
+    """
+    Filtre ?statut= de la carte (flux GeoJSON, clusters) : une station ressort
+    sous le statut de chacun de ses produits (essence "dispo" + gasoil
+    "rupture" : dans "dispo" et dans "rupture").
+    """
+    return {(essence or "inconnu").lower(), (gasoil or "inconnu").lower()}
+
+
+def statut_filtre_q(statut: str) -> models.Q:
+    """
+    statuts_filtre en SQL, sur les colonnes essence / gasoil de StationStatus.
+    """
+    return models.Q(essence=statut) | models.Q(gasoil=statut)
+
+
+# -----------------------------
+# Champs de modèle
+# -----------------------------
+
+class _CodeField(models.Field):
+    # fournis par chaque sous-classe
+    kind: str
+    codes: dict[str, int]
+    labels: dict[int, str]
+    parse: Callable[[object], str | None]
+
+    def get_internal_type(self):
+        return "PositiveSmallIntegerField"
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else self.labels.get(value)
+
+    def to_python(self, value):
+        if value is None or value == "":
+            return None
+        parsed = self.parse(value)
+        if parsed is None:
+            raise ValidationError(f"{self.kind} inconnu : {value!r}", code="invalid")
+        return parsed
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None or value == "":
+            return None
+        parsed = self.parse(value)
+        if parsed is None:
+            raise ValueError(f"Champ '{self.name}' : {self.kind} inconnu {value!r}")
+        return self.codes[parsed]
+
+
+class ProduitField(_CodeField):
+    kind = "produit"
+    codes = PRODUIT_CODES
+    labels = _PRODUIT_LABELS
+    parse = staticmethod(parse_produit)
+
+
+class NiveauField(_CodeField):
+    kind = "niveau"
+    codes = NIVEAU_CODES
+    labels = _NIVEAU_LABELS
+    parse = staticmethod(parse_niveau)
@@ -0,0 +1,152 @@
+# stations/compression.py
+"""
+Réponses JSON pré-compressées.
+
+Une réponse cacheable est construite une seule fois par clé (la clé porte la
+version des données), compressée en gzip et brotli, et les trois variantes sont
+rangées ensemble dans le cache. Les requêtes suivantes reçoivent directement la
+variante acceptée (Accept-Encoding), sans reconstruire ni recompresser.
+
+La compression d'une entrée manquante se fait pendant la requête : niveaux
+moyens (gzip 6, brotli 5), proches en taille des niveaux maximaux pour une
+fraction du CPU. brotli (requirements.txt) reste optionnel : sans le paquet,
+seules les variantes identity/gzip existent.
+
+aprecompressed_response : même cache pour les vues async ; la compression
+d'une nouvelle entrée (CPU, une fois par version) passe par un thread.
+acompressed_response : réponses sans lendemain (fenêtre de carte, limit...),
+compressées pour ce client sans entrée de cache.
+"""
+from __future__ import annotations
+
+import gzip
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CACHE_PREFIX = "precompressed"
+DEFAULT_TTL = 3600
+# en dessous, la compression ne fait rien gagner
+MIN_SIZE = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+_PASSTHROUGH_HEADERS = ("Vary", "Cache-Control", "ETag", "Last-Modified")
+
+
+def _compress(body: bytes, codings=("br", "gzip")) -> dict[str, bytes]:
+    variants = {}
+    if len(body) >= MIN_SIZE:
+        if "gzip" in codings:
+            variants["gzip"] = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        if "br" in codings and brotli is not None:
+            variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return variants
+
+
+def _accepted(request) -> set[str]:
+    accepted = set()
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding and q > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def _pick_encoding(request, entry: dict) -> str | None:
+    accepted = _accepted(request)
+    for coding in ("br", "gzip"):
+        if coding in entry["variants"] and (coding in accepted or "*" in accepted):
+            return coding
+    return None
+
+
+def precompressed_response(request, key: str, build, ttl: int | None = DEFAULT_TTL) -> HttpResponse:
+    """
+    build() -> HttpResponse ; seule une réponse 200 est mise en cache.
+    """
+    cache_key = f"{CACHE_PREFIX}:{key}"
+    entry = cache.get(cache_key)
+
+    if entry is None:
+        response = build()
+        if response.status_code != 200 or response.streaming:
+            return response
+
+        entry = _entry_from(response)
+        cache.set(cache_key, entry, ttl)
+
+    return _respond(request, entry)
+
+
+async def aprecompressed_response(request, key: str, abuild, ttl: int | None = DEFAULT_TTL) -> HttpResponse:
+    """
+    await abuild() -> HttpResponse ; seule une réponse 200 est mise en cache.
+    """
+    cache_key = f"{CACHE_PREFIX}:{key}"
+    entry = await cache.aget(cache_key)
+
+    if entry is None:
+        response = await abuild()
+        if response.status_code != 200 or response.streaming:
+            return response
+
+        entry = await sync_to_async(_entry_from, thread_sensitive=False)(response)
+        await cache.aset(cache_key, entry, ttl)
+
+    return _respond(request, entry)
+
+
+async def acompressed_response(request, abuild) -> HttpResponse:
+    """
+    await abuild() -> HttpResponse ; 200 compressé dans le seul encodage retenu, non mis en cache.
+    """
+    response = await abuild()
+    if response.status_code != 200 or response.streaming:
+        return response
+
+    accepted = _accepted(request)
+    codings = [c for c in ("br", "gzip") if c in accepted or "*" in accepted]
+    if brotli is None and "br" in codings:
+        codings.remove("br")
+    entry = await sync_to_async(_entry_from, thread_sensitive=False)(response, codings[:1])
+    return _respond(request, entry)
+
+
+def _entry_from(response, codings=("br", "gzip")) -> dict:
+    body = response.content
+    return {
+        "content_type": response["Content-Type"],
+        "headers": {h: response[h] for h in _PASSTHROUGH_HEADERS if response.has_header(h)},
+        "identity": body,
+        "variants": _compress(body, codings),
+    }
+
+
+def _respond(request, entry: dict) -> HttpResponse:
+    coding = _pick_encoding(request, entry)
+    body = entry["variants"][coding] if coding else entry["identity"]
+
+    response = HttpResponse(body, content_type=entry["content_type"])
+    for header, value in entry["headers"].items():
+        response[header] = value
+    if coding:
+        response["Content-Encoding"] = coding
+    response["Content-Length"] = str(len(body))
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
@@ -0,0 +1,386 @@
+# stations/devices.py
+"""
+Résolution du device (header X-DEVICE-ID) pour l'API mobile, et registre des
+tokens FCM (Device.fcm_token, seul registre).
+
+- résolu une fois par requête (request._device) et gardé en cache entre les
+  requêtes : {id, device_id, is_active, last_seen_at}
+- invalidé par les signaux Device (stations/signals.py)
+- last_seen_at n'est relevé qu'au plus une fois toutes les
+  DEVICE_LAST_SEEN_INTERVAL_MINUTES par device, et sans écriture dans la
+  requête : mis en tampon dans le processus, écrit par lots (un UPDATE pour
+  tous les devices vus, chacun avec sa date) quand le tampon est plein, et au
+  plus tard DEVICE_LAST_SEEN_FLUSH_SECONDS après (thread du processus, même
+  pour un worker qui ne reçoit plus de requêtes)
+- réactivation d'un device : écrite tout de suite (il redevient ciblé), avec
+  ses abonnements désactivés par le balayage
+- aresolve_device / atouch_device : mêmes règles pour les vues async
+- register_token : un token n'appartient qu'à un device (retiré de l'ancien
+  détenteur, ex. réinstallation avec un nouveau device_id)
+- prune_tokens : refus FCM comptés en masse, par empreinte ; le token est
+  retiré après DEVICE_INVALID_TOKEN_STRIKES refus (l'heuristique de
+  notifications/utils.py peut aussi prendre une erreur de message pour un
+  token invalide)
+- deactivate_inactive_devices (manage.py desactiver_devices_inactifs, cron) :
+  devices muets depuis DEVICE_INACTIVE_DAYS jours ou aux tokens refusés
+  désactivés avec leurs abonnements (marqués deactivated_by_sweep), après
+  une période d'écriture des tampons des workers ; la diffusion ne cible plus que les devices actifs. Réactivation ou
+  register_token rétablissent les abonnements marqués
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .follow_counts import ainvalidate_follower_counts, invalidate_follower_counts
+from .models import Device, DeviceFollow, fcm_token_hash
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = 600
+# ids / empreintes par UPDATE ... WHERE ... IN (...)
+PRUNE_BATCH_SIZE = 500
+LAST_SEEN_BUFFER_SIZE = 500
+# marge d'écriture d'un lot, ajoutée à l'attente du balayage
+LAST_SEEN_FLUSH_GRACE = 5
+
+
+def last_seen_interval() -> timedelta:
+    return timedelta(minutes=getattr(settings, "DEVICE_LAST_SEEN_INTERVAL_MINUTES", 15))
+
+
+def last_seen_flush_seconds() -> float:
+    return float(getattr(settings, "DEVICE_LAST_SEEN_FLUSH_SECONDS", 60))
+
+
+def inactive_days() -> int:
+    return int(getattr(settings, "DEVICE_INACTIVE_DAYS", 90))
+
+
+def invalid_token_strikes() -> int:
+    return int(getattr(settings, "DEVICE_INVALID_TOKEN_STRIKES", 3))
+
+
+def _key(device_id: str) -> str:
+    return f"device:{device_id}"
+
+
+def get_device_id(request) -> str | None:
+    return request.headers.get("X-DEVICE-ID") or request.META.get("HTTP_X_DEVICE_ID")
+
+
+def invalidate_device(device_id: str) -> None:
+    """
+    Appelé par les signaux Device (register, admin, suppression).
+    """
+    cache.delete(_key(device_id))
+
+
+def resolve_device(request) -> dict | None:
+    """
+    Device du header X-DEVICE-ID, ou None (header absent / device inconnu).
+    0 requête si le device est en cache, 1 sinon.
+    """
+    if hasattr(request, "_device"):
+        return request._device
+
+    ref = None
+    device_id = get_device_id(request)
+    if device_id:
+        ref = cache.get(_key(device_id))
+        if ref is None:
+            ref = (
+                Device.objects.filter(device_id=device_id)
+                .values("id", "device_id", "is_active", "last_seen_at")
+                .first()
+            )
+            if ref is not None:
+                cache.set(_key(device_id), ref, CACHE_TTL)
+
+    request._device = ref
+    return ref
+
+
+async def aresolve_device(request) -> dict | None:
+    if hasattr(request, "_device"):
+        return request._device
+
+    ref = None
+    device_id = get_device_id(request)
+    if device_id:
+        ref = await cache.aget(_key(device_id))
+        if ref is None:
+            ref = await (
+                Device.objects.filter(device_id=device_id)
+                .values("id", "device_id", "is_active", "last_seen_at")
+                .afirst()
+            )
+            if ref is not None:
+                await cache.aset(_key(device_id), ref, CACHE_TTL)
+
+    request._device = ref
+    return ref
+
+
+def _touch_fields(ref: dict, reactivate: bool) -> dict | None:
+    """
+    Champs à relever, ou None si le device a été vu récemment (et reste actif).
+    """
+    now = timezone.now()
+    needs_reactivation = reactivate and not ref["is_active"]
+    last_seen = ref["last_seen_at"]
+    if not needs_reactivation and last_seen and now - last_seen < last_seen_interval():
+        return None
+
+    fields = {"last_seen_at": now}
+    if needs_reactivation:
+        fields["is_active"] = True
+    return fields
+
+
+def touch_device(ref: dict, *, reactivate: bool = False) -> bool:
+    """
+    Relève last_seen_at (et is_active=True si reactivate) seulement si nécessaire.
+    Retourne True si le device a été relevé (réactivation écrite, sinon mis en tampon).
+    """
+    fields = _touch_fields(ref, reactivate)
+    if fields is None:
+        return False
+    if "is_active" in fields:
+        invalidate_follower_counts(*_reactivate(ref["id"], fields))
+    else:
+        batch = _buffer_seen(ref["id"], fields["last_seen_at"])
+        if batch:
+            _write_seen(batch)
+
+    ref.update(fields)
+    cache.set(_key(ref["device_id"]), ref, CACHE_TTL)
+    return True
+
+
+async def atouch_device(ref: dict, *, reactivate: bool = False) -> bool:
+    fields = _touch_fields(ref, reactivate)
+    if fields is None:
+        return False
+    if "is_active" in fields:
+        await ainvalidate_follower_counts(*await sync_to_async(_reactivate)(ref["id"], fields))
+    else:
+        batch = _buffer_seen(ref["id"], fields["last_seen_at"])
+        if batch:
+            await sync_to_async(_write_seen)(batch)
+
+    ref.update(fields)
+    await cache.aset(_key(ref["device_id"]), ref, CACHE_TTL)
+    return True
+
+
+def _restore_follows(device_pk: int) -> set[int]:
+    """
+    Rétablit les abonnements désactivés par le balayage ; retourne leurs stations.
+    """
+    swept = DeviceFollow.objects.filter(device_id=device_pk, deactivated_by_sweep=True)
+    station_ids = set(swept.values_list("station_id", flat=True))
+    if station_ids:
+        swept.update(is_active=True, deactivated_by_sweep=False)
+    return station_ids
+
+
+def _reactivate(device_pk: int, fields: dict) -> set[int]:
+    with transaction.atomic():
+        Device.objects.filter(id=device_pk).update(**fields, token_failures=0)
+        return _restore_follows(device_pk)
+
+
+# -----------------------------
+# Tampon last_seen_at
+# -----------------------------
+
+_seen: dict[int, datetime] = {}  # Device.id -> vu à
+_seen_lock = threading.Lock()
+_seen_since = time.monotonic()
+_flusher: threading.Thread | None = None
+
+
+def _buffer_seen(device_pk: int, seen_at: datetime) -> dict[int, datetime] | None:
+    """
+    Met le device en tampon ; retourne le lot à écrire si le tampon est plein ou ancien.
+    """
+    global _seen_since
+    with _seen_lock:
+        _start_flusher()
+        if not _seen:
+            _seen_since = time.monotonic()
+        _seen[device_pk] = seen_at
+        if len(_seen) < LAST_SEEN_BUFFER_SIZE and time.monotonic() - _seen_since < last_seen_flush_seconds():
+            return None
+        batch = dict(_seen)
+        _seen.clear()
+    return batch
+
+
+def _write_seen(batch: dict[int, datetime]) -> int:
+    # chaque device avec sa date : un UPDATE ... CASE par lot
+    rows = [Device(id=pk, last_seen_at=seen_at) for pk, seen_at in sorted(batch.items())]
+    return Device.objects.bulk_update(rows, ["last_seen_at"], batch_size=PRUNE_BATCH_SIZE)
+
+
+def flush_last_seen() -> int:
+    """
+    Écrit le tampon du processus ; retourne le nombre de devices mis à jour.
+    """
+    with _seen_lock:
+        batch = dict(_seen)
+        _seen.clear()
+    return _write_seen(batch) if batch else 0
+
+
+def _start_flusher() -> None:
+    """
+    Démarre (une fois par processus, _seen_lock tenu) le thread qui écrit le tampon.
+    """
+    global _flusher
+    if _flusher is None:
+        _flusher = threading.Thread(target=_flush_periodically, name="last-seen-flush", daemon=True)
+        _flusher.start()
+
+
+def _flush_periodically():
+    # sans lui, un worker sans requêtes garderait ses dates jusqu'à son arrêt
+    while True:
+        time.sleep(last_seen_flush_seconds())
+        try:
+            flush_last_seen()
+        except Exception:
+            logger.exception("tampon last_seen_at non écrit")
+        finally:
+            # thread hors requête : pas de connexion gardée ouverte entre deux lots
+            connection.close()
+
+
+def _wait_for_flushes(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+def _flush_at_exit():
+    try:
+        flush_last_seen()
+    except Exception:
+        logger.exception("tampon last_seen_at non écrit à l'arrêt du processus")
+
+
+atexit.register(_flush_at_exit)
+
+
+# -----------------------------
+# Registre des tokens FCM
+# -----------------------------
+
+def register_token(device_id: str, token: str, platform: str = "android") -> Device:
+    """
+    Enregistre (ou met à jour) le device et son token ; active le device,
+    remet à zéro ses refus de token et rétablit ses abonnements désactivés
+    par le balayage (rotation de token après refus, retour après inactivité).
+    """
+    digest = fcm_token_hash(token)
+    with transaction.atomic():
+        if digest:
+            Device.objects.filter(fcm_token_hash=digest).exclude(device_id=device_id).update(
+                fcm_token=None, fcm_token_hash=None,
+            )
+        dev, _ = Device.objects.update_or_create(
+            device_id=device_id,
+            defaults={
+                "platform": platform,
+                "fcm_token": token,
+                "is_active": True,
+                "token_failures": 0,
+                "last_seen_at": timezone.now(),
+            },
+        )
+        restored = _restore_follows(dev.id)
+    invalidate_follower_counts(*restored)
+    return dev
+
+
+def prune_tokens(tokens: Iterable[str]) -> int:
+    """
+    Compte un refus pour chaque token invalide et retire du registre ceux qui
+    atteignent le seuil ; retourne le nombre de tokens retirés.
+    """
+    digests = sorted({d for d in map(fcm_token_hash, tokens) if d})
+    strikes = invalid_token_strikes()
+    pruned = 0
+    for i in range(0, len(digests), PRUNE_BATCH_SIZE):
+        chunk = digests[i : i + PRUNE_BATCH_SIZE]
+        with transaction.atomic():
+            Device.objects.filter(fcm_token_hash__in=chunk).update(token_failures=F("token_failures") + 1)
+            pruned += Device.objects.filter(fcm_token_hash__in=chunk, token_failures__gte=strikes).update(
+                fcm_token=None, fcm_token_hash=None,
+            )
+    return pruned
+
+
+# -----------------------------
+# Devices inactifs
+# -----------------------------
+
+def deactivate_inactive_devices(
+    *, days: int | None = None, strikes: int | None = None, dry_run: bool = False,
+) -> dict[str, int]:
+    """
+    Désactive les devices muets depuis `days` jours ou dont les tokens ont été
+    refusés `strikes` fois, et leurs abonnements (par lots, UPDATE en masse).
+    Un device qui revient (suivi d'une station, enregistrement) est réactivé
+    avec ses abonnements marqués deactivated_by_sweep.
+
+    La sélection attend une période d'écriture des tampons last_seen_at
+    (DEVICE_LAST_SEEN_FLUSH_SECONDS + LAST_SEEN_FLUSH_GRACE) : toute visite
+    antérieure au lancement est alors en base, quel que soit le worker qui
+    l'a reçue. Le tampon de ce processus est écrit tout de suite, même en dry_run.
+    """
+    days = inactive_days() if days is None else days
+    strikes = invalid_token_strikes() if strikes is None else strikes
+    flush_last_seen()
+    cutoff = timezone.now() - timedelta(days=days)
+    _wait_for_flushes(last_seen_flush_seconds() + LAST_SEEN_FLUSH_GRACE)
+
+    qs = Device.objects.filter(is_active=True).filter(
+        Q(last_seen_at__lt=cutoff) | Q(token_failures__gte=strikes)
+    )
+    if dry_run:
+        return {
+            "devices": qs.count(),
+            "follows": DeviceFollow.objects.filter(device__in=qs, is_active=True).count(),
+        }
+
+    devices = follows = 0
+    while True:
+        batch = list(qs.order_by("id").values_list("id", "device_id")[:PRUNE_BATCH_SIZE])
+        if not batch:
+            break
+        ids = [pk for pk, _ in batch]
+        with transaction.atomic():
+            station_ids = set(
+                DeviceFollow.objects.filter(device_id__in=ids, is_active=True).values_list("station_id", flat=True)
+            )
+            follows += DeviceFollow.objects.filter(device_id__in=ids, is_active=True).update(
+                is_active=False, deactivated_by_sweep=True,
+            )
+            devices += Device.objects.filter(id__in=ids).update(is_active=False)
+
+        # UPDATE en masse : pas de signal, caches invalidés ici
+        cache.delete_many([_key(device_id) for _, device_id in batch])
+        invalidate_follower_counts(*station_ids)
+
+    return {"devices": devices, "follows": follows}
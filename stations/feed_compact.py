@@ -0,0 +1,122 @@
+# stations/feed_compact.py
+"""
+Encodage compact du flux des stations (alternative au GeoJSON de stations_geojson).
+
+- hiérarchie dictionnaire : chaque région / cercle / commune n'est envoyé qu'une fois
+  (colonnes id, nom, parent) ; les stations ne portent que commune_id
+- colonnes : un tableau par champ (id, nom, lng, lat, codes de statut...)
+- statuts en petits entiers (index dans "statuts" / "status_global")
+- dates en secondes epoch
+
+Sérialisé en MessagePack (Accept: application/msgpack) ou en JSON "packed".
+"""
+from __future__ import annotations
+
+import msgpack
+from django.http import HttpResponse, JsonResponse
+
+FORMAT_VERSION = 1
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+PACKED_JSON_TYPE = "application/vnd.malitadji.packed+json"
+
+STATUTS = ("inconnu", "dispo", "faible", "rupture")
+STATUS_GLOBAL = ("Inconnu", "Disponible", "Faible", "Rupture")
+
+_STATUT_CODE = {s: i for i, s in enumerate(STATUTS)}
+
+
+def negotiate_format(request) -> str:
+    """
+    "geojson" (défaut), "msgpack" ou "packed".
+    ?format= prime sur l'en-tête Accept.
+    """
+    fmt = (request.GET.get("format") or "").strip().lower()
+    if fmt in ("geojson", "msgpack", "packed"):
+        return fmt
+
+    accept = request.headers.get("Accept", "").lower()
+    if any(t in accept for t in MSGPACK_TYPES):
+        return "msgpack"
+    if PACKED_JSON_TYPE in accept:
+        return "packed"
+    return "geojson"
+
+
+class CompactFeed:
+    def __init__(self):
+        self.regions: dict[int, str] = {}
+        self.cercles: dict[int, tuple[str, int | None]] = {}
+        self.communes: dict[int, tuple[str, int | None]] = {}
+        self.columns: dict[str, list] = {
+            "id": [],
+            "nom": [],
+            "adresse": [],
+            "lng": [],
+            "lat": [],
+            "commune_id": [],
+            "essence": [],
+            "gasoil": [],
+            "status": [],
+            "derniere_maj": [],
+            "stale": [],
+            "is_followed": [],
+        }
+
+    def _register_hierarchy(self, row) -> None:
+        if row.commune_id is None or row.commune_id in self.communes:
+            return
+        self.communes[row.commune_id] = (row.commune_nom, row.cercle_id)
+        if row.cercle_id is not None and row.cercle_id not in self.cercles:
+            self.cercles[row.cercle_id] = (row.cercle_nom, row.region_id)
+            if row.region_id is not None:
+                self.regions.setdefault(row.region_id, row.region_nom)
+
+    def add(self, row, is_followed: bool) -> None:
+        """
+        row : ligne StationStatus (statuts déjà normalisés).
+        """
+        self._register_hierarchy(row)
+
+        cols = self.columns
+        cols["id"].append(row.station_id)
+        cols["nom"].append(row.nom)
+        cols["adresse"].append(row.adresse or "")
+        cols["lng"].append(row.longitude)
+        cols["lat"].append(row.latitude)
+        cols["commune_id"].append(row.commune_id)
+        cols["essence"].append(_STATUT_CODE.get(row.essence, 0))
+        cols["gasoil"].append(_STATUT_CODE.get(row.gasoil, 0))
+        cols["status"].append(_STATUT_CODE.get(row.status, 0))
+        cols["derniere_maj"].append(int(row.derniere_maj.timestamp()) if row.derniere_maj else None)
+        cols["stale"].append(int(row.stale))
+        cols["is_followed"].append(int(is_followed))
+
+    def payload(self) -> dict:
+        return {
+            "v": FORMAT_VERSION,
+            "statuts": list(STATUTS),
+            "status_global": list(STATUS_GLOBAL),
+            "regions": {
+                "id": list(self.regions),
+                "nom": list(self.regions.values()),
+            },
+            "cercles": {
+                "id": list(self.cercles),
+                "nom": [nom for nom, _ in self.cercles.values()],
+                "region_id": [parent for _, parent in self.cercles.values()],
+            },
+            "communes": {
+                "id": list(self.communes),
+                "nom": [nom for nom, _ in self.communes.values()],
+                "cercle_id": [parent for _, parent in self.communes.values()],
+            },
+            "count": len(self.columns["id"]),
+            "stations": self.columns,
+        }
+
+
+def compact_response(payload: dict, fmt: str) -> HttpResponse:
+    if fmt == "msgpack":
+        return HttpResponse(msgpack.packb(payload, use_bin_type=True), content_type=MSGPACK_TYPES[0])
+    return JsonResponse(payload, content_type=PACKED_JSON_TYPE, json_dumps_params={"separators": (",", ":")})
@@ -0,0 +1,44 @@
+# stations/follow_counts.py
+"""
+Compteurs d'abonnés par station, gardés en cache.
+
+Invalidés par les signaux StationFollow / DeviceFollow (stations/signals.py) et
+explicitement après les queryset.update(...) qui ne déclenchent pas de signal.
+"""
+from __future__ import annotations
+
+from django.core.cache import cache
+
+from .models import DeviceFollow, StationFollow
+
+# filet de sécurité si une écriture échappe à l'invalidation
+TTL_SECONDS = 600
+
+
+def _key(station_id: int) -> str:
+    return f"followers:{station_id}"
+
+
+def follower_counts(station_id: int) -> dict[str, int]:
+    """
+    {"followers_count", "device_followers_count", "followers_total"}
+    """
+    counts = cache.get(_key(station_id))
+    if counts is None:
+        followers_count = StationFollow.objects.filter(station_id=station_id, is_active=True).count()
+        device_followers_count = DeviceFollow.objects.filter(station_id=station_id, is_active=True).count()
+        counts = {
+            "followers_count": followers_count,
+            "device_followers_count": device_followers_count,
+            "followers_total": followers_count + device_followers_count,
+        }
+        cache.set(_key(station_id), counts, TTL_SECONDS)
+    return counts
+
+
+def invalidate_follower_counts(*station_ids: int) -> None:
+    cache.delete_many([_key(sid) for sid in station_ids if sid])
+
+
+async def ainvalidate_follower_counts(*station_ids: int) -> None:
+    await cache.adelete_many([_key(sid) for sid in station_ids if sid])
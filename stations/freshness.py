@@ -0,0 +1,124 @@
+# stations/freshness.py
+"""
+Fraîcheur des stocks.
+
+Un stock dont le dernier relevé (Stock.date_maj) dépasse le seuil de son produit
+est marqué is_stale=True par un balayage périodique (commande
+`marquer_stocks_obsoletes`), qui s'appuie sur l'index Stock(date_maj).
+Les lectures (carte, KPIs) se contentent de lire le booléen.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .changes import notify_stations_changed
+from .models import Station, Stock
+
+
+def stale_after(produit: str | None) -> timedelta:
+    """
+    Seuil d'obsolescence du produit (settings.STOCK_STALE_AFTER_HOURS, clé
+    "default" pour un produit sans seuil propre).
+    """
+    thresholds = settings.STOCK_STALE_AFTER_HOURS
+    p = str(produit or "").strip().lower()
+    hours = thresholds.get(p, thresholds["default"])
+    return timedelta(hours=float(hours))
+
+
+def downgrade_enabled() -> bool:
+    """
+    Si True, la carte et les KPIs affichent "inconnu" pour un stock obsolète.
+    """
+    return bool(getattr(settings, "STOCK_STALE_DOWNGRADE", True))
+
+
+def effective_niveau(niveau: str | None, is_stale: bool) -> str | None:
+    """
+    Niveau à afficher : None (=> inconnu) si le stock est obsolète.
+    """
+    if is_stale and downgrade_enabled():
+        return None
+    return niveau
+
+
+def sweep_stale_stocks(*, now: datetime | None = None) -> dict:
+    """
+    Marque / démarque is_stale selon les seuils courants.
+    Par produit : deux SELECT bornés par l'index date_maj, puis UPDATE par id.
+    """
+    now = now or timezone.now()
+
+    produits = {p for p, _ in Stock.PRODUITS}
+
+    # import local : stations/status.py dépend de effective_niveau
+    from .status import refresh_station_status
+
+    marked = 0
+    cleared = 0
+    station_ids: set[int] = set()
+    with transaction.atomic():
+        for produit in sorted(produits):
+            cutoff = now - stale_after(produit)
+
+            to_mark = list(
+                Stock.objects.filter(produit=produit, is_stale=False, date_maj__lt=cutoff)
+                .values_list("id", "station_id")
+            )
+            # seuil relevé entre deux balayages
+            to_clear = list(
+                Stock.objects.filter(produit=produit, is_stale=True, date_maj__gte=cutoff)
+                .values_list("id", "station_id")
+            )
+
+            if to_mark:
+                marked += Stock.objects.filter(id__in=[i for i, _ in to_mark]).update(is_stale=True)
+            if to_clear:
+                cleared += Stock.objects.filter(id__in=[i for i, _ in to_clear]).update(is_stale=False)
+            station_ids.update(sid for _, sid in to_mark + to_clear)
+
+        refresh_station_status(station_ids)
+        notify_stations_changed(station_ids)
+
+    return {"marked": marked, "cleared": cleared}
+
+
+def stale_stations(*, gerant=None, commune_id: int | None = None):
+    """
+    Stations ayant au moins un stock obsolète (index Stock(is_stale, station)).
+    """
+    qs = (
+        Station.objects.filter(stocks__is_stale=True)
+        .select_related("commune", "gerant")
+        .distinct()
+        .order_by("nom")
+    )
+    if gerant is not None:
+        qs = qs.filter(gerant=gerant)
+    if commune_id:
+        qs = qs.filter(commune_id=commune_id)
+    return qs
+
+
+def stale_stocks_for(stations) -> dict[int, list[dict]]:
+    """
+    station_id -> [{produit, niveau, date_maj}] des stocks obsolètes.
+    """
+    out: dict[int, list[dict]] = {}
+    rows = (
+        Stock.objects.filter(station__in=stations, is_stale=True)
+        .values("station_id", "produit", "niveau", "date_maj")
+        .order_by("station_id", "produit")
+    )
+    for row in rows:
+        out.setdefault(row["station_id"], []).append({
+            "produit": row["produit"],
+            "niveau": row["niveau"],
+            "date_maj": row["date_maj"].isoformat() if row["date_maj"] else None,
+        })
+    return out
+
@@ -0,0 +1,112 @@
+# stations/geo_cache.py
+"""
+Cache versionné du découpage administratif (Region / Cercle / Commune).
+
+La hiérarchie ne change qu'à l'import (import_decoupage_mali) ou via l'admin :
+chaque modification incrémente la version (signaux dans stations/signals.py),
+les listes sont mises en cache sous cette version et ne sont plus relues.
+
+geo_bundle() : les mêmes listes en un seul JSON, identifié par son empreinte
+(servi à une URL immuable, /api/geo/<empreinte>.json).
+
+Variantes a* pour les vues async (stations/api_admin_geo.py) : mêmes clés,
+cache et ORM asynchrones.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+
+from .models import Cercle, Commune, Region
+
+VERSION_KEY = "geo:hierarchy_version"
+
+
+def hierarchy_version() -> int:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # départ horodaté : une clé évincée ne retombe pas sur une ancienne version
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY, 0)
+    return int(version)
+
+
+async def ahierarchy_version() -> int:
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, time.time_ns(), None)
+        version = await cache.aget(VERSION_KEY, 0)
+    return int(version)
+
+
+def bump_hierarchy_version() -> None:
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def geo_reference_lists() -> dict[str, list[dict]]:
+    """
+    {"regions": [{id, nom}], "cercles": [{id, nom, region_id}], "communes": [{id, nom, cercle_id}]}
+    Triées par nom ; 3 requêtes au premier appel d'une version, 0 ensuite.
+    """
+    key = f"geo:lists:{hierarchy_version()}"
+    data = cache.get(key)
+    if data is None:
+        data = {
+            "regions": list(Region.objects.order_by("nom").values("id", "nom")),
+            "cercles": list(Cercle.objects.order_by("nom").values("id", "nom", "region_id")),
+            "communes": list(Commune.objects.order_by("nom").values("id", "nom", "cercle_id")),
+        }
+        cache.set(key, data, None)
+    return data
+
+
+async def ageo_reference_lists() -> dict[str, list[dict]]:
+    key = f"geo:lists:{await ahierarchy_version()}"
+    data = await cache.aget(key)
+    if data is None:
+        data = {
+            "regions": [r async for r in Region.objects.order_by("nom").values("id", "nom")],
+            "cercles": [c async for c in Cercle.objects.order_by("nom").values("id", "nom", "region_id")],
+            "communes": [c async for c in Commune.objects.order_by("nom").values("id", "nom", "cercle_id")],
+        }
+        await cache.aset(key, data, None)
+    return data
+
+
+def geo_bundle() -> dict:
+    """
+    {"version", "digest", "body"} : JSON compact des 3 listes et son empreinte (sha256 tronqué).
+    Calculé une fois par version de la hiérarchie.
+    """
+    version = hierarchy_version()
+    key = f"geo:bundle:{version}"
+    bundle = cache.get(key)
+    if bundle is None:
+        bundle = _bundle(version, geo_reference_lists())
+        cache.set(key, bundle, None)
+    return bundle
+
+
+async def ageo_bundle() -> dict:
+    version = await ahierarchy_version()
+    key = f"geo:bundle:{version}"
+    bundle = await cache.aget(key)
+    if bundle is None:
+        bundle = _bundle(version, await ageo_reference_lists())
+        await cache.aset(key, bundle, None)
+    return bundle
+
+
+def _bundle(version: int, lists: dict) -> dict:
+    body = json.dumps(lists, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return {
+        "version": version,
+        "digest": hashlib.sha256(body).hexdigest()[:16],
+        "body": body,
+    }
@@ -0,0 +1,410 @@
+# stations/heatmap.py
+"""
+Agrégats "heatmap" des ruptures.
+
+Le temps passé en rupture / faible est cumulé par tranche (heure / jour) et par
+zone (commune + cellule geohash) dans ShortageRollup. Le calcul est incrémental :
+on ne lit que les StockHistory postérieurs au curseur, plus les intervalles
+encore ouverts en rupture/faible (proportionnel à l'activité récente).
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Sum
+from django.utils import timezone
+
+from .codes import niveau_statut
+from .models import RollupCursor, ShortageInterval, ShortageRollup, Station, StockHistory
+
+CURSOR_NAME = "shortage_rollup"
+SHORTAGE_STATUTS = ("rupture", "faible")
+
+GRANULARITY_STEP = {
+    "h": timedelta(hours=1),
+    "d": timedelta(days=1),
+}
+
+# fenêtre -> (granularité, durée)
+WINDOWS = {
+    "24h": ("h", timedelta(hours=24)),
+    "7d": ("d", timedelta(days=7)),
+}
+
+# Rétention par granularité (au-delà, les tranches sont supprimées par prune)
+RETENTION = {
+    "h": timedelta(days=3),
+    "d": timedelta(days=90),
+}
+
+
+def _geohash_precision() -> int:
+    return int(getattr(settings, "SHORTAGE_GEOHASH_PRECISION", 5))
+
+
+# -----------------------------
+# Geohash
+# -----------------------------
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat: float, lng: float, precision: int = 5) -> str:
+    lat_rng = [-90.0, 90.0]
+    lng_rng = [-180.0, 180.0]
+    out = []
+    bits = 0
+    ch = 0
+    even = True
+
+    while len(out) < precision:
+        rng, val = (lng_rng, lng) if even else (lat_rng, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if val >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch = ch << 1
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_GEOHASH_BASE32[ch])
+            bits = 0
+            ch = 0
+
+    return "".join(out)
+
+
+def geohash_bbox(gh: str) -> tuple[float, float, float, float]:
+    """
+    Retourne (min_lng, min_lat, max_lng, max_lat) de la cellule.
+    """
+    lat_rng = [-90.0, 90.0]
+    lng_rng = [-180.0, 180.0]
+    even = True
+
+    for c in gh:
+        cd = _GEOHASH_BASE32.index(c)
+        for mask in (16, 8, 4, 2, 1):
+            rng = lng_rng if even else lat_rng
+            mid = (rng[0] + rng[1]) / 2
+            if cd & mask:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+
+    return lng_rng[0], lat_rng[0], lng_rng[1], lat_rng[1]
+
+
+# -----------------------------
+# Tranches de temps
+# -----------------------------
+def bucket_start(dt: datetime, granularity: str) -> datetime:
+    dt = dt.astimezone(dt_timezone.utc)
+    if granularity == "h":
+        return dt.replace(minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _split_interval(start: datetime, end: datetime, granularity: str):
+    """
+    Découpe [start, end) en (début de tranche, secondes) pour la granularité.
+    """
+    step = GRANULARITY_STEP[granularity]
+    cur = start
+    while cur < end:
+        nxt = min(bucket_start(cur, granularity) + step, end)
+        yield bucket_start(cur, granularity), (nxt - cur).total_seconds()
+        cur = nxt
+
+
+def _bucket_key(dt: datetime) -> str:
+    return dt.astimezone(dt_timezone.utc).strftime("%Y-%m-%dT%H:%MZ")
+
+
+# -----------------------------
+# Agrégation incrémentale
+# -----------------------------
+def _station_zones(stations: dict[int, dict], station_id: int, precision: int) -> list[tuple[str, str]]:
+    st = stations.get(station_id)
+    if not st:
+        return []
+
+    zones = []
+    if st["commune_id"]:
+        zones.append(("commune", str(st["commune_id"])))
+    if st["latitude"] is not None and st["longitude"] is not None:
+        zones.append(("geohash", geohash_encode(st["latitude"], st["longitude"], precision)))
+    return zones
+
+
+def _accrue(acc, interval: ShortageInterval, end: datetime, zones: list[tuple[str, str]]) -> None:
+    """
+    Ajoute à acc le temps de l'intervalle entre accounted_until et end.
+    """
+    start = interval.accounted_until
+    if end <= start:
+        return
+
+    if interval.statut in SHORTAGE_STATUTS and zones:
+        idx = 0 if interval.statut == "rupture" else 1
+        for granularity in GRANULARITY_STEP:
+            for bucket, seconds in _split_interval(start, end, granularity):
+                for zone_type, zone_key in zones:
+                    acc[(granularity, bucket, zone_type, zone_key, interval.produit)][idx] += seconds
+
+    interval.accounted_until = end
+
+
+def _flush(acc) -> int:
+    """
+    Upsert des tranches accumulées (1 SELECT + bulk_update + bulk_create).
+    """
+    if not acc:
+        return 0
+
+    existing = {
+        (r.granularity, r.bucket_start, r.zone_type, r.zone_key, r.produit): r
+        for r in ShortageRollup.objects.filter(
+            bucket_start__in={k[1] for k in acc},
+            zone_key__in={k[3] for k in acc},
+        )
+    }
+
+    to_update = []
+    to_create = []
+    for key, (rupture_s, faible_s) in acc.items():
+        row = existing.get(key)
+        if row is None:
+            granularity, bucket, zone_type, zone_key, produit = key
+            to_create.append(ShortageRollup(
+                granularity=granularity,
+                bucket_start=bucket,
+                zone_type=zone_type,
+                zone_key=zone_key,
+                produit=produit,
+                rupture_seconds=int(round(rupture_s)),
+                faible_seconds=int(round(faible_s)),
+            ))
+        else:
+            row.rupture_seconds += int(round(rupture_s))
+            row.faible_seconds += int(round(faible_s))
+            to_update.append(row)
+
+    if to_update:
+        ShortageRollup.objects.bulk_update(to_update, ["rupture_seconds", "faible_seconds"])
+    if to_create:
+        ShortageRollup.objects.bulk_create(to_create)
+
+    return len(acc)
+
+
+def refresh_shortage_rollups(*, now: datetime | None = None, batch_size: int = 5000) -> dict:
+    """
+    Traite au plus batch_size nouveaux StockHistory depuis le curseur.
+    Si on est à jour, prolonge aussi les intervalles ouverts en rupture/faible jusqu'à now.
+    Retourne: rows, buckets, caught_up
+    """
+    now = now or timezone.now()
+    precision = _geohash_precision()
+    acc = defaultdict(lambda: [0.0, 0.0])
+
+    with transaction.atomic():
+        cursor, _ = RollupCursor.objects.select_for_update().get_or_create(name=CURSOR_NAME)
+
+        rows = list(
+            StockHistory.objects.filter(id__gt=cursor.last_id)
+            .order_by("id")
+            .values("id", "station_id", "produit", "nouveau_niveau", "date_maj")[:batch_size]
+        )
+        caught_up = len(rows) < batch_size
+
+        station_ids = {r["station_id"] for r in rows}
+
+        intervals: dict[tuple[int, str], ShortageInterval] = {
+            (i.station_id, i.produit): i
+            for i in ShortageInterval.objects.filter(station_id__in=station_ids)
+        }
+
+        open_short = []
+        if caught_up:
+            open_short = [
+                i for i in ShortageInterval.objects.filter(statut__in=SHORTAGE_STATUTS)
+                if (i.station_id, i.produit) not in intervals
+            ]
+            station_ids |= {i.station_id for i in open_short}
+
+        stations = {
+            s["id"]: s
+            for s in Station.objects.filter(id__in=station_ids).values("id", "commune_id", "latitude", "longitude")
+        }
+
+        to_create: dict[tuple[int, str], ShortageInterval] = {}
+        for r in rows:
+            produit = r["produit"]
+            key = (r["station_id"], produit)
+            statut = niveau_statut(r["nouveau_niveau"])
+
+            interval = intervals.get(key)
+            if interval is None:
+                interval = ShortageInterval(
+                    station_id=r["station_id"],
+                    produit=produit,
+                    statut=statut,
+                    since=r["date_maj"],
+                    accounted_until=r["date_maj"],
+                )
+                intervals[key] = interval
+                to_create[key] = interval
+                continue
+
+            _accrue(acc, interval, r["date_maj"], _station_zones(stations, r["station_id"], precision))
+            interval.statut = statut
+            interval.since = r["date_maj"]
+            interval.accounted_until = max(interval.accounted_until, r["date_maj"])
+
+        if caught_up:
+            for interval in list(intervals.values()) + open_short:
+                _accrue(acc, interval, now, _station_zones(stations, interval.station_id, precision))
+
+        to_update = [i for k, i in intervals.items() if k not in to_create] + open_short
+        if to_update:
+            ShortageInterval.objects.bulk_update(to_update, ["statut", "since", "accounted_until"])
+        if to_create:
+            ShortageInterval.objects.bulk_create(to_create.values())
+
+        buckets = _flush(acc)
+
+        if rows:
+            cursor.last_id = rows[-1]["id"]
+        cursor.save()
+
+    return {"rows": len(rows), "buckets": buckets, "caught_up": caught_up}
+
+
+def prune_shortage_rollups(*, now: datetime | None = None) -> int:
+    now = now or timezone.now()
+    deleted = 0
+    for granularity, keep in RETENTION.items():
+        n, _ = ShortageRollup.objects.filter(
+            granularity=granularity,
+            bucket_start__lt=bucket_start(now - keep, granularity),
+        ).delete()
+        deleted += n
+    return deleted
+
+
+# -----------------------------
+# Lecture (endpoint)
+# -----------------------------
+def _data_version() -> str:
+    cursor = RollupCursor.objects.filter(name=CURSOR_NAME).values_list("last_id", "updated_at").first()
+    if not cursor:
+        return "0"
+    return f"{cursor[0]}:{int(cursor[1].timestamp())}"
+
+
+def heatmap_payload(*, window: str, zone_type: str, produit: str | None, fmt: str, now: datetime | None = None) -> dict:
+    """
+    Payload mis en cache par version du curseur (1 requête si déjà calculé).
+    fmt: "grid" -> {buckets: {tranche: {zone: [rupture_s, faible_s]}}}
+         "geojson" -> FeatureCollection, 1 feature par zone avec ses tranches
+    """
+    cache_key = f"heatmap:{_data_version()}:{window}:{zone_type}:{produit or ''}:{fmt}"
+    payload = cache.get(cache_key)
+    if payload is None:
+        payload = _build_heatmap(window=window, zone_type=zone_type, produit=produit, fmt=fmt, now=now)
+        cache.set(cache_key, payload, 300)
+    return payload
+
+
+def _build_heatmap(*, window: str, zone_type: str, produit: str | None, fmt: str, now: datetime | None) -> dict:
+    now = now or timezone.now()
+    granularity, span = WINDOWS[window]
+
+    qs = ShortageRollup.objects.filter(
+        granularity=granularity,
+        zone_type=zone_type,
+        bucket_start__gte=bucket_start(now - span, granularity),
+    )
+    if produit:
+        qs = qs.filter(produit=produit)
+
+    rows = (
+        qs.values("bucket_start", "zone_key")
+        .annotate(rupture=Sum("rupture_seconds"), faible=Sum("faible_seconds"))
+        .order_by("bucket_start")
+    )
+
+    buckets: dict[str, dict[str, list[int]]] = {}
+    by_zone: dict[str, dict[str, list[int]]] = defaultdict(dict)
+    for r in rows:
+        val = [r["rupture"] or 0, r["faible"] or 0]
+        key = _bucket_key(r["bucket_start"])
+        buckets.setdefault(key, {})[r["zone_key"]] = val
+        by_zone[r["zone_key"]][key] = val
+
+    meta = {
+        "window": window,
+        "granularity": granularity,
+        "zone": zone_type,
+        "produit": produit,
+    }
+    if zone_type == "geohash":
+        meta["precision"] = _geohash_precision()
+
+    if fmt == "grid":
+        return {**meta, "buckets": buckets}
+
+    features = []
+    if zone_type == "geohash":
+        for gh, zone_buckets in by_zone.items():
+            min_lng, min_lat, max_lng, max_lat = geohash_bbox(gh)
+            features.append(_zone_feature(
+                gh,
+                {"type": "Polygon", "coordinates": [[
+                    [min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat], [min_lng, max_lat], [min_lng, min_lat],
+                ]]},
+                zone_buckets,
+            ))
+    else:
+        # Les communes n'ont pas de géométrie en base : centroïde des stations
+        centroids = {
+            str(c["commune_id"]): c
+            for c in (
+                Station.objects.filter(commune_id__in=[int(k) for k in by_zone])
+                .exclude(latitude__isnull=True)
+                .exclude(longitude__isnull=True)
+                .values("commune_id", "commune__nom")
+                .annotate(lat=Avg("latitude"), lng=Avg("longitude"))
+            )
+        }
+        for commune_id, zone_buckets in by_zone.items():
+            c = centroids.get(commune_id)
+            if not c:
+                continue
+            features.append(_zone_feature(
+                commune_id,
+                {"type": "Point", "coordinates": [c["lng"], c["lat"]]},
+                zone_buckets,
+                nom=c["commune__nom"],
+            ))
+
+    return {"type": "FeatureCollection", **meta, "features": features}
+
+
+def _zone_feature(zone_key: str, geometry: dict, zone_buckets: dict[str, list[int]], nom: str | None = None) -> dict:
+    props = {
+        "zone": zone_key,
+        "rupture_seconds": sum(v[0] for v in zone_buckets.values()),
+        "faible_seconds": sum(v[1] for v in zone_buckets.values()),
+        "buckets": zone_buckets,
+    }
+    if nom is not None:
+        props["nom"] = nom
+    return {"type": "Feature", "geometry": geometry, "properties": props}
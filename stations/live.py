@@ -0,0 +1,301 @@
+# stations/live.py
+"""
+Flux SSE des changements de stock : GET /api/stations/stream/
+
+- un Broadcaster par processus : une seule tâche asyncio lit le journal des
+  stations (stations/changes.py), charge une fois les lignes StationStatus
+  modifiées et les répartit dans la file de chaque client connecté ; elle est
+  réveillée aussitôt par une publication du même processus, sinon relit le
+  journal toutes les POLL_SECONDS (publications des autres workers)
+- filtres par client : region_id / cercle_id / commune_id, ou stations=1,2,3
+  (stations suivies)
+- heartbeat (commentaire SSE) toutes les HEARTBEAT_SECONDS : proxys et
+  répartiteurs ne coupent pas les connexions inactives
+- reprise : Last-Event-ID (ou ?last_event_id=) = séquence du journal ; le
+  client reçoit les stations modifiées depuis, ou un événement "reset"
+  (journal expiré, changement global) : il recharge alors stations_geojson
+- client trop lent (file pleine) : "reset" au lieu d'accumuler en mémoire
+
+Événements : "hello" (séquence courante), "stock" ({"seq", "stations": [...]}),
+"reset". Servi par le point d'entrée ASGI (core/asgi.py) seulement : un client
+inactif n'y coûte qu'une file asyncio, alors que sous WSGI il occuperait un
+worker sync jusqu'au timeout gunicorn. Sous WSGI la vue répond 503 avec l'URL
+du flux à recharger périodiquement (repli "poll").
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.wsgi import WSGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+
+from .changes import add_listener, changes_since, current_seq
+from .models import StationStatus
+from .params import as_int
+
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = 1.0
+HEARTBEAT_SECONDS = 15.0
+RETRY_MS = 5000
+QUEUE_SIZE = 64
+MAX_STATION_IDS = 500
+# repli sous WSGI : rechargement de stations_geojson
+POLL_FALLBACK_SECONDS = 60
+
+
+class StreamFilter:
+    def __init__(self, *, region_id=None, cercle_id=None, commune_id=None, station_ids=None):
+        self.region_id = region_id
+        self.cercle_id = cercle_id
+        self.commune_id = commune_id
+        self.station_ids = station_ids
+
+    def matches(self, keys: tuple) -> bool:
+        station_id, region_id, cercle_id, commune_id = keys
+        if self.station_ids is not None and station_id not in self.station_ids:
+            return False
+        if region_id is None and cercle_id is None and commune_id is None:
+            # station supprimée ou sans commune : zone inconnue, envoyée à tous
+            return True
+        if self.region_id and region_id != self.region_id:
+            return False
+        if self.cercle_id and cercle_id != self.cercle_id:
+            return False
+        if self.commune_id and commune_id != self.commune_id:
+            return False
+        return True
+
+
+def _event(name: str, seq: int, data: str) -> str:
+    return f"id: {seq}\nevent: {name}\ndata: {data}\n\n"
+
+
+def _reset_event(seq: int) -> str:
+    return _event("reset", seq, json.dumps({"seq": seq}))
+
+
+def render(flt: StreamFilter, seq: int, rows: list[tuple] | None) -> str | None:
+    """
+    Événement d'un client pour un lot ; rows=None => reset ; None si rien ne le concerne.
+    """
+    if rows is None:
+        return _reset_event(seq)
+    matching = [payload for keys, payload in rows if flt.matches(keys)]
+    if not matching:
+        return None
+    return _event("stock", seq, f'{{"seq":{seq},"stations":[{",".join(matching)}]}}')
+
+
+async def load_rows(station_ids: set[int]) -> list[tuple]:
+    """
+    [(clés de filtre, JSON de la station)] : sérialisé une fois pour tous les clients.
+    """
+    rows = []
+    found = set()
+    qs = StationStatus.objects.filter(station_id__in=station_ids).values_list(
+        "station_id", "region_id", "cercle_id", "commune_id",
+        "is_approved", "essence", "gasoil", "status", "derniere_maj",
+    )
+    async for sid, region_id, cercle_id, commune_id, approved, essence, gasoil, status, maj in qs:
+        found.add(sid)
+        payload = {
+            "id": sid,
+            "essence": essence,
+            "gasoil": gasoil,
+            "status": status,
+            "derniere_maj": maj.isoformat() if maj else None,
+        }
+        if not approved:
+            payload["hidden"] = True
+        rows.append(((sid, region_id, cercle_id, commune_id), json.dumps(payload, separators=(",", ":"))))
+
+    for sid in sorted(station_ids - found):
+        rows.append(((sid, None, None, None), json.dumps({"id": sid, "deleted": True}, separators=(",", ":"))))
+    return rows
+
+
+# -----------------------------
+# Diffusion
+# -----------------------------
+
+class Subscriber:
+    def __init__(self, flt: StreamFilter):
+        self.filter = flt
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.lagging = False
+        self.last_seq = 0
+
+    def offer(self, seq: int, rows: list[tuple] | None) -> None:
+        self.last_seq = seq
+        try:
+            self.queue.put_nowait((seq, rows))
+        except asyncio.QueueFull:
+            self.lagging = True
+
+
+class Broadcaster:
+    def __init__(self):
+        self.subscribers: set[Subscriber] = set()
+        self.seq: int | None = None
+        self._loop = None
+        self._task = None
+        self._wake: asyncio.Event | None = None
+
+    async def subscribe(self, flt: StreamFilter) -> Subscriber:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # nouvelle boucle (rechargement, tests) : l'état lié à l'ancienne est abandonné
+            self._loop, self._task, self._wake = loop, None, asyncio.Event()
+            self.subscribers = set()
+
+        sub = Subscriber(flt)
+        self.subscribers.add(sub)
+        if self._task is None or self._task.done():
+            self.seq = await sync_to_async(current_seq)()
+            self._task = loop.create_task(self._run())
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        self.subscribers.discard(sub)
+        if not self.subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def wake(self, seq: int | None = None) -> None:
+        """
+        Appelable depuis n'importe quel thread (écouteur du journal).
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self.subscribers:
+            return
+        loop.call_soon_threadsafe(self._wake.set)
+
+    def publish(self, seq: int, rows: list[tuple] | None) -> None:
+        for sub in list(self.subscribers):
+            sub.offer(seq, rows)
+
+    async def _run(self) -> None:
+        while self.subscribers:
+            try:
+                await asyncio.wait_for(self._wake.wait(), POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self._poll()
+            except Exception:
+                logger.exception("flux SSE : lecture du journal des stations en échec")
+
+    async def _poll(self) -> None:
+        cur, changed = await sync_to_async(changes_since)(self.seq)
+        if cur == self.seq:
+            return
+        self.seq = cur
+        if changed is None:
+            self.publish(cur, None)
+        elif changed:
+            self.publish(cur, await load_rows(changed))
+
+
+broadcaster = Broadcaster()
+add_listener(broadcaster.wake)
+
+
+# -----------------------------
+# Vue
+# -----------------------------
+
+def parse_filter(params) -> StreamFilter:
+    station_ids = None
+    raw = (params.get("stations") or "").strip()
+    if raw:
+        try:
+            station_ids = frozenset(int(x) for x in raw.split(",") if x.strip())
+        except ValueError:
+            raise ValueError("stations invalide (ids séparés par des virgules)")
+        if len(station_ids) > MAX_STATION_IDS:
+            raise ValueError(f"maximum {MAX_STATION_IDS} stations")
+    return StreamFilter(
+        region_id=as_int(params.get("region_id")),
+        cercle_id=as_int(params.get("cercle_id")),
+        commune_id=as_int(params.get("commune_id")),
+        station_ids=station_ids,
+    )
+
+
+async def _catch_up(flt: StreamFilter, last_event_id: int | None) -> tuple[int, str]:
+    if last_event_id is None:
+        cur = await sync_to_async(current_seq)()
+        return cur, _event("hello", cur, json.dumps({"seq": cur}))
+
+    cur, changed = await sync_to_async(changes_since)(last_event_id)
+    if changed is None:
+        return cur, _reset_event(cur)
+    rows = await load_rows(changed) if changed else []
+    return cur, render(flt, cur, rows) or _event("hello", cur, json.dumps({"seq": cur}))
+
+
+async def _stream(flt: StreamFilter, last_event_id: int | None):
+    sub = await broadcaster.subscribe(flt)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        start_seq, first = await _catch_up(flt, last_event_id)
+        yield first
+
+        while True:
+            try:
+                seq, rows = await asyncio.wait_for(sub.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+
+            if sub.lagging:
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                sub.lagging = False
+                yield _reset_event(sub.last_seq)
+                continue
+            if seq <= start_seq:
+                # déjà couvert par le rattrapage
+                continue
+
+            chunk = render(flt, seq, rows)
+            if chunk:
+                yield chunk
+    finally:
+        broadcaster.unsubscribe(sub)
+
+
+@require_GET
+async def stations_stream(request):
+    """
+    GET /api/stations/stream/?region_id=&cercle_id=&commune_id=&stations=1,2,3
+    Header optionnel : Last-Event-ID (reprise après reconnexion)
+    """
+    if isinstance(request, WSGIRequest):
+        response = JsonResponse({
+            "ok": False,
+            "error": "flux temps réel indisponible sur ce serveur",
+            "poll": {"url": reverse("stations_geojson"), "interval": POLL_FALLBACK_SECONDS},
+        }, status=503)
+        response["Cache-Control"] = "no-store"
+        return response
+
+    try:
+        flt = parse_filter(request.GET)
+    except ValueError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+
+    last_event_id = as_int(request.headers.get("Last-Event-ID") or request.GET.get("last_event_id"))
+
+    response = StreamingHttpResponse(_stream(flt, last_event_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # nginx / proxys : pas de mise en tampon du flux
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from stations.heatmap import prune_shortage_rollups, refresh_shortage_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Agrège le temps en rupture / faible par commune et cellule geohash "
+        "(incrémental, à lancer périodiquement via cron)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--prune", action="store_true", help="Supprime les tranches hors rétention")
+
+    def handle(self, *args, **options):
+        total_rows = 0
+        total_buckets = 0
+
+        while True:
+            res = refresh_shortage_rollups(batch_size=options["batch_size"])
+            total_rows += res["rows"]
+            total_buckets += res["buckets"]
+            if res["caught_up"]:
+                break
+
+        self.stdout.write(self.style.SUCCESS("Agrégation terminée"))
+        self.stdout.write(f"Historiques traités : {total_rows}")
+        self.stdout.write(f"Tranches mises à jour : {total_buckets}")
+
+        if options["prune"]:
+            deleted = prune_shortage_rollups()
+            self.stdout.write(f"Tranches supprimées : {deleted}")
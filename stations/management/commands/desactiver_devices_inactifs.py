@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from stations.devices import deactivate_inactive_devices, inactive_days, invalid_token_strikes
+
+
+class Command(BaseCommand):
+    help = (
+        "Désactive les devices muets depuis --jours jours ou dont les tokens FCM "
+        "ont été refusés --echecs fois, et leurs abonnements. Attend d'abord que les workers "
+        "écrivent leurs dates de visite (DEVICE_LAST_SEEN_FLUSH_SECONDS). À lancer périodiquement via cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--jours", type=int, default=inactive_days())
+        parser.add_argument("--echecs", type=int, default=invalid_token_strikes())
+        parser.add_argument("--dry-run", action="store_true", help="Compte sans rien modifier")
+
+    def handle(self, *args, **options):
+        res = deactivate_inactive_devices(
+            days=options["jours"], strikes=options["echecs"], dry_run=options["dry_run"],
+        )
+
+        self.stdout.write(self.style.SUCCESS("Simulation terminée" if options["dry_run"] else "Balayage terminé"))
+        self.stdout.write(f"Devices désactivés : {res['devices']}")
+        self.stdout.write(f"Abonnements désactivés : {res['follows']}")
@@ -6,6 +6,10 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 
 from stations.models import Region, Cercle, Commune, Station
+from stations.changes import notify_stations_changed
+from stations.search import refresh_search_text
+from stations.station_refs import invalidate_station_refs
+from stations.status import rebuild_station_status
 
 
 def clean(value):
@@ -97,6 +101,13 @@ class Command(BaseCommand):
             else:
                 not_attached.append(item)
 
+        # les rattachements passent par update() : recalcul de la recherche,
+        # invalidation des caches station
+        refresh_search_text()
+        invalidate_station_refs(*(item["id"] for item in station_backup))
+        rebuild_station_status()
+        notify_stations_changed()
+
         self.stdout.write(self.style.SUCCESS("Import terminé"))
         self.stdout.write(f"Régions créées : {created_regions}")
         self.stdout.write(f"Cercles créés : {created_cercles}")
@@ -1,23 +1,9 @@
 import json
 from django.core.management.base import BaseCommand
+from stations.codes import parse_niveau
 from stations.models import Region, Cercle, Commune, Station, Stock
 
 
-def map_niveau(val):
-    if not val:
-        return None
-    v = str(val).strip().lower()
-    if v in ["plein", "dispo", "disponible", "full"]:
-        return "plein"
-    if v in ["moyen"]:
-        return "moyen"
-    if v in ["bas", "faible", "low"]:
-        return "faible"
-    if v in ["rupture", "out"]:
-        return "rupture"
-    return None
-
-
 class Command(BaseCommand):
     help = "Import des stations depuis un JSON (UTF-8 ou UTF-8 BOM)"
 
@@ -74,8 +60,8 @@ class Command(BaseCommand):
             else:
                 updated += 1
 
-            essence = map_niveau(fields.get("essence_niveau"))
-            gasoil = map_niveau(fields.get("gasoil_niveau"))
+            essence = parse_niveau(fields.get("essence_niveau"))
+            gasoil = parse_niveau(fields.get("gasoil_niveau"))
 
             if essence:
                 Stock.objects.update_or_create(
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from stations.freshness import sweep_stale_stocks
+
+
+class Command(BaseCommand):
+    help = (
+        "Marque les stocks dont le dernier relevé dépasse le seuil du produit "
+        "(settings.STOCK_STALE_AFTER_HOURS). À lancer périodiquement via cron."
+    )
+
+    def handle(self, *args, **options):
+        res = sweep_stale_stocks()
+
+        self.stdout.write(self.style.SUCCESS("Balayage terminé"))
+        self.stdout.write(f"Stocks marqués obsolètes : {res['marked']}")
+        self.stdout.write(f"Stocks redevenus frais : {res['cleared']}")
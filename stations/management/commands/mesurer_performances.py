@@ -0,0 +1,131 @@
+import json
+import platform
+from datetime import datetime, timezone
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from stations.benchmark import (
+    compare_runs,
+    dataset_size,
+    measure_concurrency,
+    measure_startup,
+    purge_dataset,
+    run_benchmark,
+    seed_dataset,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure latence (percentiles), requêtes SQL, octets et pic mémoire des "
+        "chemins publics sur des jeux synthétiques (ex: --stations 1000 10000 100000). "
+        "Vide le cache : base et cache locaux uniquement."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stations", type=int, nargs="+", default=[1000],
+                            help="Tailles de jeu de données à mesurer (croissantes)")
+        parser.add_argument("--iterations", type=int, default=50, help="Appels à chaud par endpoint")
+        parser.add_argument("--history", type=int, default=5, help="Historiques de stock par station")
+        parser.add_argument("--endpoint", action="append", dest="only", help="Limiter à cet endpoint (répétable)")
+        parser.add_argument("--host", default="localhost", help="Host HTTP (doit être dans ALLOWED_HOSTS)")
+        parser.add_argument("--json", dest="json_path", help="Écrit les résultats en JSON dans ce fichier")
+        parser.add_argument("--compare", help="JSON d'une exécution précédente : échoue en cas de régression")
+        parser.add_argument("--tolerance", type=float, default=0.25, help="Écart p95 / octets toléré (0.25 = +25 %%)")
+        parser.add_argument("--purge", action="store_true", help="Supprime le jeu de données à la fin")
+        parser.add_argument("--demarrage", action="store_true",
+                            help="Mesure aussi le démarrage (worker WSGI, manage.py) dans des processus neufs")
+        parser.add_argument("--demarrage-seul", action="store_true", help="Ne mesure que le démarrage")
+        parser.add_argument("--concurrence", type=int, metavar="CLIENTS",
+                            help="Compare aussi gunicorn WSGI et ASGI sous CLIENTS clients simultanés "
+                                 "(sur le plus grand jeu de données)")
+        parser.add_argument("--concurrence-requetes", type=int, default=2000,
+                            help="Requêtes par mode pour --concurrence")
+        parser.add_argument("--workers", type=int, default=2, help="Workers gunicorn pour --concurrence")
+        parser.add_argument("--flux", type=int, default=0,
+                            help="Clients du flux SSE connectés pendant --concurrence (clients lents)")
+
+    def handle(self, *args, **options):
+        sizes = sorted(options["stations"])
+        run = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "database": connection.vendor,
+            "django": django.get_version(),
+            "python": platform.python_version(),
+            "iterations": options["iterations"],
+            "datasets": [],
+        }
+
+        if options["demarrage"] or options["demarrage_seul"]:
+            run["startup"] = measure_startup()
+            for r in run["startup"]:
+                heavy = ", ".join(r["heavy_modules"]) or "-"
+                self.stdout.write(f"{r['name']:<32}{r['median_ms']:>9.0f} ms (min {r['min_ms']:.0f})  modules lourds : {heavy}")
+            if options["demarrage_seul"]:
+                sizes = []
+
+        for size in sizes:
+            # jeu plus grand que demandé (exécution précédente) : on repart de zéro
+            if dataset_size() > size:
+                self.stdout.write(f"Purge du jeu existant ({dataset_size()} stations)")
+                purge_dataset()
+
+            self.stdout.write(f"Jeu de données : {size} stations")
+            seed_dataset(size, history_per_station=options["history"], log=self.stdout.write)
+
+            results = run_benchmark(iterations=options["iterations"], host=options["host"], only=options["only"])
+            run["datasets"].append({"stations": size, "results": results})
+            self._print_table(results)
+
+        if options["concurrence"]:
+            run["concurrency"] = measure_concurrency(
+                concurrency=options["concurrence"],
+                requests=options["concurrence_requetes"],
+                workers=options["workers"],
+                streams=options["flux"],
+                host=options["host"],
+            )
+            self._print_concurrency(run["concurrency"])
+
+        if options["purge"]:
+            deleted = purge_dataset()
+            self.stdout.write(f"Stations de test supprimées : {deleted}")
+
+        if options["json_path"]:
+            with open(options["json_path"], "w", encoding="utf-8") as f:
+                json.dump(run, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['json_path']}"))
+
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as f:
+                baseline = json.load(f)
+            regressions = compare_runs(baseline, run, tolerance=options["tolerance"])
+            if regressions:
+                raise CommandError("Régressions :\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("Aucune régression par rapport à la référence"))
+
+    def _print_table(self, results):
+        header = f"{'endpoint':<26}{'st':>4}{'octets':>10}{'froid':>9}{'p50':>8}{'p95':>8}{'p99':>8}{'req f/c':>9}{'pic Ko':>9}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for r in results:
+            self.stdout.write(
+                f"{r['endpoint']:<26}{r['status']:>4}{r['bytes']:>10}{r['cold_ms']:>9.1f}"
+                f"{r['p50_ms']:>8.1f}{r['p95_ms']:>8.1f}{r['p99_ms']:>8.1f}"
+                f"{str(r['cold_queries']) + '/' + str(r['warm_queries']):>9}{r['peak_kb']:>9.0f}"
+            )
+
+    def _print_concurrency(self, results):
+        header = f"{'mode':<8}{'workers':>8}{'clients':>9}{'flux':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'erreurs':>9}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for r in results:
+            if r.get("skipped"):
+                self.stdout.write(f"{r['mode']:<8}ignoré : {r['skipped']}")
+                continue
+            self.stdout.write(
+                f"{r['mode']:<8}{r['workers']:>8}{r['concurrency']:>9}{r['streams']:>6}{r['rps']:>9.0f}"
+                f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['errors']:>9}"
+            )
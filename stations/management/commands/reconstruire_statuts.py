@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from stations.changes import notify_stations_changed
+from stations.status import rebuild_station_status
+
+
+class Command(BaseCommand):
+    help = "Recalcule StationStatus (statuts, hiérarchie, coordonnées) pour toutes les stations"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        total = rebuild_station_status(batch_size=options["batch_size"])
+        notify_stations_changed()
+        self.stdout.write(self.style.SUCCESS(f"Statuts recalculés : {total}"))
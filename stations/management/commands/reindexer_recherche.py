@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from stations.search import refresh_search_text
+
+
+class Command(BaseCommand):
+    help = "Recalcule Station.search_text (nom, adresse, commune, cercle, région sans accents)"
+
+    def handle(self, *args, **options):
+        changed = refresh_search_text()
+        self.stdout.write(self.style.SUCCESS(f"Stations réindexées : {changed}"))
@@ -0,0 +1,55 @@
+# Generated by Django 6.0 on 2026-10-19 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0016_stockhistory_updated_by'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShortageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('h', 'Heure'), ('d', 'Jour')], max_length=1)),
+                ('bucket_start', models.DateTimeField()),
+                ('zone_type', models.CharField(choices=[('commune', 'Commune'), ('geohash', 'Geohash')], max_length=10)),
+                ('zone_key', models.CharField(max_length=20)),
+                ('produit', models.CharField(max_length=50)),
+                ('rupture_seconds', models.PositiveIntegerField(default=0)),
+                ('faible_seconds', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['granularity', 'zone_type', 'bucket_start'], name='stations_sh_granula_192618_idx')],
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'bucket_start', 'zone_type', 'zone_key', 'produit'), name='uniq_shortage_rollup_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShortageInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('produit', models.CharField(max_length=50)),
+                ('statut', models.CharField(max_length=20)),
+                ('since', models.DateTimeField()),
+                ('accounted_until', models.DateTimeField()),
+                ('station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shortage_intervals', to='stations.station')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['statut'], name='stations_sh_statut_481b6b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('station', 'produit'), name='uniq_shortage_interval_station_product')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-19 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0017_shortage_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='is_stale',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['date_maj'], name='stations_st_date_ma_b5c566_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['is_stale', 'station'], name='stations_st_is_stal_fd5007_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 6.0 on 2026-10-19 11:20
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _fold(value):
+    s = str(value or "").lower()
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(c for c in s if not unicodedata.combining(c))
+    return " ".join(re.split(r"[^a-z0-9]+", s)).strip()
+
+
+def fill_search_text(apps, schema_editor):
+    Station = apps.get_model("stations", "Station")
+
+    rows = Station.objects.values(
+        "id", "nom", "adresse",
+        "commune__nom", "commune__cercle__nom", "commune__cercle__region__nom",
+    )
+    batch = []
+    for r in rows.iterator(chunk_size=1000):
+        parts = [
+            r["nom"], r["adresse"],
+            r["commune__nom"], r["commune__cercle__nom"], r["commune__cercle__region__nom"],
+        ]
+        text = " ".join(_fold(p) for p in parts if p)[:500]
+        batch.append(Station(id=r["id"], search_text=text))
+
+    Station.objects.bulk_update(batch, ["search_text"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0018_stock_freshness'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='station',
+            name='search_text',
+            field=models.CharField(blank=True, default='', editable=False, max_length=500),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+    ]
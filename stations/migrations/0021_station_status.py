@@ -0,0 +1,113 @@
+# Generated by Django 6.0 on 2026-10-19 15:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _statut(niveau, is_stale):
+    if is_stale and getattr(settings, "STOCK_STALE_DOWNGRADE", True):
+        return "inconnu"
+    n = str(niveau or "").strip().lower()
+    if n == "rupture":
+        return "rupture"
+    if n in ("faible", "bas"):
+        return "faible"
+    if n == "plein":
+        return "dispo"
+    return "inconnu"
+
+
+def _global(essence, gasoil):
+    for s in ("rupture", "faible", "dispo"):
+        if s in (essence, gasoil):
+            return s
+    return "inconnu"
+
+
+def fill_station_status(apps, schema_editor):
+    Station = apps.get_model("stations", "Station")
+    Stock = apps.get_model("stations", "Stock")
+    StationStatus = apps.get_model("stations", "StationStatus")
+
+    by_station = {}
+    for sid, produit, niveau, is_stale, date_maj in Stock.objects.values_list(
+        "station_id", "produit", "niveau", "is_stale", "date_maj"
+    ).iterator(chunk_size=2000):
+        agg = by_station.setdefault(sid, {"essence": "inconnu", "gasoil": "inconnu", "stale": False, "derniere_maj": None})
+        if agg["derniere_maj"] is None or (date_maj and date_maj > agg["derniere_maj"]):
+            agg["derniere_maj"] = date_maj
+        if produit in ("essence", "gasoil"):
+            agg[produit] = _statut(niveau, is_stale)
+            agg["stale"] = agg["stale"] or bool(is_stale)
+
+    rows = Station.objects.values(
+        "id", "nom", "adresse", "latitude", "longitude", "is_approved",
+        "commune_id", "commune__nom",
+        "commune__cercle_id", "commune__cercle__nom",
+        "commune__cercle__region_id", "commune__cercle__region__nom",
+    )
+    batch = []
+    for r in rows.iterator(chunk_size=2000):
+        agg = by_station.get(r["id"]) or {}
+        essence = agg.get("essence", "inconnu")
+        gasoil = agg.get("gasoil", "inconnu")
+        batch.append(StationStatus(
+            station_id=r["id"],
+            nom=r["nom"],
+            adresse=r["adresse"],
+            latitude=r["latitude"],
+            longitude=r["longitude"],
+            is_approved=r["is_approved"],
+            region_id=r["commune__cercle__region_id"],
+            cercle_id=r["commune__cercle_id"],
+            commune_id=r["commune_id"],
+            region_nom=r["commune__cercle__region__nom"],
+            cercle_nom=r["commune__cercle__nom"],
+            commune_nom=r["commune__nom"],
+            essence=essence,
+            gasoil=gasoil,
+            status=_global(essence, gasoil),
+            has_stock=bool(agg),
+            stale=agg.get("stale", False),
+            derniere_maj=agg.get("derniere_maj"),
+        ))
+
+    StationStatus.objects.bulk_create(batch, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0019_station_search_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StationStatus',
+            fields=[
+                ('station', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='status_row', serialize=False, to='stations.station')),
+                ('nom', models.CharField(max_length=200)),
+                ('adresse', models.CharField(blank=True, max_length=255, null=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('is_approved', models.BooleanField(default=True)),
+                ('region_id', models.IntegerField(blank=True, null=True)),
+                ('cercle_id', models.IntegerField(blank=True, null=True)),
+                ('commune_id', models.IntegerField(blank=True, null=True)),
+                ('region_nom', models.CharField(blank=True, max_length=100, null=True)),
+                ('cercle_nom', models.CharField(blank=True, max_length=100, null=True)),
+                ('commune_nom', models.CharField(blank=True, max_length=100, null=True)),
+                ('essence', models.CharField(choices=[('dispo', 'Disponible'), ('faible', 'Faible'), ('rupture', 'Rupture'), ('inconnu', 'Inconnu')], default='inconnu', max_length=10)),
+                ('gasoil', models.CharField(choices=[('dispo', 'Disponible'), ('faible', 'Faible'), ('rupture', 'Rupture'), ('inconnu', 'Inconnu')], default='inconnu', max_length=10)),
+                ('status', models.CharField(choices=[('dispo', 'Disponible'), ('faible', 'Faible'), ('rupture', 'Rupture'), ('inconnu', 'Inconnu')], default='inconnu', max_length=10)),
+                ('has_stock', models.BooleanField(default=False)),
+                ('stale', models.BooleanField(default=False)),
+                ('derniere_maj', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['is_approved', 'status'], name='stations_st_is_appr_2936be_idx'), models.Index(fields=['latitude', 'longitude'], name='stations_st_latitud_6d0d33_idx'), models.Index(fields=['region_id'], name='stations_st_region__a3878d_idx'), models.Index(fields=['cercle_id'], name='stations_st_cercle__2d0ac9_idx'), models.Index(fields=['commune_id'], name='stations_st_commune_ca0293_idx')],
+            },
+        ),
+        migrations.RunPython(fill_station_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-19 15:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0021_station_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='devicefollow',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['station', 'produit'], name='devfollow_station_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inappnotification',
+            index=models.Index(fields=['station', 'created_at'], name='inapp_station_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='station',
+            index=models.Index(condition=models.Q(('is_approved', False)), fields=['-id'], name='station_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stationfollow',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['station', 'produit'], name='follow_station_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockhistory',
+            index=models.Index(fields=['station', '-date_maj'], name='stockhist_station_date_idx'),
+        ),
+    ]
@@ -0,0 +1,220 @@
+# Generated by Django 6.0 on 2026-10-19 15:40
+
+import logging
+
+import stations.codes
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+logger = logging.getLogger("stations.migrations")
+
+# (modèle, champ, nullable)
+FIELDS = [
+    ("stock", "produit", False),
+    ("stock", "niveau", False),
+    ("stockhistory", "produit", False),
+    ("stockhistory", "ancien_niveau", True),
+    ("stockhistory", "nouveau_niveau", False),
+    ("devicefollow", "produit", True),
+    ("stationfollow", "produit", True),
+]
+
+# unicité à rétablir après normalisation (deux anciennes valeurs peuvent donner
+# le même code) : la ligne la plus récente est gardée
+UNIQUE = {
+    "stock": (["station_id", "produit_code"], ["-date_maj", "-id"]),
+    "devicefollow": (["device_id", "station_id", "produit_code"], ["-created_at", "-id"]),
+    "stationfollow": (["user_id", "station_id", "produit_code"], ["-created_at", "-id"]),
+}
+
+# Copie figée de stations.codes à cette migration : une modification ultérieure
+# de codes.py ne change pas la conversion des anciennes lignes.
+PRODUIT_CODES = {"essence": 1, "gasoil": 2}
+NIVEAU_CODES = {"Plein": 1, "Bas": 2, "Faible": 3, "Rupture": 4}
+NIVEAU_ALIASES = {
+    "plein": "Plein", "dispo": "Plein", "disponible": "Plein", "full": "Plein",
+    "bas": "Bas", "moyen": "Bas",
+    "faible": "Faible", "low": "Faible",
+    "rupture": "Rupture", "out": "Rupture",
+}
+
+
+def parse_produit(raw: str | None) -> str | None:
+    if raw is None:
+        return None
+    if raw in PRODUIT_CODES:
+        return raw
+    s = raw.strip().lower()
+    if "gaso" in s or "diesel" in s:
+        return "gasoil"
+    if "ess" in s or "super" in s:
+        return "essence"
+    return None
+
+
+def parse_niveau(raw: str | None) -> str | None:
+    if raw is None:
+        return None
+    if raw in NIVEAU_CODES:
+        return raw
+    return NIVEAU_ALIASES.get(raw.strip().lower())
+
+
+def _parse(field):
+    return parse_produit if field == "produit" else parse_niveau
+
+
+def _codes(field):
+    return PRODUIT_CODES if field == "produit" else NIVEAU_CODES
+
+
+def forwards(apps, schema_editor):
+    for model_name, field, nullable in FIELDS:
+        Model = apps.get_model("stations", model_name)
+        parse, codes = _parse(field), _codes(field)
+        unknown = []
+        # un UPDATE par valeur distincte (quelques dizaines au plus)
+        for raw in Model.objects.order_by().values_list(field, flat=True).distinct():
+            value = parse(raw)
+            if value is not None:
+                Model.objects.filter(**{field: raw}).update(**{f"{field}_code": codes[value]})
+            elif raw is not None:
+                unknown.append(raw)
+
+        if not nullable:
+            # produit / niveau inconnu : la ligne n'est pas représentable
+            rows = Model.objects.filter(**{f"{field}_code__isnull": True})
+        elif field == "produit":
+            # abonnement : NULL = tous les produits ; une valeur inconnue ne l'élargit pas
+            rows = Model.objects.filter(**{f"{field}__in": unknown})
+        else:
+            # ancien niveau illisible : laissé NULL (inconnu), rien n'est élargi
+            rows = Model.objects.none()
+        deleted, _ = rows.delete()
+        if unknown or deleted:
+            logger.warning(
+                "%s.%s : valeurs inconnues %r, %d ligne(s) supprimée(s)", model_name, field, sorted(unknown), deleted,
+            )
+
+    for model_name, (keys, latest) in UNIQUE.items():
+        Model = apps.get_model("stations", model_name)
+        dupes = (
+            Model.objects.filter(produit_code__isnull=False)
+            .values(*keys).order_by()
+            .annotate(n=Count("id")).filter(n__gt=1)
+        )
+        for d in dupes:
+            rows = Model.objects.filter(**{k: d[k] for k in keys})
+            keep = rows.order_by(*latest).values_list("id", flat=True)[0]
+            rows.exclude(id=keep).delete()
+
+
+def backwards(apps, schema_editor):
+    for model_name, field, _ in FIELDS:
+        Model = apps.get_model("stations", model_name)
+        for value, code in _codes(field).items():
+            Model.objects.filter(**{f"{field}_code": code}).update(**{field: value})
+
+
+def _code_column(nullable):
+    return models.PositiveSmallIntegerField(blank=nullable, null=True)
+
+
+def _nullable_old_column(model_name, field):
+    # ancienne colonne texte rendue nullable avant sa suppression : le retour
+    # arrière la recrée vide puis la remplit (backwards) avant NOT NULL
+    max_length = 50 if field == "produit" else 20
+    choices = (
+        [('essence', 'Essence'), ('gasoil', 'Gasoil')] if (model_name, field) == ("stock", "produit")
+        else [('Bas', 'Bas'), ('Faible', 'Faible'), ('Plein', 'Plein'), ('Rupture', 'Rupture')] if model_name == "stock"
+        else None
+    )
+    return models.CharField(max_length=max_length, choices=choices, null=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0022_hot_filter_indexes'),
+    ]
+
+    operations = [
+        *[
+            migrations.AddField(model_name=model_name, name=f"{field}_code", field=_code_column(nullable))
+            for model_name, field, nullable in FIELDS
+        ],
+        *[
+            migrations.AlterField(model_name=model_name, name=field, field=_nullable_old_column(model_name, field))
+            for model_name, field, nullable in FIELDS
+            if not nullable
+        ],
+        migrations.RunPython(forwards, backwards),
+
+        migrations.AlterUniqueTogether(name='stock', unique_together=set()),
+        migrations.RemoveConstraint(model_name='devicefollow', name='uniq_follow_device_station_product'),
+        migrations.RemoveConstraint(model_name='stationfollow', name='uniq_follow_user_station_product'),
+        migrations.RemoveIndex(model_name='devicefollow', name='devfollow_station_active_idx'),
+        migrations.RemoveIndex(model_name='stationfollow', name='follow_station_active_idx'),
+
+        *[
+            op
+            for model_name, field, nullable in FIELDS
+            for op in (
+                migrations.RemoveField(model_name=model_name, name=field),
+                migrations.RenameField(model_name=model_name, old_name=f"{field}_code", new_name=field),
+            )
+        ],
+        migrations.AlterField(
+            model_name='stock',
+            name='produit',
+            field=stations.codes.ProduitField(choices=[('essence', 'Essence'), ('gasoil', 'Gasoil')]),
+        ),
+        migrations.AlterField(
+            model_name='stock',
+            name='niveau',
+            field=stations.codes.NiveauField(choices=[('Bas', 'Bas'), ('Faible', 'Faible'), ('Plein', 'Plein'), ('Rupture', 'Rupture')]),
+        ),
+        migrations.AlterField(
+            model_name='stockhistory',
+            name='produit',
+            field=stations.codes.ProduitField(choices=[('essence', 'Essence'), ('gasoil', 'Gasoil')]),
+        ),
+        migrations.AlterField(
+            model_name='stockhistory',
+            name='ancien_niveau',
+            field=stations.codes.NiveauField(blank=True, choices=[('Bas', 'Bas'), ('Faible', 'Faible'), ('Plein', 'Plein'), ('Rupture', 'Rupture')], null=True),
+        ),
+        migrations.AlterField(
+            model_name='stockhistory',
+            name='nouveau_niveau',
+            field=stations.codes.NiveauField(choices=[('Bas', 'Bas'), ('Faible', 'Faible'), ('Plein', 'Plein'), ('Rupture', 'Rupture')]),
+        ),
+        migrations.AlterField(
+            model_name='devicefollow',
+            name='produit',
+            field=stations.codes.ProduitField(blank=True, choices=[('essence', 'Essence'), ('gasoil', 'Gasoil')], null=True),
+        ),
+        migrations.AlterField(
+            model_name='stationfollow',
+            name='produit',
+            field=stations.codes.ProduitField(blank=True, choices=[('essence', 'Essence'), ('gasoil', 'Gasoil')], null=True),
+        ),
+
+        migrations.AlterUniqueTogether(name='stock', unique_together={('station', 'produit')}),
+        migrations.AddConstraint(
+            model_name='devicefollow',
+            constraint=models.UniqueConstraint(fields=('device', 'station', 'produit'), name='uniq_follow_device_station_product'),
+        ),
+        migrations.AddConstraint(
+            model_name='stationfollow',
+            constraint=models.UniqueConstraint(fields=('user', 'station', 'produit'), name='uniq_follow_user_station_product'),
+        ),
+        migrations.AddIndex(
+            model_name='devicefollow',
+            index=models.Index(condition=Q(('is_active', True)), fields=['station', 'produit'], name='devfollow_station_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stationfollow',
+            index=models.Index(condition=Q(('is_active', True)), fields=['station', 'produit'], name='follow_station_active_idx'),
+        ),
+    ]
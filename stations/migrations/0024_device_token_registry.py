@@ -0,0 +1,110 @@
+# Generated by Django 6.0 on 2026-10-19 15:55
+
+import hashlib
+
+from django.db import migrations, models
+
+# device_id de remplissage de notifications 0003 : token rattaché à aucun device
+PLACEHOLDER_DEVICE_IDS = {"", "legacy-device"}
+
+
+def _hash(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _sort_key(candidate):
+    seen_at, _, _ = candidate
+    return (seen_at is not None, seen_at or 0)
+
+
+def merge_tokens(apps, schema_editor):
+    """
+    Fusionne Device.fcm_token et notifications.DeviceToken : un token par
+    device, un device par token ; en cas de conflit, l'enregistrement le plus
+    récent l'emporte.
+    """
+    Device = apps.get_model("stations", "Device")
+    DeviceToken = apps.get_model("notifications", "DeviceToken")
+
+    # (date, device_id, token)
+    candidates = [
+        (seen_at, device_id, token.strip())
+        for seen_at, device_id, token in Device.objects.exclude(fcm_token__isnull=True)
+        .values_list("last_seen_at", "device_id", "fcm_token")
+        if token.strip()
+    ]
+
+    known = set(Device.objects.values_list("device_id", flat=True))
+    new_devices = {}
+    for updated_at, device_id, token, platform in DeviceToken.objects.values_list(
+        "updated_at", "device_id", "token", "platform",
+    ):
+        device_id = (device_id or "").strip()
+        token = (token or "").strip()
+        # sans device, aucun abonnement ne peut cibler le token
+        if not token or device_id in PLACEHOLDER_DEVICE_IDS or len(device_id) > 64:
+            continue
+        candidates.append((updated_at, device_id, token))
+        if device_id not in known:
+            new_devices[device_id] = (platform or "android")[:30]
+
+    Device.objects.bulk_create([
+        Device(device_id=device_id, platform=platform) for device_id, platform in new_devices.items()
+    ])
+
+    token_of = {}  # device_id -> token
+    holder = {}  # empreinte -> device_id
+    for _, device_id, token in sorted(candidates, key=_sort_key):
+        previous = token_of.get(device_id)
+        if previous is not None and holder.get(_hash(previous)) == device_id:
+            del holder[_hash(previous)]
+        digest = _hash(token)
+        if digest in holder:
+            token_of[holder[digest]] = None
+        token_of[device_id] = token
+        holder[digest] = device_id
+
+    Device.objects.update(fcm_token=None, fcm_token_hash=None)
+    devices = list(Device.objects.filter(device_id__in=[d for d, t in token_of.items() if t]))
+    for device in devices:
+        device.fcm_token = token_of[device.device_id]
+        device.fcm_token_hash = _hash(device.fcm_token)
+    Device.objects.bulk_update(devices, ["fcm_token", "fcm_token_hash"], batch_size=500)
+
+
+def split_tokens(apps, schema_editor):
+    Device = apps.get_model("stations", "Device")
+    DeviceToken = apps.get_model("notifications", "DeviceToken")
+
+    DeviceToken.objects.bulk_create([
+        DeviceToken(device_id=device_id, token=token, platform=platform[:20])
+        for device_id, token, platform in Device.objects.exclude(fcm_token__isnull=True)
+        .values_list("device_id", "fcm_token", "platform")
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_notificationspan'),
+        ('stations', '0023_produit_niveau_codes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='fcm_token_hash',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(merge_tokens, split_tokens),
+        migrations.AlterField(
+            model_name='device',
+            name='fcm_token',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='device',
+            name='fcm_token_hash',
+            field=models.CharField(editable=False, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0024_device_token_registry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='token_failures',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-19 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0025_device_token_failures'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devicefollow',
+            name='deactivated_by_sweep',
+            field=models.BooleanField(default=False),
+        ),
+    ]
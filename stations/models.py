@@ -1,7 +1,12 @@
+import hashlib
+
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from django.db.models import UniqueConstraint
+from django.db.models import Q, UniqueConstraint
+
+from . import codes
+from .codes import NiveauField, ProduitField
 
 User = get_user_model()
 
@@ -78,8 +83,15 @@ class Station(models.Model):
     # Validation admin avant affichage public
     is_approved = models.BooleanField(default=True)
 
+    # "nom adresse commune cercle région" sans accents (stations/search.py)
+    search_text = models.CharField(max_length=500, blank=True, default="", editable=False)
+
     class Meta:
         ordering = ["commune__cercle__region__nom", "commune__nom", "nom"]
+        indexes = [
+            # file de validation admin (stations/views.py) : index partiel, quelques lignes
+            models.Index(fields=["-id"], condition=Q(is_approved=False), name="station_pending_idx"),
+        ]
 
     def __str__(self):
         return self.nom
@@ -90,34 +102,42 @@ class Station(models.Model):
 # -----------------
 
 class Stock(models.Model):
-    NIVEAUX = [
-        ("Bas", "Bas"),
-        ("Faible", "Faible"),
-        ("Plein", "Plein"),
-        ("Rupture", "Rupture"),
-    ]
-
-    PRODUITS = [
-        ("essence", "Essence"),
-        ("gasoil", "Gasoil"),
-    ]
+    NIVEAUX = codes.NIVEAUX
+    PRODUITS = codes.PRODUITS
 
     station = models.ForeignKey(
         Station,
         on_delete=models.CASCADE,
         related_name="stocks",
     )
-    produit = models.CharField(max_length=50, choices=PRODUITS)
-    niveau = models.CharField(max_length=20, choices=NIVEAUX)
+    # codes entiers en base, "essence" / "Plein" côté Python (stations/codes.py)
+    produit = ProduitField(choices=PRODUITS)
+    niveau = NiveauField(choices=NIVEAUX)
     date_maj = models.DateTimeField(auto_now=True)
 
+    # Marqué par le balayage périodique (stations/freshness.py) quand date_maj
+    # dépasse le seuil du produit ; remis à False à chaque enregistrement.
+    is_stale = models.BooleanField(default=False)
+
     class Meta:
         ordering = ["-date_maj"]
         unique_together = ("station", "produit")  # un stock par produit
+        indexes = [
+            models.Index(fields=["date_maj"]),
+            models.Index(fields=["is_stale", "station"]),
+        ]
 
     def __str__(self):
         return f"{self.station.nom} - {self.produit} ({self.niveau})"
 
+    def save(self, *args, **kwargs):
+        # date_maj est auto_now : tout enregistrement est un relevé frais
+        self.is_stale = False
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "is_stale" not in update_fields:
+            kwargs["update_fields"] = list(update_fields) + ["is_stale"]
+        super().save(*args, **kwargs)
+
 
 # -----------------
 # HISTORIQUE DU STOCK
@@ -129,9 +149,9 @@ class StockHistory(models.Model):
         on_delete=models.CASCADE,
         related_name="historique_stocks",
     )
-    produit = models.CharField(max_length=50)
-    ancien_niveau = models.CharField(max_length=20, blank=True, null=True)
-    nouveau_niveau = models.CharField(max_length=20)
+    produit = ProduitField(choices=codes.PRODUITS)
+    ancien_niveau = NiveauField(choices=codes.NIVEAUX, blank=True, null=True)
+    nouveau_niveau = NiveauField(choices=codes.NIVEAUX)
 
     updated_by = models.ForeignKey(
         User,
@@ -145,24 +165,79 @@ class StockHistory(models.Model):
 
     class Meta:
         ordering = ["-date_maj"]
+        indexes = [
+            # historique d'une station, plus récent d'abord
+            models.Index(fields=["station", "-date_maj"], name="stockhist_station_date_idx"),
+        ]
 
     def __str__(self):
         return f"{self.station.nom} - {self.produit} : {self.nouveau_niveau}"
 
+
+# -----------------
+# STATUT DÉNORMALISÉ (lecture carte / KPIs)
+# -----------------
+
+class StationStatus(models.Model):
+    """
+    Projection 1 ligne par station : statuts essence/gasoil (obsolescence déjà
+    appliquée), statut global, dernière mise à jour, hiérarchie et coordonnées.
+    Tenue à jour dans la transaction de chaque écriture Station / Stock
+    (stations/status.py) ; `manage.py reconstruire_statuts` la recalcule entièrement.
+    """
+    STATUTS = [
+        ("dispo", "Disponible"),
+        ("faible", "Faible"),
+        ("rupture", "Rupture"),
+        ("inconnu", "Inconnu"),
+    ]
+
+    station = models.OneToOneField(Station, on_delete=models.CASCADE, primary_key=True, related_name="status_row")
+    nom = models.CharField(max_length=200)
+    adresse = models.CharField(max_length=255, blank=True, null=True)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    is_approved = models.BooleanField(default=True)
+
+    # ids sans clé étrangère : lecture sans jointure
+    region_id = models.IntegerField(blank=True, null=True)
+    cercle_id = models.IntegerField(blank=True, null=True)
+    commune_id = models.IntegerField(blank=True, null=True)
+    region_nom = models.CharField(max_length=100, blank=True, null=True)
+    cercle_nom = models.CharField(max_length=100, blank=True, null=True)
+    commune_nom = models.CharField(max_length=100, blank=True, null=True)
+
+    essence = models.CharField(max_length=10, choices=STATUTS, default="inconnu")
+    gasoil = models.CharField(max_length=10, choices=STATUTS, default="inconnu")
+    status = models.CharField(max_length=10, choices=STATUTS, default="inconnu")
+    has_stock = models.BooleanField(default=False)
+    stale = models.BooleanField(default=False)
+    derniere_maj = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["is_approved", "status"]),
+            models.Index(fields=["latitude", "longitude"]),
+            models.Index(fields=["region_id"]),
+            models.Index(fields=["cercle_id"]),
+            models.Index(fields=["commune_id"]),
+        ]
+
+    def __str__(self):
+        return f"{self.nom} ({self.status})"
+
+
 class StationFollow(models.Model):
     """
     Un utilisateur suit une station et choisit sur quel(s) produit(s) il veut être notifié.
     """
-    PRODUITS = [
-        ("essence", "Essence"),
-        ("gasoil", "Gasoil"),
-    ]
+    PRODUITS = codes.PRODUITS
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="station_follows")
     station = models.ForeignKey(Station, on_delete=models.CASCADE, related_name="followers")
 
     # Si vide => on notifie pour les 2 produits
-    produit = models.CharField(max_length=50, choices=PRODUITS, blank=True, null=True)
+    produit = ProduitField(choices=PRODUITS, blank=True, null=True)
 
     notify_on_levels = models.CharField(
         max_length=50,
@@ -179,6 +254,10 @@ class StationFollow(models.Model):
         constraints = [
             UniqueConstraint(fields=["user", "station", "produit"], name="uniq_follow_user_station_product")
         ]
+        indexes = [
+            # abonnés actifs d'une station (notify_stock_events, follow_counts)
+            models.Index(fields=["station", "produit"], condition=Q(is_active=True), name="follow_station_active_idx"),
+        ]
 
     def __str__(self):
         p = self.produit if self.produit else "tous"
@@ -202,46 +281,157 @@ class InAppNotification(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # anti-spam de notify_stock_events : notifications récentes des stations
+            models.Index(fields=["station", "created_at"], name="inapp_station_created_idx"),
+        ]
 
     def __str__(self):
         return self.title
 
 
+def fcm_token_hash(token: str | None) -> str | None:
+    """
+    Empreinte sha256 (64 caractères hexadécimaux) d'un token FCM, None si vide.
+    """
+    token = (token or "").strip()
+    return hashlib.sha256(token.encode("utf-8")).hexdigest() if token else None
+
+
 class Device(models.Model):
     """
     Appareil (mobile) identifié sans compte utilisateur.
+
+    Seul registre des tokens FCM : un token n'appartient qu'à un device
+    (unicité sur son empreinte fcm_token_hash, colonne de largeur fixe servant
+    aussi aux recherches et au nettoyage des tokens invalides).
+
+    token_failures : tokens refusés par FCM depuis la dernière réactivation ;
+    au-delà d'un seuil, le device est désactivé (stations/devices.py).
     """
     device_id = models.CharField(max_length=64, unique=True, db_index=True)
-    fcm_token = models.CharField(max_length=255, blank=True, null=True, db_index=True)
+    fcm_token = models.CharField(max_length=255, blank=True, null=True)
+    fcm_token_hash = models.CharField(max_length=64, unique=True, null=True, editable=False)
     platform = models.CharField(max_length=30, default="android")
     is_active = models.BooleanField(default=True)
+    token_failures = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     last_seen_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.device_id} ({self.platform})"
 
+    def save(self, *args, **kwargs):
+        # empreinte toujours alignée sur le token (admin, update_or_create...)
+        self.fcm_token = (self.fcm_token or "").strip() or None
+        self.fcm_token_hash = fcm_token_hash(self.fcm_token)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "fcm_token" in update_fields and "fcm_token_hash" not in update_fields:
+            kwargs["update_fields"] = list(update_fields) + ["fcm_token_hash"]
+        super().save(*args, **kwargs)
+
 
 class DeviceFollow(models.Model):
     """
     Un appareil suit une station (optionnel: par produit).
     """
-    PRODUITS = [
-        ("essence", "Essence"),
-        ("gasoil", "Gasoil"),
-    ]
+    PRODUITS = codes.PRODUITS
 
     device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name="station_follows")
     station = models.ForeignKey(Station, on_delete=models.CASCADE, related_name="device_followers")
-    produit = models.CharField(max_length=50, choices=PRODUITS, blank=True, null=True)  # null => tous
+    produit = ProduitField(choices=PRODUITS, blank=True, null=True)  # null => tous
     is_active = models.BooleanField(default=True)
+    # désactivé avec son device par desactiver_devices_inactifs : rétabli quand le device revient
+    deactivated_by_sweep = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         constraints = [
             UniqueConstraint(fields=["device", "station", "produit"], name="uniq_follow_device_station_product")
         ]
+        indexes = [
+            # abonnés actifs d'une station (notify_stock_events, follow_counts)
+            models.Index(fields=["station", "produit"], condition=Q(is_active=True), name="devfollow_station_active_idx"),
+        ]
 
     def __str__(self):
         p = self.produit if self.produit else "tous"
         return f"{self.device} suit {self.station} ({p})"
+
+
+# -----------------
+# AGRÉGATS RUPTURES (heatmap)
+# -----------------
+
+class RollupCursor(models.Model):
+    """
+    Curseur d'un job d'agrégation incrémental : dernier StockHistory.id traité.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
+
+
+class ShortageInterval(models.Model):
+    """
+    Dernier niveau connu (station, produit) et jusqu'où son temps a déjà été
+    compté dans ShortageRollup. Permet de reprendre l'agrégation sans relire
+    l'historique.
+    """
+    station = models.ForeignKey(Station, on_delete=models.CASCADE, related_name="shortage_intervals")
+    produit = models.CharField(max_length=50)
+    statut = models.CharField(max_length=20)  # dispo / faible / rupture / inconnu
+    since = models.DateTimeField()
+    accounted_until = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=["station", "produit"], name="uniq_shortage_interval_station_product")
+        ]
+        indexes = [
+            models.Index(fields=["statut"]),
+        ]
+
+    def __str__(self):
+        return f"{self.station_id} - {self.produit} ({self.statut})"
+
+
+class ShortageRollup(models.Model):
+    """
+    Temps (secondes) passé en rupture / faible, par zone et par tranche de temps.
+    - zone_type="commune" -> zone_key = id de la commune
+    - zone_type="geohash" -> zone_key = cellule geohash
+    """
+    GRANULARITES = [
+        ("h", "Heure"),
+        ("d", "Jour"),
+    ]
+    ZONES = [
+        ("commune", "Commune"),
+        ("geohash", "Geohash"),
+    ]
+
+    granularity = models.CharField(max_length=1, choices=GRANULARITES)
+    bucket_start = models.DateTimeField()
+    zone_type = models.CharField(max_length=10, choices=ZONES)
+    zone_key = models.CharField(max_length=20)
+    produit = models.CharField(max_length=50)
+    rupture_seconds = models.PositiveIntegerField(default=0)
+    faible_seconds = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=["granularity", "bucket_start", "zone_type", "zone_key", "produit"],
+                name="uniq_shortage_rollup_bucket",
+            )
+        ]
+        indexes = [
+            models.Index(fields=["granularity", "zone_type", "bucket_start"]),
+        ]
+
+    def __str__(self):
+        return f"{self.zone_type}:{self.zone_key} {self.bucket_start:%Y-%m-%d %H:%M} ({self.produit})"
@@ -0,0 +1,121 @@
+# stations/mvt.py
+"""
+Encodeur Mapbox Vector Tile (spec v2.1) minimal, sans dépendance protobuf.
+
+Seules les géométries POINT sont gérées (une station = un point).
+Référence: https://github.com/mapbox/vector-tile-spec/tree/master/2.1
+"""
+from __future__ import annotations
+
+import math
+import struct
+
+EXTENT = 4096
+
+# types protobuf
+_VARINT = 0
+_LEN = 2
+
+# Feature.type
+_POINT = 1
+# commande MoveTo, 1 point : (1 & 0x7) | (1 << 3)
+_MOVE_TO_1 = 9
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+
+def _zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+
+def _tag(field: int, wire: int) -> bytes:
+    return _varint((field << 3) | wire)
+
+
+def _bytes_field(field: int, payload: bytes) -> bytes:
+    return _tag(field, _LEN) + _varint(len(payload)) + payload
+
+
+def _uint_field(field: int, n: int) -> bytes:
+    return _tag(field, _VARINT) + _varint(n)
+
+
+def _packed(field: int, values: list[int]) -> bytes:
+    return _bytes_field(field, b"".join(_varint(v) for v in values))
+
+
+def _value(v) -> bytes:
+    # message Value : string=1, double=3, uint64=5, sint64=6, bool=7
+    if isinstance(v, bool):
+        return _uint_field(7, int(v))
+    if isinstance(v, int):
+        if v >= 0:
+            return _uint_field(5, v)
+        return _uint_field(6, _zigzag(v))
+    if isinstance(v, float):
+        return _tag(3, 1) + struct.pack("<d", v)
+    return _bytes_field(1, str(v).encode("utf-8"))
+
+
+def lnglat_to_tile_px(lng: float, lat: float, z: int, x: int, y: int, extent: int = EXTENT) -> tuple[int, int]:
+    """
+    Position (web-mercator) en coordonnées de tuile, origine en haut à gauche.
+    """
+    n = 1 << z
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    gx = (lng + 180.0) / 360.0 * n
+    rad = math.radians(lat)
+    gy = (1.0 - math.log(math.tan(rad) + 1.0 / math.cos(rad)) / math.pi) / 2.0 * n
+    return int(round((gx - x) * extent)), int(round((gy - y) * extent))
+
+
+def encode_layer(name: str, features: list[dict], extent: int = EXTENT) -> bytes:
+    """
+    features: [{"id": int, "px": (x, y), "properties": {...}}]
+    Les clés et valeurs de propriétés sont dédupliquées dans la couche.
+    """
+    keys: dict[str, int] = {}
+    values: dict[tuple[type, object], int] = {}
+    encoded = []
+
+    for f in features:
+        tags = []
+        for k, v in f["properties"].items():
+            if v is None:
+                continue
+            ki = keys.setdefault(k, len(keys))
+            vi = values.setdefault((type(v), v), len(values))
+            tags += (ki, vi)
+
+        px, py = f["px"]
+        body = b""
+        if f.get("id") is not None:
+            body += _uint_field(1, int(f["id"]))
+        body += _packed(2, tags)
+        body += _uint_field(3, _POINT)
+        body += _packed(4, [_MOVE_TO_1, _zigzag(px), _zigzag(py)])
+        encoded.append(_bytes_field(2, body))
+
+    layer = _uint_field(15, 2) + _bytes_field(1, name.encode("utf-8"))
+    layer += b"".join(encoded)
+    layer += b"".join(_bytes_field(3, k.encode("utf-8")) for k in keys)
+    layer += b"".join(_bytes_field(4, _value(v)) for (_, v) in values)
+    layer += _uint_field(5, extent)
+    return layer
+
+
+def encode_tile(layers: dict[str, list[dict]], extent: int = EXTENT) -> bytes:
+    """
+    Tuile = suite de couches (champ 3 du message Tile).
+    """
+    return b"".join(_bytes_field(3, encode_layer(name, feats, extent)) for name, feats in layers.items())
@@ -1,10 +1,148 @@
 # stations/notifications.py
 from __future__ import annotations
 
+import uuid
+from datetime import timedelta
+
 from django.db.models import Q
+from django.utils import timezone
+
+from .codes import PLEIN, parse_niveau
+from .models import DeviceFollow, InAppNotification, Station, StationFollow, Stock
+from notifications.tracing import span
+from notifications.utils import send_fcm_batch, send_push_to_device_follows
+
+
+def _is_plein(niveau: str | None) -> bool:
+    return parse_niveau(niveau) == PLEIN
+
+
+def station_location_label(station) -> str:
+    location = station.nom
+
+    if station.commune:
+        location += f", {station.commune.nom}"
+
+        if station.commune.cercle and station.commune.cercle.region:
+            location += f" ({station.commune.cercle.region.nom})"
+
+    return location
+
+
+def _in_app_notification(*, user_id: int, station: Station, produit: str, niveau: str) -> InAppNotification:
+    title = "Carburant disponible" if _is_plein(niveau) else "Stock mis à jour"
+    location = station_location_label(station)
+    message = f"{location} : {str(produit).capitalize()} → {niveau}"
+
+    # Clé anti-doublon "soft" (1 notif max / minute / user / station / produit / niveau)
+    minute_key = timezone.now().strftime("%Y%m%d%H%M")
+    event_key = f"{user_id}:{station.id}:{produit}:{niveau}:{minute_key}"
+
+    return InAppNotification(
+        user_id=user_id,
+        station=station,
+        produit=produit,
+        title=title,
+        message=message,
+        event_key=event_key,
+    )
 
-from .models import Stock, DeviceFollow
-from notifications.utils import send_push_to_device_follows
+
+def _follow_matches(follow_produit: str | None, produit: str) -> bool:
+    # follow sans produit => tous les produits ; valeurs canoniques (stations/codes.py)
+    return follow_produit is None or follow_produit == produit
+
+
+def notify_stock_events(events: list[dict]) -> dict:
+    """
+    Diffusion groupée des passages à "Plein".
+    events = [{"station": Station, "produit": "essence", "niveau": "Plein", "event_id": "..."}]
+    (valeurs canoniques ; event_id généré s'il manque)
+
+    Chaque événement garde son event_id (payload FCM "event_id", span "event") ;
+    les étapes communes sont tracées dans la trace de l'appelant
+    (apply_stock_updates), s'il y en a une.
+
+    - anti-spam (même station/produit/niveau < 10 min) : 1 requête
+    - follows utilisateurs + notifications in-app : 1 requête + 1 bulk insert
+    - follows devices : 1 requête, puis send_fcm_batch (tokens en 1 requête)
+    """
+    if not events:
+        return {"ok": True, "events": 0, "sent": 0, "fail": 0, "token_count": 0}
+
+    station_ids = {e["station"].id for e in events}
+
+    with span("spam_guard", events=len(events)) as attrs:
+        ten_min_ago = timezone.now() - timedelta(minutes=10)
+        recent = list(
+            InAppNotification.objects.filter(station_id__in=station_ids, created_at__gte=ten_min_ago)
+            .order_by()
+            .values_list("station_id", "produit", "message")
+        )
+
+        def _spam_guard(e) -> bool:
+            return any(
+                sid == e["station"].id and produit == e["produit"] and f"→ {e['niveau']}".lower() in (message or "").lower()
+                for sid, produit, message in recent
+            )
+
+        events = [e for e in events if not _spam_guard(e)]
+        attrs["kept"] = len(events)
+    if not events:
+        return {"ok": True, "events": 0, "sent": 0, "fail": 0, "token_count": 0}
+
+    station_ids = {e["station"].id for e in events}
+
+    with span("followers") as attrs:
+        user_follows = list(
+            StationFollow.objects.filter(station_id__in=station_ids, is_active=True)
+            .values_list("user_id", "station_id", "produit")
+        )
+        device_follows = list(
+            DeviceFollow.objects.filter(station_id__in=station_ids, is_active=True)
+            .values_list("device__device_id", "station_id", "produit")
+        )
+        attrs.update(users=len(user_follows), devices=len(device_follows))
+
+    in_app = []
+    messages = []
+    for e in events:
+        station = e["station"]
+        produit = e["produit"]
+        event_id = e.get("event_id") or uuid.uuid4().hex
+
+        with span("event", event_id=event_id, station_id=station.id, produit=produit) as attrs:
+            user_ids = sorted({
+                uid for uid, sid, p in user_follows
+                if sid == station.id and _follow_matches(p, produit)
+            })
+            for uid in user_ids:
+                in_app.append(_in_app_notification(user_id=uid, station=station, produit=produit, niveau=e["niveau"]))
+
+            device_ids = sorted({
+                did for did, sid, p in device_follows
+                if did and sid == station.id and _follow_matches(p, produit)
+            })
+            if device_ids:
+                messages.append({
+                    "device_ids": device_ids,
+                    "title": "Carburant disponible",
+                    "body": f"{station_location_label(station)} : {produit.capitalize()} → {e['niveau']}",
+                    "data": {
+                        "station_id": str(station.id),
+                        "produit": produit,
+                        "niveau": e["niveau"],
+                        "event_id": event_id,
+                    },
+                })
+            attrs.update(users=len(user_ids), devices=len(device_ids))
+
+    if in_app:
+        with span("in_app", rows=len(in_app)):
+            InAppNotification.objects.bulk_create(in_app, ignore_conflicts=True)
+
+    res = send_fcm_batch(messages) if messages else {"sent": 0, "fail": 0, "token_count": 0}
+    return {"ok": True, "events": len(events), "in_app": len(in_app), **res}
 
 
 def _station_notification_location(stock: Stock) -> str:
@@ -33,16 +171,14 @@ def notify_station_available(stock: Stock, old_niveau: str | None = None) -> dic
     if not stock:
         return {"ok": False, "error": "stock missing"}
 
-    old_niveau_norm = (old_niveau or "").strip()
-
-    if stock.niveau != "Plein":
+    if stock.niveau != PLEIN:
         return {"ok": True, "skipped": True, "reason": "niveau_not_plein"}
 
-    if old_niveau_norm == "Plein":
+    if _is_plein(old_niveau):
         return {"ok": True, "skipped": True, "reason": "already_plein"}
 
     station_id = stock.station_id
-    produit = (stock.produit or "").strip().lower()
+    produit = stock.produit
 
     produit_filter = (
         Q(produit__isnull=True)
@@ -0,0 +1,66 @@
+# stations/page_cache.py
+"""
+Pages publiques (accueil, carte) : GET conditionnel + HTML mis en cache par version.
+
+Version des données = version de la hiérarchie + séquence du journal des stations
+(stations/changes.py) + dernier Stock.date_maj (index Stock(date_maj)).
+- ETag dérivé de cette version : 304 si le navigateur est à jour (décorateur
+  django.views.decorators.http.condition). Pas de Last-Modified : une date ne
+  couvre ni les approbations ni les renommages de la hiérarchie, un
+  If-Modified-Since seul donnerait un 304 périmé
+- HTML rendu gardé en cache sous (vue, version, paramètres GET) : pas de rendu
+  de template tant que les données ne changent pas
+
+Les deux templates ne dépendent ni de l'utilisateur ni d'un jeton CSRF.
+"""
+from __future__ import annotations
+
+import hashlib
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .changes import current_seq
+from .geo_cache import hierarchy_version
+from .models import Stock
+
+PAGE_TTL = 24 * 3600
+
+
+def page_etag(request, *args, **kwargs) -> str:
+    # calculé une fois par requête (condition puis clé de cache)
+    etag = getattr(request, "_page_etag", None)
+    if etag is None:
+        last_update = Stock.objects.order_by("-date_maj").values_list("date_maj", flat=True).first()
+        raw = f"{hierarchy_version()}:{current_seq()}:{last_update.isoformat() if last_update else ''}"
+        etag = request._page_etag = hashlib.md5(raw.encode("utf-8")).hexdigest()
+    return etag
+
+
+def versioned_page(view):
+    """
+    304 si l'ETag correspond ; sinon HTML depuis le cache de la version.
+    """
+    @condition(etag_func=page_etag)
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        query = hashlib.md5(request.GET.urlencode().encode("utf-8")).hexdigest()
+        key = f"page:{view.__name__}:{page_etag(request)}:{query}"
+
+        cached = cache.get(key)
+        if cached is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cached = {"content": response.content, "content_type": response["Content-Type"]}
+            cache.set(key, cached, PAGE_TTL)
+
+        response = HttpResponse(cached["content"], content_type=cached["content_type"])
+        # le navigateur garde la page mais revalide à chaque visite (304 bon marché)
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    return wrapper
@@ -0,0 +1,13 @@
+# stations/params.py
+"""
+Lecture des paramètres de requête (query string, en-têtes) partagée par les vues.
+"""
+from __future__ import annotations
+
+
+def as_int(v, default=None):
+    """Entier, ou `default` si la valeur est absente ou invalide."""
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return default
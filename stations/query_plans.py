@@ -0,0 +1,138 @@
+# stations/query_plans.py
+"""
+Plans d'exécution (EXPLAIN) des filtres chauds.
+
+- hot_queries() : requêtes exécutées à chaque événement de stock, notification
+  ou page admin, avec les tables volumineuses qu'elles ne doivent jamais
+  parcourir entièrement
+- full_scans() : tables lues en parcours séquentiel d'après le plan
+  (SQLite "SCAN <table>" sans index, PostgreSQL "Seq Scan on <table>")
+- check_hot_queries() : plans de toutes les requêtes chaudes ; utilisé par les
+  tests sur un jeu de données du banc (stations/benchmark.py), sous SQLite
+  comme sous PostgreSQL (DATABASE_URL)
+
+Sous PostgreSQL, le planificateur ne choisit un index que si les statistiques
+sont à jour : ANALYZE est lancé avant les EXPLAIN.
+"""
+from __future__ import annotations
+
+import re
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import DeviceFollow, InAppNotification, Station, StationFollow, StationStatus, Stock, StockHistory
+
+
+def _table(model) -> str:
+    return model._meta.db_table
+
+
+def hot_queries() -> list[dict]:
+    """
+    Requêtes chaudes (mêmes filtres que le code appelant) sur des stations existantes.
+    """
+    station_ids = list(Station.objects.order_by("-id").values_list("id", flat=True)[:3])
+    station_id = station_ids[0] if station_ids else 0
+    commune_id = (
+        StationStatus.objects.filter(station_id=station_id).values_list("commune_id", flat=True).first() or 0
+    )
+
+    return [
+        {
+            # stations/notifications.py : anti-spam
+            "name": "spam_guard",
+            "qs": InAppNotification.objects.filter(
+                station_id__in=station_ids, created_at__gte=timezone.now() - timedelta(minutes=10),
+            ).order_by().values_list("station_id", "produit", "message"),
+            "tables": [_table(InAppNotification)],
+        },
+        {
+            # stations/notifications.py : abonnés utilisateurs
+            "name": "user_followers",
+            "qs": StationFollow.objects.filter(station_id__in=station_ids, is_active=True)
+            .values_list("user_id", "station_id", "produit"),
+            "tables": [_table(StationFollow)],
+        },
+        {
+            # stations/notifications.py : abonnés devices
+            "name": "device_followers",
+            "qs": DeviceFollow.objects.filter(station_id__in=station_ids, is_active=True)
+            .values_list("device__device_id", "station_id", "produit"),
+            "tables": [_table(DeviceFollow)],
+        },
+        {
+            # stations/notifications.py : notify_station_available, parcouru par
+            # notifications/utils.py : send_push_to_device_follows
+            "name": "device_followers_produit",
+            "qs": DeviceFollow.objects.filter(station_id=station_id, is_active=True)
+            .filter(Q(produit__isnull=True) | Q(produit="essence"))
+            .select_related("device", "station__commune__cercle__region"),
+            "tables": [_table(DeviceFollow)],
+        },
+        {
+            # stations/stock_updates.py : stock d'un produit
+            "name": "stock_station_produit",
+            "qs": Stock.objects.filter(station_id=station_id, produit="essence"),
+            "tables": [_table(Stock)],
+        },
+        {
+            # historique d'une station (admin, fiche station)
+            "name": "history_station",
+            "qs": StockHistory.objects.filter(station_id=station_id).order_by("-date_maj")[:20],
+            "tables": [_table(StockHistory)],
+        },
+        {
+            # stations/views.py : file de validation admin
+            "name": "pending_stations",
+            "qs": Station.objects.filter(is_approved=False).order_by("-id"),
+            "tables": [_table(Station)],
+        },
+        {
+            # stations/api_geojson.py : carte filtrée par commune
+            "name": "map_commune",
+            "qs": StationStatus.objects.filter(
+                is_approved=True, latitude__isnull=False, longitude__isnull=False, commune_id=commune_id,
+            ),
+            "tables": [_table(StationStatus)],
+        },
+    ]
+
+
+def explain(qs) -> str:
+    return qs.explain()
+
+
+def full_scans(plan: str, tables: list[str], vendor: str | None = None) -> list[str]:
+    """
+    Tables de `tables` lues en parcours séquentiel dans `plan`.
+    """
+    vendor = vendor or connection.vendor
+    found = []
+    for table in tables:
+        name = re.escape(table)
+        if vendor == "postgresql":
+            pattern = rf"Seq Scan on {name}\b"
+        else:
+            # "SCAN t USING INDEX i" : parcours ordonné d'un index (partiel), accepté
+            pattern = rf"\bSCAN {name}\b(?! USING)"
+        if re.search(pattern, plan):
+            found.append(table)
+    return found
+
+
+def check_hot_queries() -> list[dict]:
+    """
+    Plan de chaque requête chaude et tables parcourues séquentiellement.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    results = []
+    for q in hot_queries():
+        plan = explain(q["qs"])
+        results.append({"name": q["name"], "plan": plan, "full_scans": full_scans(plan, q["tables"])})
+    return results
@@ -0,0 +1,239 @@
+# stations/search.py
+"""
+Recherche de stations.
+
+- Station.search_text : colonne dénormalisée "nom adresse commune cercle région",
+  en minuscules et sans accents ("Ségou" -> "segou"). Tenue à jour par les
+  signaux (stations/signals.py) et par `manage.py reindexer_recherche`.
+- SearchIndex : index inversé en mémoire (token -> ids) construit depuis cette
+  colonne, reconstruit quand la version de recherche change. Les requêtes
+  (préfixes, classement) ne touchent plus la base.
+"""
+from __future__ import annotations
+
+import bisect
+import re
+import threading
+import time
+import unicodedata
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Commune, Station
+
+VERSION_KEY = "search:version"
+# colonnes de Station recopiées dans SearchIndex : seules leurs modifications
+# imposent une reconstruction de l'index dans chaque worker
+INDEXED_FIELDS = ("nom", "search_text", "commune_id", "is_approved")
+MAX_PAGE_SIZE = 50
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def fold(value) -> str:
+    """
+    Minuscules, sans accents, ponctuation -> espaces.
+    """
+    s = str(value or "").lower()
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(c for c in s if not unicodedata.combining(c))
+    return " ".join(_NON_WORD.split(s)).strip()
+
+
+def tokens(value) -> list[str]:
+    return [t for t in fold(value).split() if t]
+
+
+# -----------------------------
+# Colonne dénormalisée
+# -----------------------------
+def build_search_text(nom, adresse, commune_nom=None, cercle_nom=None, region_nom=None) -> str:
+    parts = [nom, adresse, commune_nom, cercle_nom, region_nom]
+    return " ".join(fold(p) for p in parts if p)[:500]
+
+
+def search_text_for(station: Station) -> str:
+    commune = None
+    if station.commune_id:
+        commune = (
+            Commune.objects.select_related("cercle__region")
+            .filter(id=station.commune_id)
+            .first()
+        )
+    cercle = commune.cercle if commune else None
+    region = cercle.region if cercle else None
+
+    return build_search_text(
+        station.nom,
+        station.adresse,
+        commune.nom if commune else None,
+        cercle.nom if cercle else None,
+        region.nom if region else None,
+    )
+
+
+def indexed_values(station: Station) -> tuple:
+    return tuple(getattr(station, f) for f in INDEXED_FIELDS)
+
+
+def refresh_search_text(stations_q: Q | None = None, *, batch_size: int = 1000) -> int:
+    """
+    Recalcule search_text (toutes les stations, ou celles du filtre) par bulk_update.
+    """
+    qs = Station.objects.all()
+    if stations_q is not None:
+        qs = qs.filter(stations_q)
+
+    rows = qs.values(
+        "id", "nom", "adresse", "search_text",
+        "commune__nom", "commune__cercle__nom", "commune__cercle__region__nom",
+    )
+
+    changed = []
+    for r in rows.iterator(chunk_size=batch_size):
+        text = build_search_text(
+            r["nom"], r["adresse"],
+            r["commune__nom"], r["commune__cercle__nom"], r["commune__cercle__region__nom"],
+        )
+        if text != r["search_text"]:
+            changed.append(Station(id=r["id"], search_text=text))
+
+    if changed:
+        Station.objects.bulk_update(changed, ["search_text"], batch_size=batch_size)
+        bump_search_version()
+
+    return len(changed)
+
+
+# -----------------------------
+# Index en mémoire
+# -----------------------------
+def search_version() -> int:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # départ horodaté : une clé évincée ne retombe pas sur une ancienne version
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY, 0)
+    return int(version)
+
+
+def bump_search_version() -> None:
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+class SearchIndex:
+    """
+    Index inversé d'un processus : token -> ids, tokens triés pour les préfixes.
+    """
+
+    def __init__(self, version: int):
+        self.version = version
+        self.postings: dict[str, set[int]] = {}
+        self.name_tokens: dict[int, set[str]] = {}
+        self.docs: dict[int, dict] = {}
+
+        rows = Station.objects.values(
+            "id", "nom", "search_text", "is_approved", "commune_id", "commune__nom",
+        )
+        for r in rows.iterator(chunk_size=2000):
+            sid = r["id"]
+            self.docs[sid] = {
+                "id": sid,
+                "nom": r["nom"],
+                "commune_id": r["commune_id"],
+                "commune": r["commune__nom"],
+                "is_approved": r["is_approved"],
+            }
+            self.name_tokens[sid] = set(tokens(r["nom"]))
+            for t in set((r["search_text"] or "").split()):
+                self.postings.setdefault(t, set()).add(sid)
+
+        self.sorted_tokens = sorted(self.postings)
+
+    def _prefix_ids(self, prefix: str) -> tuple[set[int], set[str]]:
+        ids: set[int] = set()
+        matched: set[str] = set()
+        i = bisect.bisect_left(self.sorted_tokens, prefix)
+        while i < len(self.sorted_tokens) and self.sorted_tokens[i].startswith(prefix):
+            t = self.sorted_tokens[i]
+            ids |= self.postings[t]
+            matched.add(t)
+            i += 1
+        return ids, matched
+
+    def search(self, query: str, *, include_unapproved: bool = False) -> list[dict]:
+        """
+        Tous les mots de la requête doivent correspondre (préfixe).
+        Score: mot exact dans le nom > préfixe du nom > ailleurs (adresse, hiérarchie).
+        """
+        q_tokens = tokens(query)
+        if not q_tokens:
+            return []
+
+        candidates: set[int] | None = None
+        matched_by_token: list[set[str]] = []
+        for qt in q_tokens:
+            ids, matched = self._prefix_ids(qt)
+            matched_by_token.append(matched)
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return []
+
+        scored = []
+        for sid in candidates:
+            doc = self.docs[sid]
+            if not include_unapproved and not doc["is_approved"]:
+                continue
+
+            name = self.name_tokens[sid]
+            score = 0
+            for qt, matched in zip(q_tokens, matched_by_token):
+                if qt in name:
+                    score += 3
+                elif name & matched:
+                    score += 2
+                else:
+                    score += 1
+            scored.append((-score, doc["nom"], sid))
+
+        scored.sort()
+        return [{**self.docs[sid], "score": -neg} for neg, _, sid in scored]
+
+
+_index: SearchIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> SearchIndex:
+    global _index
+    version = search_version()
+    if _index is None or _index.version != version:
+        with _index_lock:
+            if _index is None or _index.version != version:
+                _index = SearchIndex(version)
+    return _index
+
+
+def search_stations(query: str, *, page: int = 1, page_size: int = 20, include_unapproved: bool = False) -> dict:
+    """
+    {"count", "page", "page_size", "results": [{id, nom, commune_id, commune, score}]}
+    """
+    page = max(1, int(page or 1))
+    page_size = max(1, min(MAX_PAGE_SIZE, int(page_size or 20)))
+
+    hits = get_index().search(query, include_unapproved=include_unapproved)
+    start = (page - 1) * page_size
+
+    return {
+        "count": len(hits),
+        "page": page,
+        "page_size": page_size,
+        "results": [
+            {k: h[k] for k in ("id", "nom", "commune_id", "commune", "score")}
+            for h in hits[start:start + page_size]
+        ],
+    }
@@ -1,7 +1,109 @@
 # stations/signals.py
 """
-Signaux désactivés.
+Signaux d'invalidation de cache et de maintenance de StationStatus uniquement.
 
-Les notifications Malitadji sont déclenchées uniquement depuis :
-stations/views.py -> manager_dashboard()
-"""
\ No newline at end of file
+Les notifications Malitadji ne passent PAS par des signaux : elles sont
+déclenchées depuis stations/stock_updates.py -> apply_stock_updates()
+(dashboard gérant et API gérant).
+"""
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .changes import notify_stations_changed
+from .devices import invalidate_device
+from .follow_counts import invalidate_follower_counts
+from .geo_cache import bump_hierarchy_version
+from .models import Cercle, Commune, Device, DeviceFollow, Region, Station, StationFollow, StationStatus, Stock
+from .search import INDEXED_FIELDS, bump_search_version, indexed_values, refresh_search_text, search_text_for
+from .station_refs import invalidate_station_refs
+from .status import refresh_station_status
+
+
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Region)
+@receiver(post_save, sender=Cercle)
+@receiver(post_delete, sender=Cercle)
+@receiver(post_save, sender=Commune)
+@receiver(post_delete, sender=Commune)
+def _hierarchy_changed(sender, **kwargs):
+    bump_hierarchy_version()
+
+
+@receiver(post_save, sender=Region)
+@receiver(post_save, sender=Cercle)
+@receiver(post_save, sender=Commune)
+def _hierarchy_renamed(sender, instance, created, **kwargs):
+    # une zone créée n'a pas encore de stations
+    if created:
+        return
+    field = {
+        Region: "commune__cercle__region",
+        Cercle: "commune__cercle",
+        Commune: "commune",
+    }[sender]
+    refresh_search_text(Q(**{field: instance}))
+
+
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Region)
+@receiver(post_save, sender=Cercle)
+@receiver(post_delete, sender=Cercle)
+@receiver(post_save, sender=Commune)
+@receiver(post_delete, sender=Commune)
+def _hierarchy_status(sender, instance, created=False, **kwargs):
+    # renommage / suppression : noms et ids recopiés dans StationStatus
+    if created:
+        return
+    field = {Region: "region_id", Cercle: "cercle_id", Commune: "commune_id"}[sender]
+    refresh_station_status(
+        StationStatus.objects.filter(**{field: instance.id}).values_list("station_id", flat=True)
+    )
+
+
+@receiver(pre_save, sender=Station)
+def _station_search_text(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance.search_text = search_text_for(instance)
+
+    # coordonnées, gérant... : l'index de recherche reste valable
+    previous = None
+    if instance.pk:
+        previous = Station.objects.filter(pk=instance.pk).values_list(*INDEXED_FIELDS).first()
+    instance._search_changed = previous != indexed_values(instance)
+
+
+@receiver(post_save, sender=Station)
+@receiver(post_delete, sender=Station)
+def _station_changed(sender, instance, raw=False, signal=None, **kwargs):
+    invalidate_station_refs(instance.id)
+    search_changed = instance.__dict__.pop("_search_changed", True)
+    if signal is post_delete or search_changed:
+        bump_search_version()
+    if not raw:
+        refresh_station_status([instance.id])
+    notify_stations_changed([instance.id])
+
+
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def _stock_changed(sender, instance, raw=False, origin=None, **kwargs):
+    # suppression en cascade d'une station : sa ligne StationStatus part avec elle
+    if not raw and not isinstance(origin, Station) and getattr(origin, "model", None) is not Station:
+        refresh_station_status([instance.station_id])
+    notify_stations_changed([instance.station_id])
+
+
+@receiver(post_save, sender=StationFollow)
+@receiver(post_delete, sender=StationFollow)
+@receiver(post_save, sender=DeviceFollow)
+@receiver(post_delete, sender=DeviceFollow)
+def _follow_changed(sender, instance, **kwargs):
+    invalidate_follower_counts(instance.station_id)
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def _device_changed(sender, instance, **kwargs):
+    invalidate_device(instance.device_id)
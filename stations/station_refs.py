@@ -0,0 +1,52 @@
+# stations/station_refs.py
+"""
+Métadonnées de station (nom, commune, gérant, approbation) gardées en cache.
+
+Invalidées par les signaux Station (stations/signals.py) et explicitement après
+les queryset.update(...) de l'admin qui ne déclenchent pas de signal.
+"""
+from __future__ import annotations
+
+from django.core.cache import cache
+
+from .models import Station
+
+# filet de sécurité si une écriture échappe à l'invalidation
+TTL_SECONDS = 3600
+# station inexistante : mis en cache aussi, pour ne pas relire la base à chaque id invalide
+_ABSENT = {}
+
+
+def _key(station_id: int) -> str:
+    return f"station_ref:{station_id}"
+
+
+def station_ref(station_id: int) -> dict | None:
+    """
+    {"id", "nom", "commune_id", "gerant_id", "is_approved"} ou None.
+    """
+    ref = cache.get(_key(station_id))
+    if ref is None:
+        ref = (
+            Station.objects.filter(id=station_id)
+            .values("id", "nom", "commune_id", "gerant_id", "is_approved")
+            .first()
+        ) or _ABSENT
+        cache.set(_key(station_id), ref, TTL_SECONDS)
+    return ref or None
+
+
+async def astation_ref(station_id: int) -> dict | None:
+    ref = await cache.aget(_key(station_id))
+    if ref is None:
+        ref = (
+            await Station.objects.filter(id=station_id)
+            .values("id", "nom", "commune_id", "gerant_id", "is_approved")
+            .afirst()
+        ) or _ABSENT
+        await cache.aset(_key(station_id), ref, TTL_SECONDS)
+    return ref or None
+
+
+def invalidate_station_refs(*station_ids: int) -> None:
+    cache.delete_many([_key(sid) for sid in station_ids if sid])
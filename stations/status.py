@@ -0,0 +1,135 @@
+# stations/status.py
+"""
+Maintenance de StationStatus (projection 1 ligne par station).
+
+refresh_station_status(ids) recalcule les lignes des stations touchées ; il est
+appelé dans la transaction de l'écriture (signaux Station / Stock,
+apply_stock_updates, balayage d'obsolescence, actions admin), la projection est
+donc validée ou annulée avec elle.
+
+Les lecteurs (GeoJSON, clusters, tuiles, accueil, dashboard admin) lisent
+StationStatus seul : ni jointure vers la hiérarchie, ni agrégat sur Stock.
+Les statuts y sont stockés après rétrogradation des stocks obsolètes : changer
+STOCK_STALE_DOWNGRADE demande un `manage.py reconstruire_statuts`.
+"""
+from __future__ import annotations
+
+from typing import Iterable
+
+from django.db.models import Count, Max, Q
+
+from .codes import niveau_statut, statut_global
+from .freshness import effective_niveau
+from .models import Station, StationStatus, Stock
+
+_UPDATE_FIELDS = [
+    "nom", "adresse", "latitude", "longitude", "is_approved",
+    "region_id", "cercle_id", "commune_id", "region_nom", "cercle_nom", "commune_nom",
+    "essence", "gasoil", "status", "has_stock", "stale", "derniere_maj",
+]
+
+
+def _build_rows(station_ids: set[int] | None) -> list[StationStatus]:
+    stations = Station.objects.values(
+        "id", "nom", "adresse", "latitude", "longitude", "is_approved",
+        "commune_id", "commune__nom",
+        "commune__cercle_id", "commune__cercle__nom",
+        "commune__cercle__region_id", "commune__cercle__region__nom",
+    ).order_by()
+    stocks = Stock.objects.values_list("station_id", "produit", "niveau", "is_stale", "date_maj").order_by()
+    if station_ids is not None:
+        stations = stations.filter(id__in=station_ids)
+        stocks = stocks.filter(station_id__in=station_ids)
+
+    by_station: dict[int, dict] = {}
+    for sid, produit, niveau, is_stale, date_maj in stocks:
+        agg = by_station.setdefault(sid, {"essence": "inconnu", "gasoil": "inconnu", "stale": False, "derniere_maj": None})
+        if agg["derniere_maj"] is None or (date_maj and date_maj > agg["derniere_maj"]):
+            agg["derniere_maj"] = date_maj
+        if produit in ("essence", "gasoil"):
+            agg[produit] = niveau_statut(effective_niveau(niveau, is_stale))
+            agg["stale"] = agg["stale"] or bool(is_stale)
+
+    rows = []
+    for s in stations:
+        agg = by_station.get(s["id"])
+        essence = agg["essence"] if agg else "inconnu"
+        gasoil = agg["gasoil"] if agg else "inconnu"
+        rows.append(StationStatus(
+            station_id=s["id"],
+            nom=s["nom"],
+            adresse=s["adresse"],
+            latitude=s["latitude"],
+            longitude=s["longitude"],
+            is_approved=s["is_approved"],
+            region_id=s["commune__cercle__region_id"],
+            cercle_id=s["commune__cercle_id"],
+            commune_id=s["commune_id"],
+            region_nom=s["commune__cercle__region__nom"],
+            cercle_nom=s["commune__cercle__nom"],
+            commune_nom=s["commune__nom"],
+            essence=essence,
+            gasoil=gasoil,
+            status=statut_global(essence, gasoil),
+            has_stock=agg is not None,
+            stale=bool(agg and agg["stale"]),
+            derniere_maj=agg["derniere_maj"] if agg else None,
+        ))
+    return rows
+
+
+def refresh_station_status(station_ids: Iterable[int], *, batch_size: int = 1000) -> int:
+    """
+    Recalcule (upsert) les lignes des stations données ; 2 lectures + 1 écriture.
+    """
+    ids = {int(i) for i in station_ids if i}
+    if not ids:
+        return 0
+
+    rows = _build_rows(ids)
+    if rows:
+        StationStatus.objects.bulk_create(
+            rows,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["station"],
+            update_fields=_UPDATE_FIELDS,
+        )
+    # station supprimée entre-temps
+    missing = ids - {r.station_id for r in rows}
+    if missing:
+        StationStatus.objects.filter(station_id__in=missing).delete()
+    return len(rows)
+
+
+def rebuild_station_status(*, batch_size: int = 2000) -> int:
+    """
+    Recalcul complet, par lots d'ids (mémoire bornée).
+    """
+    total = 0
+    batch: list[int] = []
+    for sid in Station.objects.order_by("id").values_list("id", flat=True).iterator(chunk_size=batch_size):
+        batch.append(sid)
+        if len(batch) >= batch_size:
+            total += refresh_station_status(batch)
+            batch = []
+    if batch:
+        total += refresh_station_status(batch)
+
+    StationStatus.objects.exclude(station_id__in=Station.objects.values("id")).delete()
+    return total
+
+
+def status_kpis() -> dict:
+    """
+    KPIs accueil / dashboard admin en 1 requête sur StationStatus.
+    """
+    return StationStatus.objects.aggregate(
+        total_stations=Count("pk"),
+        stations_avec_stock=Count("pk", filter=Q(has_stock=True)),
+        dispo_count=Count("pk", filter=Q(status="dispo")),
+        faible_count=Count("pk", filter=Q(status="faible")),
+        rupture_count=Count("pk", filter=Q(status="rupture")),
+        inconnu_count=Count("pk", filter=Q(status="inconnu")),
+        last_update=Max("derniere_maj"),
+    )
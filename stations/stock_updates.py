@@ -0,0 +1,122 @@
+# stations/stock_updates.py
+"""
+Écriture des stocks, partagée par le dashboard gérant et l'API JSON.
+
+Un appel = N couples (station, produit, niveau) appliqués dans une seule
+transaction : 1 lecture des stocks existants, 1 bulk update, 1 bulk upsert,
+1 bulk insert StockHistory, la mise à jour de StationStatus, puis 1 diffusion
+groupée des notifications.
+
+Les appels qui produisent des passages à "Plein" sont tracés de bout en bout
+(notifications/tracing.py : écriture, abonnés, tokens, chunks FCM). Chaque
+passage à "Plein" a son event_id (payload FCM, span "event" de la trace).
+"""
+from __future__ import annotations
+
+import uuid
+
+from django.db import transaction
+from django.utils import timezone
+
+from notifications.tracing import span, trace
+
+from .changes import notify_stations_changed
+from .codes import PLEIN, parse_niveau, parse_produit
+from .models import Station, Stock, StockHistory
+from .notifications import notify_stock_events
+from .status import refresh_station_status
+
+
+def apply_stock_updates(*, user, updates: list[tuple[Station, str, str]]) -> dict:
+    """
+    updates: [(station, produit, niveau)] ; pour un même (station, produit), le dernier gagne.
+    produit / niveau sont normalisés ici (stations/codes.py) ; ValueError si inconnus.
+    Retourne: updated, created, history, events, push
+    """
+    now = timezone.now()
+
+    wanted: dict[tuple[int, str], tuple[Station, str, str]] = {}
+    for station, raw_produit, raw_niveau in updates:
+        produit, niveau = parse_produit(raw_produit), parse_niveau(raw_niveau)
+        if produit is None or niveau is None:
+            raise ValueError(f"produit / niveau inconnu : {raw_produit!r} / {raw_niveau!r}")
+        wanted[(station.id, produit)] = (station, produit, niveau)
+
+    if not wanted:
+        return {"updated": 0, "created": 0, "history": 0, "events": 0, "push": None}
+
+    with trace("stock_plein", user_id=getattr(user, "id", None)) as t:
+        events = []
+        with span("stock_write", stocks=len(wanted)), transaction.atomic():
+            existing = {
+                (s.station_id, s.produit): s
+                for s in Stock.objects.select_for_update().filter(station_id__in={k[0] for k in wanted})
+            }
+
+            to_update = []
+            to_create = []
+            history = []
+
+            for key, (station, produit, niveau) in wanted.items():
+                stock = existing.get(key)
+                old_niveau = stock.niveau if stock else None
+
+                if stock is None:
+                    to_create.append(Stock(station=station, produit=produit, niveau=niveau, date_maj=now))
+                else:
+                    # bulk_update ne passe pas par save() : date_maj / is_stale explicites
+                    stock.niveau = niveau
+                    stock.date_maj = now
+                    stock.is_stale = False
+                    to_update.append(stock)
+
+                history.append(StockHistory(
+                    station=station,
+                    produit=produit,
+                    ancien_niveau=old_niveau,
+                    nouveau_niveau=niveau,
+                    updated_by=user,
+                ))
+
+                if niveau == PLEIN and old_niveau != PLEIN:
+                    events.append({
+                        "station": station, "produit": produit, "niveau": niveau, "event_id": uuid.uuid4().hex,
+                    })
+
+            if to_update:
+                Stock.objects.bulk_update(to_update, ["niveau", "date_maj", "is_stale"])
+            if to_create:
+                # upsert : un stock créé entre-temps par une autre requête est mis à jour
+                Stock.objects.bulk_create(
+                    to_create,
+                    update_conflicts=True,
+                    unique_fields=["station", "produit"],
+                    update_fields=["niveau", "date_maj", "is_stale"],
+                )
+            StockHistory.objects.bulk_create(history)
+
+            # bulk_* ne passe pas par les signaux
+            station_ids = {k[0] for k in wanted}
+            refresh_station_status(station_ids)
+            notify_stations_changed(station_ids)
+
+        # Diffusion hors transaction : les stocks sont déjà visibles quand le push arrive
+        push = notify_stock_events(events) if events else None
+        if events:
+            t.attrs.update(
+                events=len(events),
+                event_ids=[e["event_id"] for e in events],
+                tokens=push.get("token_count", 0),
+                sent=push.get("sent", 0),
+                fail=push.get("fail", 0),
+            )
+        else:
+            t.discard()
+
+    return {
+        "updated": len(to_update),
+        "created": len(to_create),
+        "history": len(history),
+        "events": len(events),
+        "push": push,
+    }
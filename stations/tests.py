@@ -1,3 +1,1418 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import importlib
+import json
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+import brotli
+import msgpack
+from asgiref.sync import sync_to_async
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import metrics
+from core.middleware import QueryBudgetExceeded
+from notifications import push_client
+from notifications.models import NotificationSpan
+from notifications.tracing import latency_report
+from notifications.utils import send_fcm_batch
+from notifications.views import register_fcm_token
+
+from . import changes, clustering, tiles
+from . import devices as devices_module
+from .api_manager import MAX_UPDATES
+from .changes import current_seq
+from .codes import statut_global
+from .compression import aprecompressed_response
+from .devices import (
+    deactivate_inactive_devices,
+    flush_last_seen,
+    inactive_days,
+    invalid_token_strikes,
+    register_token,
+    resolve_device,
+    touch_device,
+)
+from .freshness import stale_after, sweep_stale_stocks
+from .heatmap import bucket_start, refresh_shortage_rollups
+from .live import broadcaster
+from .models import (
+    Cercle, Commune, Device, DeviceFollow, Region, ShortageRollup, Station, StationFollow, StationStatus, Stock,
+    StockHistory, fcm_token_hash,
+)
+from .search import search_version
+from .station_refs import station_ref
+from .stock_updates import apply_stock_updates
+
+User = get_user_model()
+
+# budgets de requêtes (settings.QUERY_BUDGETS) appliqués aux tests des vues concernées
+enforce_query_budgets = override_settings(QUERY_BUDGET_MODE="raise")
+
+_test_caches = None
+# thread d'écriture last_seen_at : pas d'écriture concurrente pendant les tests
+_no_flusher = mock.patch("stations.devices._start_flusher")
+
+
+def setUpModule():
+    # cache partagé dans un dossier temporaire : les cache.clear() des tests ne
+    # vident pas BASE_DIR/.cache du poste ou de l'hôte CI, et n'en lisent rien
+    global _test_caches
+    _test_caches = override_settings(CACHES={
+        "default": {**settings.CACHES["default"], "LOCATION": "malitadji-tests"},
+        "shared": {**settings.CACHES["shared"], "LOCATION": tempfile.mkdtemp(prefix="malitadji-cache-")},
+    })
+    _test_caches.enable()
+    _no_flusher.start()
+
+
+def tearDownModule():
+    _no_flusher.stop()
+    location = settings.CACHES["shared"]["LOCATION"]
+    _test_caches.disable()
+    shutil.rmtree(location, ignore_errors=True)
+
+
+@enforce_query_budgets
+class StockFreshnessTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.station = Station.objects.create(nom="Oryx Ségou", latitude=13.43, longitude=-6.26)
+        self.stock = Stock.objects.create(station=self.station, produit="essence", niveau="Plein")
+        old = timezone.now() - stale_after("essence") - timedelta(hours=1)
+        Stock.objects.filter(id=self.stock.id).update(date_maj=old)
+
+    def _feed_essence(self):
+        return self.client.get("/api/stations.geojson").json()["features"][0]["properties"]
+
+    def test_sweep_flags_stale_and_fresh_save_clears(self):
+        self._feed_essence()  # flux en cache avant le balayage
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sweep_stale_stocks(), {"marked": 1, "cleared": 0})
+        self.assertEqual(sweep_stale_stocks(), {"marked": 0, "cleared": 0})
+        self.assertTrue(Stock.objects.get(id=self.stock.id).is_stale)
+        props = self._feed_essence()
+        self.assertEqual((props["essence"], props["stale"], props["status"]), ("inconnu", True, "Inconnu"))
+
+        # nouveau relevé du gérant
+        stock = Stock.objects.get(id=self.stock.id)
+        stock.niveau = "Plein"
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.save()
+        self.assertFalse(Stock.objects.get(id=self.stock.id).is_stale)
+        props = self._feed_essence()
+        self.assertEqual((props["essence"], props["stale"]), ("dispo", False))
+
+    def test_raised_threshold_clears_flag(self):
+        sweep_stale_stocks()
+        with self.settings(STOCK_STALE_AFTER_HOURS={"default": 24 * 365}):
+            self.assertEqual(sweep_stale_stocks(), {"marked": 0, "cleared": 1})
+        self.assertEqual(StationStatus.objects.get(station=self.station).essence, "dispo")
+
+
+class ShortageHeatmapTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        region = Region.objects.create(nom="Gao")
+        cercle = Cercle.objects.create(region=region, nom="Gao")
+        self.commune = Commune.objects.create(cercle=cercle, nom="Gao")
+        self.station = Station.objects.create(nom="Total Gao", commune=self.commune, latitude=16.27, longitude=-0.04)
+        self.base = bucket_start(timezone.now(), "h") - timedelta(hours=3)
+
+    def _history(self, niveau, at):
+        row = StockHistory.objects.create(station=self.station, produit="essence", nouveau_niveau=niveau)
+        StockHistory.objects.filter(id=row.id).update(date_maj=at)  # auto_now_add
+
+    def _hourly(self):
+        return dict(
+            ShortageRollup.objects.filter(granularity="h", zone_type="commune")
+            .values_list("bucket_start", "rupture_seconds")
+        )
+
+    def test_interval_split_across_buckets_and_idempotent(self):
+        # rupture de base+30 min à base+1 h 30 : 30 min dans chacune des deux tranches horaires
+        self._history("Rupture", self.base + timedelta(minutes=30))
+        self._history("Plein", self.base + timedelta(minutes=90))
+
+        # curseur incrémental : une ligne par passage
+        self.assertEqual(refresh_shortage_rollups(batch_size=1)["rows"], 1)
+        self.assertEqual(refresh_shortage_rollups(batch_size=1)["rows"], 1)
+        expected = {self.base: 1800, self.base + timedelta(hours=1): 1800}
+        self.assertEqual(self._hourly(), expected)
+
+        for _ in range(2):
+            self.assertEqual(refresh_shortage_rollups()["rows"], 0)
+        self.assertEqual(self._hourly(), expected)
+        daily = ShortageRollup.objects.filter(granularity="d", zone_type="geohash").aggregate(s=Sum("rupture_seconds"))
+        self.assertEqual(daily["s"], 3600)
+
+        grid = self.client.get("/api/shortages/heatmap/", {"window": "24h", "zone": "commune"}).json()
+        self.assertEqual(grid["granularity"], "h")
+        self.assertEqual(
+            {k: v[str(self.commune.id)] for k, v in grid["buckets"].items()},
+            {self.base.strftime("%Y-%m-%dT%H:%MZ"): [1800, 0], (self.base + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%MZ"): [1800, 0]},
+        )
+
+        geo = self.client.get("/api/shortages/heatmap/", {"window": "24h", "zone": "geohash", "format": "geojson"}).json()
+        self.assertEqual(len(geo["features"]), 1)
+        self.assertEqual(geo["features"][0]["geometry"]["type"], "Polygon")
+        self.assertEqual(geo["features"][0]["properties"]["rupture_seconds"], 3600)
+
+        self.assertEqual(self.client.get("/api/shortages/heatmap/", {"window": "1y"}).status_code, 400)
+
+
+class ManagerStockApiTests(TestCase):
+    URL = "/api/manager/stocks/"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.gerant = User.objects.create_user("api-gerant", password="pw")
+        cls.mine = Station.objects.create(nom="Shell Magnambougou", gerant=cls.gerant)
+        cls.other = Station.objects.create(nom="Shell Badalabougou")
+
+    def _post(self, updates, user=None):
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(user or self.gerant)}"} if user is not False else {}
+        return self.client.post(self.URL, {"updates": updates}, content_type="application/json", **headers)
+
+    def test_requires_jwt(self):
+        response = self._post([{"station_id": self.mine.id, "produit": "essence", "niveau": "Plein"}], user=False)
+        self.assertEqual(response.status_code, 401)
+
+    def test_foreign_station_forbidden_and_nothing_written(self):
+        response = self._post([
+            {"station_id": self.mine.id, "produit": "essence", "niveau": "Plein"},
+            {"station_id": self.other.id, "produit": "essence", "niveau": "Plein"},
+        ])
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()["station_ids"], [self.other.id])
+        self.assertFalse(Stock.objects.exists())
+
+    def test_invalid_row_rejects_whole_batch(self):
+        response = self._post([
+            {"station_id": self.mine.id, "produit": "essence", "niveau": "Plein"},
+            {"station_id": self.mine.id, "produit": "kerosene", "niveau": "Plein"},
+            {"station_id": "x", "produit": "gasoil", "niveau": "Plein"},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([e["index"] for e in response.json()["errors"]], [1, 2])
+        self.assertFalse(Stock.objects.exists())
+        self.assertFalse(StockHistory.objects.exists())
+
+    def test_max_updates(self):
+        row = {"station_id": self.mine.id, "produit": "essence", "niveau": "Plein"}
+        self.assertEqual(self._post([row] * (MAX_UPDATES + 1)).status_code, 400)
+        self.assertEqual(self._post([]).status_code, 400)
+        self.assertFalse(Stock.objects.exists())
+
+    def test_batch_writes_history_and_notifies_once(self):
+        Stock.objects.create(station=self.mine, produit="gasoil", niveau="Rupture")
+
+        with mock.patch("stations.stock_updates.notify_stock_events", return_value={"sent": 2}) as notify:
+            response = self._post([
+                {"station_id": self.mine.id, "produit": "essence", "niveau": "Plein"},
+                {"station_id": self.mine.id, "produit": "gasoil", "niveau": "plein"},
+            ])
+
+        body = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((body["created"], body["updated"], body["history"], body["notified_events"]), (1, 1, 2, 2))
+        self.assertEqual(body["push"]["sent"], 2)
+        notify.assert_called_once()
+        self.assertEqual(
+            sorted(e["produit"] for e in notify.call_args.args[0]), ["essence", "gasoil"],
+        )
+        self.assertEqual(
+            sorted(StockHistory.objects.values_list("produit", "ancien_niveau", "nouveau_niveau", "updated_by")),
+            [("essence", None, "Plein", self.gerant.id), ("gasoil", "Rupture", "Plein", self.gerant.id)],
+        )
+
+
+class ManagerDashboardQueryBudgetTests(TestCase):
+    # session + user + station + stocks ; géo et abonnés viennent du cache
+    MAX_QUERIES = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(nom="Bamako")
+        cercle = Cercle.objects.create(region=region, nom="Bamako")
+        communes = [Commune.objects.create(cercle=cercle, nom=f"Commune {i}") for i in range(1, 7)]
+
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        cls.gerant = User.objects.create_user("gerant", "gerant@example.com", "pw")
+
+        cls.stations = [
+            Station.objects.create(nom=f"Station {i}", commune=communes[i % 6], latitude=12.6, longitude=-8.0)
+            for i in range(50)
+        ]
+        cls.station = cls.stations[0]
+        cls.station.gerant = cls.gerant
+        cls.station.save()
+
+        Stock.objects.create(station=cls.station, produit="essence", niveau="Plein")
+        Stock.objects.create(station=cls.station, produit="gasoil", niveau="Bas")
+
+        device = Device.objects.create(device_id="dev-1", fcm_token="tok-1")
+        DeviceFollow.objects.create(device=device, station=cls.station)
+
+    def setUp(self):
+        cache.clear()
+
+    def _assert_budget(self, url):
+        self.client.get(url)  # remplit le cache
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(ctx.captured_queries),
+            self.MAX_QUERIES,
+            "\n".join(q["sql"] for q in ctx.captured_queries),
+        )
+        return response
+
+    def test_superuser_dashboard_query_budget(self):
+        self.client.force_login(self.admin)
+        response = self._assert_budget(f"/manager/?station={self.station.id}")
+        self.assertEqual(response.context["device_followers_count"], 1)
+        self.assertNotIn("stations_list", response.context)
+
+    def test_gerant_dashboard_query_budget(self):
+        self.client.force_login(self.gerant)
+        self._assert_budget("/manager/")
+
+    def test_stock_update_confirmed_after_redirect(self):
+        self.client.force_login(self.gerant)
+        url = f"/manager/?station={self.station.id}"
+
+        with mock.patch("stations.stock_updates.notify_stock_events", return_value={"sent": 1, "fail": 0, "token_count": 1}):
+            response = self.client.post(url, {"produit": "gasoil", "niveau": "Plein"}, follow=True)
+
+        self.assertEqual(response.redirect_chain, [(url, 302)])
+        self.assertContains(response, "Stock enregistré : gasoil → Plein")
+        self.assertContains(response, "Push: sent=1 · fail=0 · tokens=1")
+        # affiché une seule fois
+        self.assertNotContains(self.client.get(url), "Stock enregistré")
+
+    def test_follow_change_invalidates_counter(self):
+        self.client.force_login(self.admin)
+        url = f"/manager/?station={self.station.id}"
+        self.client.get(url)
+
+        device = Device.objects.create(device_id="dev-2", fcm_token="tok-2")
+        DeviceFollow.objects.create(device=device, station=self.station)
+
+        response = self.client.get(url)
+        self.assertEqual(response.context["device_followers_count"], 2)
+
+    def test_station_typeahead(self):
+        self.client.force_login(self.admin)
+        response = self.client.get("/manager/stations/search/?q=Station 1")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["results"])
+
+        self.client.force_login(self.gerant)
+        response = self.client.get("/manager/stations/search/?q=Station")
+        self.assertEqual(response.status_code, 403)
+
+
+class StationSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(nom="Ségou")
+        cercle = Cercle.objects.create(region=region, nom="Ségou")
+        commune = Commune.objects.create(cercle=cercle, nom="Pelengana")
+        cls.station = Station.objects.create(nom="Total Pélengana", commune=commune)
+        Station.objects.create(nom="Shell Ségou Centre", commune=commune)
+        Station.objects.create(nom="Station en attente", commune=commune, is_approved=False)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_accent_insensitive_and_ranked(self):
+        results = self.client.get("/api/stations/search/?q=segou").json()["results"]
+        # les 2 stations approuvées (via la région), celle qui a "Ségou" dans son nom d'abord
+        self.assertEqual([r["nom"] for r in results], ["Shell Ségou Centre", "Total Pélengana"])
+
+    def test_hierarchy_rename_refreshes_index(self):
+        region = Region.objects.get(nom="Ségou")
+        region.nom = "Sikasso"
+        region.save()
+
+        results = self.client.get("/api/stations/search/?q=sikasso").json()["results"]
+        self.assertEqual(len(results), 2)
+
+    def test_version_bumped_only_for_indexed_fields(self):
+        version = search_version()
+        self.station.latitude = 13.45
+        self.station.save()
+        self.assertEqual(search_version(), version)
+
+        self.station.adresse = "Route de Markala"
+        self.station.save()
+        self.assertNotEqual(search_version(), version)
+        self.assertEqual(self.client.get("/api/stations/search/?q=markala").json()["count"], 1)
+
+    def test_manager_dashboard_keeps_every_match(self):
+        # "Total Pélengana" est mieux classée ; le dashboard prend la première par nom
+        self.client.force_login(User.objects.create_superuser("search-admin", "sa@example.com", "pw"))
+        response = self.client.get("/manager/?search=pelengana")
+        self.assertEqual(response.context["station"].nom, "Shell Ségou Centre")
+
+        gerant = User.objects.create_user("search-gerant", password="pw")
+        Station.objects.filter(id=self.station.id).update(gerant=gerant)
+        self.client.force_login(gerant)
+        with mock.patch("stations.views.get_index") as get_index:
+            response = self.client.get("/manager/?search=segou")
+        get_index.assert_not_called()
+        self.assertEqual(response.context["station"].id, self.station.id)
+
+
+class StationClusterTests(TestCase):
+    URL = "/api/stations/clusters/"
+
+    def setUp(self):
+        cache.clear()
+        clustering._grid = None
+        self.a = Station.objects.create(nom="Shell ACI", latitude=12.640, longitude=-8.000)
+        self.b = Station.objects.create(nom="Total ACI", latitude=12.642, longitude=-8.004)
+        self.kayes = Station.objects.create(nom="Kayes Gare", latitude=14.45, longitude=-11.44)
+        Station.objects.create(nom="En attente", latitude=12.641, longitude=-8.002, is_approved=False)
+        Stock.objects.create(station=self.b, produit="essence", niveau="Plein")
+
+    def _features(self, **params):
+        response = self.client.get(self.URL, {"zoom": 6, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()["features"]
+
+    def _clusters(self, **params):
+        return [f for f in self._features(**params) if f["properties"]["cluster"]]
+
+    def test_counts_centroid_and_single_stations(self):
+        features = self._features()
+        self.assertEqual(len(features), 2)
+
+        [cluster] = self._clusters()
+        props = cluster["properties"]
+        self.assertEqual((props["count"], props["dispo"], props["inconnu"], props["rupture"]), (2, 1, 1, 0))
+        lng, lat = cluster["geometry"]["coordinates"]
+        self.assertAlmostEqual(lat, 12.641)
+        self.assertAlmostEqual(lng, -8.002)
+
+        single = next(f for f in features if not f["properties"]["cluster"])
+        self.assertEqual(single["properties"]["id"], self.kayes.id)
+        self.assertEqual(single["geometry"]["coordinates"], [-11.44, 14.45])
+
+        # zoom fin : stations individuelles du viewport
+        features = self._features(zoom=15, bbox="-8.01,12.63,-7.99,12.65")
+        self.assertEqual(sorted(f["properties"]["id"] for f in features), [self.a.id, self.b.id])
+        self.assertFalse(any(f["properties"]["cluster"] for f in features))
+
+    def test_grid_follows_stock_and_station_saves(self):
+        self._features()
+        grid = clustering.get_grid()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Stock.objects.create(station=self.a, produit="gasoil", niveau="Rupture")
+        props = self._clusters()[0]["properties"]
+        self.assertEqual((props["dispo"], props["rupture"], props["inconnu"]), (1, 1, 0))
+
+        # déplacement : la station quitte la cellule, l'autre reste seule
+        self.a.latitude, self.a.longitude = 14.46, -11.45
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a.save()
+        [cluster] = self._clusters()
+        self.assertEqual(cluster["properties"]["count"], 2)
+        self.assertAlmostEqual(cluster["geometry"]["coordinates"][1], (14.45 + 14.46) / 2)
+        ids = [f["properties"].get("id") for f in self._features() if not f["properties"]["cluster"]]
+        self.assertEqual(ids, [self.b.id])
+
+        # mises à jour incrémentales, sans reconstruction
+        self.assertIs(clustering.get_grid(), grid)
+
+    def test_grid_read_under_its_lock(self):
+        # vues sync dans des threads (ASGI) : lecture et mise à jour sous le même verrou
+        query = clustering.ClusterGrid.query
+
+        def locked_query(grid, *args):
+            self.assertTrue(clustering._grid_lock.locked())
+            return query(grid, *args)
+
+        with mock.patch.object(clustering.ClusterGrid, "query", locked_query):
+            self.assertEqual(len(self._features()), 2)
+
+    def test_statut_filter_counts_and_places_matching_stations_only(self):
+        # Shell : essence dispo + gasoil rupture -> retenue sous "dispo" et sous "rupture"
+        Stock.objects.create(station=self.a, produit="essence", niveau="Plein")
+        Stock.objects.create(station=self.a, produit="gasoil", niveau="Rupture")
+        for station in (self.b, self.kayes):
+            Stock.objects.create(station=station, produit="gasoil", niveau="Plein")
+        Stock.objects.create(station=self.kayes, produit="essence", niveau="Plein")
+        Station.objects.create(nom="Oryx ACI", latitude=12.700, longitude=-8.100)
+
+        [cluster] = self._clusters(statut="dispo")
+        props = cluster["properties"]
+        self.assertEqual((props["count"], props["dispo"], props["rupture"]), (2, 2, 0))
+        lng, lat = cluster["geometry"]["coordinates"]
+        self.assertAlmostEqual(lat, 12.641)
+        self.assertAlmostEqual(lng, -8.002)
+
+        # une seule station retenue dans la cellule : renvoyée seule, pas en cluster
+        features = self._features(statut="rupture")
+        self.assertEqual([f["properties"]["id"] for f in features], [self.a.id])
+        self.assertEqual(features[0]["properties"]["status"], "rupture")
+        self.assertEqual([f["properties"]["nom"] for f in self._features(statut="inconnu")], ["Oryx ACI"])
+
+    def test_statut_filter_matches_geojson_feed(self):
+        Stock.objects.create(station=self.a, produit="essence", niveau="Plein")
+        Stock.objects.create(station=self.a, produit="gasoil", niveau="Rupture")
+        Stock.objects.create(station=self.kayes, produit="gasoil", niveau="Bas")
+
+        for statut in clustering.STATUTS:
+            with self.subTest(statut=statut):
+                feed = self.client.get("/api/stations.geojson", {"statut": statut}).json()["features"]
+                expected = sorted(f["properties"]["id"] for f in feed)
+                self.assertTrue(expected)
+
+                singles = self._features(zoom=15, bbox="-12.3,10.1,4.3,25.0", statut=statut)
+                self.assertEqual(sorted(f["properties"]["id"] for f in singles), expected)
+                clusters = self._features(zoom=0, statut=statut)
+                self.assertEqual(sum(f["properties"].get("count", 1) for f in clusters), len(expected))
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.URL, {"statut": "vide"}).status_code, 400)
+        self.assertEqual(self.client.get(self.URL, {"bbox": "1,2,3"}).status_code, 400)
+        self.assertEqual(self.client.get(self.URL, {"zoom": "x"}).status_code, 400)
+
+
+@enforce_query_budgets
+class StationsFeedCacheKeyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        region = Region.objects.create(nom="Koulikoro")
+        cercle = Cercle.objects.create(region=region, nom="Kati")
+        self.commune = Commune.objects.create(cercle=cercle, nom="Kati")
+        Station.objects.create(nom="Shell Kati", commune=self.commune, latitude=12.74, longitude=-8.07)
+        Station.objects.create(nom="Total Kalaban", latitude=12.57, longitude=-7.98)
+
+    def _keys(self, *queries):
+        keys = []
+        for params in queries:
+            with mock.patch(
+                "stations.api_geojson.aprecompressed_response", wraps=aprecompressed_response,
+            ) as cached:
+                response = self.client.get("/api/stations.geojson", params)
+            self.assertEqual(response.status_code, 200)
+            keys.append(cached.call_args.args[1])
+        return keys
+
+    def test_key_built_from_recognised_filters_only(self):
+        plain, junk, other_junk, bad_id = self._keys({}, {"x": "1"}, {"x": "2", "statut": "vide"}, {"region": "abc"})
+        self.assertEqual({plain, junk, other_junk, bad_id}, {plain})
+
+        by_commune, by_statut = self._keys({"commune": self.commune.id, "utm": "a"}, {"statut": "Rupture"})
+        self.assertEqual(len({plain, by_commune, by_statut}), 3)
+
+        features = self.client.get("/api/stations.geojson", {"commune": self.commune.id}).json()["features"]
+        self.assertEqual([f["properties"]["nom"] for f in features], ["Shell Kati"])
+
+
+class StationTilesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bamako = Station.objects.create(nom="Bamako Nord", latitude=12.64, longitude=-8.0)
+        cls.kayes = Station.objects.create(nom="Kayes Gare", latitude=14.45, longitude=-11.44)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_tile_contains_station(self):
+        response = self.client.get("/tiles/stations/10/489/475.pbf")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/vnd.mapbox-vector-tile")
+        self.assertIn(b"Bamako Nord", response.content)
+        self.assertNotIn(b"Kayes Gare", response.content)
+
+    def test_index_read_under_its_lock(self):
+        version, render = tiles.TileIndex.version, tiles.TileIndex.render
+
+        def locked(method):
+            def call(index, *args):
+                self.assertTrue(tiles._index_lock.locked())
+                return method(index, *args)
+            return call
+
+        with mock.patch.object(tiles.TileIndex, "version", locked(version)), \
+                mock.patch.object(tiles.TileIndex, "render", locked(render)):
+            self.assertEqual(self.client.get("/tiles/stations/10/489/475.pbf").status_code, 200)
+
+    def test_stock_change_invalidates_only_its_tile(self):
+        bamako_etag = self.client.get("/tiles/stations/10/489/475.pbf")["ETag"]
+        kayes_etag = self.client.get("/tiles/stations/10/479/470.pbf")["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Stock.objects.create(station=self.bamako, produit="essence", niveau="Plein")
+
+        response = self.client.get("/tiles/stations/10/489/475.pbf")
+        self.assertNotEqual(response["ETag"], bamako_etag)
+        self.assertIn(b"dispo", response.content)
+        self.assertEqual(self.client.get("/tiles/stations/10/479/470.pbf")["ETag"], kayes_etag)
+
+
+    def test_versions_stable_across_rebuilds_and_conditional_get(self):
+        url = "/tiles/stations/10/489/475.pbf"
+        etag = self.client.get(url)["ETag"]
+
+        # autre worker / redémarrage : index reconstruit, même version
+        tiles._index = None
+        self.assertEqual(self.client.get(url)["ETag"], etag)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+@enforce_query_budgets
+class StationsFeedCompactTests(TestCase):
+    URL = "/api/stations.geojson"
+    FIELDS = ("id", "nom", "adresse", "commune", "cercle", "region", "essence", "gasoil", "status", "stale", "is_followed")
+
+    def setUp(self):
+        cache.clear()
+        region = Region.objects.create(nom="Sikasso")
+        cercle = Cercle.objects.create(region=region, nom="Koutiala")
+        commune = Commune.objects.create(cercle=cercle, nom="Koutiala")
+        self.station = Station.objects.create(nom="Total Koutiala", commune=commune, latitude=12.39, longitude=-5.46)
+        Station.objects.create(nom="Shell Koutiala", adresse="Route de Sikasso", commune=commune, latitude=12.38, longitude=-5.47)
+        Station.objects.create(nom="Oryx Kadiolo", latitude=10.55, longitude=-5.76)
+        Stock.objects.create(station=self.station, produit="essence", niveau="Plein")
+        Stock.objects.create(station=self.station, produit="gasoil", niveau="Rupture")
+
+    def _geojson_rows(self, **headers):
+        features = self.client.get(self.URL, **headers).json()["features"]
+        return [
+            {**{k: f["properties"][k] for k in self.FIELDS}, "coordinates": f["geometry"]["coordinates"]}
+            for f in features
+        ]
+
+    def _decode(self, payload):
+        regions = dict(zip(payload["regions"]["id"], payload["regions"]["nom"]))
+        cercles = dict(zip(payload["cercles"]["id"], zip(payload["cercles"]["nom"], payload["cercles"]["region_id"])))
+        communes = dict(zip(payload["communes"]["id"], zip(payload["communes"]["nom"], payload["communes"]["cercle_id"])))
+        cols = payload["stations"]
+        statuts, labels = payload["statuts"], payload["status_global"]
+
+        rows = []
+        for i in range(payload["count"]):
+            commune, cercle_id = communes.get(cols["commune_id"][i], (None, None))
+            cercle, region_id = cercles.get(cercle_id, (None, None))
+            rows.append({
+                "id": cols["id"][i],
+                "nom": cols["nom"][i],
+                "adresse": cols["adresse"][i] or None,
+                "commune": commune,
+                "cercle": cercle,
+                "region": regions.get(region_id),
+                "essence": statuts[cols["essence"][i]],
+                "gasoil": statuts[cols["gasoil"][i]],
+                "status": labels[cols["status"][i]],
+                "stale": bool(cols["stale"][i]),
+                "is_followed": bool(cols["is_followed"][i]),
+                "coordinates": [cols["lng"][i], cols["lat"][i]],
+            })
+        return rows
+
+    def test_formats_round_trip_to_geojson_stations(self):
+        expected = self._geojson_rows()
+        self.assertEqual(len(expected), 3)
+
+        requests = [
+            ({"HTTP_ACCEPT": "application/msgpack"}, {}, "application/msgpack"),
+            ({}, {"format": "msgpack"}, "application/msgpack"),
+            ({"HTTP_ACCEPT": "application/vnd.malitadji.packed+json"}, {}, "application/vnd.malitadji.packed+json"),
+            ({"HTTP_ACCEPT": "application/msgpack"}, {"format": "packed"}, "application/vnd.malitadji.packed+json"),
+        ]
+        for headers, params, content_type in requests:
+            with self.subTest(headers=headers, params=params):
+                response = self.client.get(self.URL, params, **headers)
+                self.assertEqual(response["Content-Type"], content_type)
+                self.assertIn("Accept", [v.strip() for v in response["Vary"].split(",")])
+                if content_type == "application/msgpack":
+                    payload = msgpack.unpackb(response.content, raw=False, strict_map_key=False)
+                else:
+                    payload = json.loads(response.content)
+                self.assertEqual(payload["v"], 1)
+                self.assertEqual(self._decode(payload), expected)
+
+        # connecté : is_followed dans les deux encodages
+        user = User.objects.create_user("compact-user", password="pw")
+        StationFollow.objects.create(user=user, station=self.station)
+        self.client.force_login(user)
+        expected = self._geojson_rows()
+        self.assertTrue(next(r for r in expected if r["id"] == self.station.id)["is_followed"])
+        packed = self.client.get(self.URL, {"format": "packed"}).json()
+        self.assertEqual(self._decode(packed), expected)
+
+    def test_cache_key_per_format(self):
+        keys = {}
+        for name, headers, params in (
+            ("geojson", {}, {}),
+            ("msgpack", {"HTTP_ACCEPT": "application/msgpack"}, {}),
+            ("msgpack_param", {}, {"format": "msgpack"}),
+            ("packed", {}, {"format": "packed"}),
+        ):
+            with mock.patch(
+                "stations.api_geojson.aprecompressed_response", wraps=aprecompressed_response,
+            ) as cached:
+                self.client.get(self.URL, params, **headers)
+            keys[name] = cached.call_args.args[1]
+
+        self.assertEqual(keys["msgpack"], keys["msgpack_param"])
+        self.assertEqual(len({keys["geojson"], keys["msgpack"], keys["packed"]}), 3)
+
+        # une variante en cache ne sert pas un autre format
+        self.assertEqual(self.client.get(self.URL)["Content-Type"], "application/json")
+        self.assertEqual(self.client.get(self.URL, HTTP_ACCEPT="application/msgpack")["Content-Type"], "application/msgpack")
+
+
+@enforce_query_budgets
+class PrecompressedFeedTests(TestCase):
+    URL = "/api/stations.geojson"
+
+    def setUp(self):
+        cache.clear()
+        for i in range(10):
+            Station.objects.create(nom=f"Station Kita {i}", latitude=13.04, longitude=-9.49)
+
+    def _vary(self, response):
+        return [v.strip() for v in response["Vary"].split(",")]
+
+    def test_cached_entry_served_per_accept_encoding(self):
+        first = self.client.get(self.URL, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(first["Content-Encoding"], "gzip")
+        body = gzip.decompress(first.content)
+
+        # entrée en cache : ni requête ni recompression, variante choisie par client
+        with CaptureQueriesContext(connection) as ctx, \
+                mock.patch("stations.compression._compress") as compress:
+            br = self.client.get(self.URL, HTTP_ACCEPT_ENCODING="gzip, br")
+            plain = self.client.get(self.URL, HTTP_ACCEPT_ENCODING="deflate, br;q=0")
+            gz = self.client.get(self.URL, HTTP_ACCEPT_ENCODING="gzip;q=1, br;q=0")
+        self.assertFalse([q for q in ctx.captured_queries if "stations_stationstatus" in q["sql"]])
+        compress.assert_not_called()
+
+        self.assertEqual(br["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(br.content), body)
+        self.assertEqual(gz["Content-Encoding"], "gzip")
+        self.assertEqual(gz.content, first.content)
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertEqual(plain.content, body)
+        for response in (first, br, plain, gz):
+            self.assertIn("Accept-Encoding", self._vary(response))
+            self.assertIn("Accept", self._vary(response))
+            self.assertEqual(response["Content-Length"], str(len(response.content)))
+
+    def test_viewport_feed_brotli_and_identity(self):
+        params = {"bbox": "-10,13,-9,14"}
+        response = self.client.get(self.URL, params, HTTP_ACCEPT_ENCODING="br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(len(json.loads(brotli.decompress(response.content))["features"]), 10)
+
+        response = self.client.get(self.URL, params, HTTP_ACCEPT_ENCODING="identity")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(len(response.json()["features"]), 10)
+        self.assertIn("Accept-Encoding", self._vary(response))
+
+
+class GeoBundleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.region = Region.objects.create(nom="Tombouctou")
+        self.cercle = Cercle.objects.create(region=self.region, nom="Diré")
+        self.commune = Commune.objects.create(cercle=self.cercle, nom="Diré")
+
+    def _latest(self):
+        return self.client.get("/api/geo/").json()
+
+    def test_bundle_is_immutable_and_stale_digest_redirects(self):
+        latest = self._latest()
+        response = self.client.get(latest["url"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertEqual([c["nom"] for c in response.json()["communes"]], ["Diré"])
+
+        self.commune.nom = "Diré Centre"
+        self.commune.save()
+
+        response = self.client.get(latest["url"])
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response["Location"], self._latest()["url"])
+        self.assertEqual(self.client.get(response["Location"]).json()["communes"][0]["nom"], "Diré Centre")
+
+    def test_digest_changes_on_each_level_edit(self):
+        digests = [self._latest()["digest"]]
+        for obj in (self.region, self.cercle, self.commune):
+            obj.nom = f"{obj.nom} (renommé)"
+            obj.save()
+            digests.append(self._latest()["digest"])
+        self.assertEqual(len(set(digests)), 4)
+
+        # sauvegarde sans changement : nouvelle version, même contenu, même empreinte
+        self.region.save()
+        self.assertEqual(self._latest()["digest"], digests[-1])
+
+
+class StationStreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.station = Station.objects.create(nom="Total Badalabougou", latitude=12.63, longitude=-7.99)
+        self.other = Station.objects.create(nom="Oryx Sébénikoro", latitude=12.62, longitude=-8.05)
+        self.seq = current_seq()
+        with self.captureOnCommitCallbacks(execute=True):
+            Stock.objects.create(station=self.station, produit="essence", niveau="Plein")
+
+    async def test_resume_then_live_events(self):
+        response = await self.async_client.get(
+            f"/api/stations/stream/?stations={self.station.id}", headers={"Last-Event-ID": str(self.seq)},
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b"retry:"))
+
+        catch_up = (await anext(chunks)).decode()
+        self.assertIn("event: stock", catch_up)
+        self.assertIn('"essence":"dispo"', catch_up)
+
+        # une seule notification : l'autre station est filtrée, celle suivie arrive
+        await sync_to_async(changes._publish)([self.other.id, self.station.id])
+        live = (await asyncio.wait_for(anext(chunks), 5)).decode()
+        self.assertIn(f'"id":{self.station.id}', live)
+        self.assertNotIn(f'"id":{self.other.id}', live)
+
+        # changement global : le client doit recharger la carte
+        await sync_to_async(changes._publish)(None)
+        self.assertIn("event: reset", (await asyncio.wait_for(anext(chunks), 5)).decode())
+
+        # déconnexion (ASGI annule la lecture en cours) : le client est retiré
+        pending = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertFalse(broadcaster.subscribers)
+
+    async def test_invalid_filter(self):
+        self.assertEqual((await self.async_client.get("/api/stations/stream/?stations=a,b")).status_code, 400)
+
+    def test_refused_under_wsgi_with_poll_fallback(self):
+        response = self.client.get("/api/stations/stream/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["poll"]["url"], "/api/stations.geojson")
+        self.assertFalse(broadcaster.subscribers)
+
+
+class StationRefCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.station = Station.objects.create(nom="Oryx Kati", is_approved=False)
+
+    def test_read_through_and_signal_invalidation(self):
+        self.assertFalse(station_ref(self.station.id)["is_approved"])
+        with CaptureQueriesContext(connection) as queries:
+            station_ref(self.station.id)
+        self.assertEqual(len(queries), 0)
+
+        self.station.is_approved = True
+        self.station.save()
+        self.assertTrue(station_ref(self.station.id)["is_approved"])
+
+    def test_hit_miss_counters(self):
+        before = cache.stats()
+        station_ref(self.station.id)
+        station_ref(self.station.id)
+        after = cache.stats()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["local_hits"] - before["local_hits"], 1)
+
+
+class PublicPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.station = Station.objects.create(nom="Shell Kalaban", is_approved=False)
+        Stock.objects.create(station=self.station, produit="essence", niveau="Plein")
+
+    def test_etag_revalidation_covers_approvals(self):
+        first = self.client.get("/carte/")
+        self.assertEqual(first.status_code, 200)
+        self.assertFalse(first.has_header("Last-Modified"))
+        self.assertEqual(self.client.get("/carte/", HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+
+        # approbation sans nouveau relevé de stock
+        self.station.is_approved = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.station.save()
+
+        self.assertEqual(self.client.get("/carte/", HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 200)
+        since = http_date(time.time() + 3600)
+        self.assertEqual(self.client.get("/carte/", HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+
+class StationStatusProjectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        region = Region.objects.create(nom="Mopti")
+        cercle = Cercle.objects.create(region=region, nom="Mopti")
+        self.commune = Commune.objects.create(cercle=cercle, nom="Sévaré")
+        self.station = Station.objects.create(nom="Total Sévaré", commune=self.commune, is_approved=False)
+
+    def _row(self):
+        return StationStatus.objects.get(station=self.station)
+
+    def test_stock_write_updates_projection(self):
+        self.assertEqual((self._row().status, self._row().has_stock), ("inconnu", False))
+
+        stock = Stock.objects.create(station=self.station, produit="essence", niveau="Plein")
+        self.assertEqual((self._row().essence, self._row().status, self._row().has_stock), ("dispo", "dispo", True))
+
+        stock.niveau = "Rupture"
+        stock.save()
+        self.assertEqual(self._row().status, "rupture")
+
+        stock.delete()
+        self.assertEqual((self._row().status, self._row().has_stock), ("inconnu", False))
+
+    def test_global_status_rule(self):
+        Stock.objects.create(station=self.station, produit="essence", niveau="Plein")
+        gasoil = Stock.objects.create(station=self.station, produit="gasoil", niveau="Bas")
+        self.assertEqual(self._row().status, "faible")
+        gasoil.niveau = "Rupture"
+        gasoil.save()
+        self.assertEqual(self._row().status, "rupture")
+        self.assertEqual(statut_global(None, "dispo"), "dispo")
+
+    def test_station_and_hierarchy_edits_update_projection(self):
+        self.station.nom = "Total Sévaré Route"
+        self.station.save()
+        self.assertEqual(self._row().nom, "Total Sévaré Route")
+
+        self.commune.nom = "Sévaré Centre"
+        self.commune.save()
+        self.assertEqual(self._row().commune_nom, "Sévaré Centre")
+
+        self.station.delete()
+        self.assertFalse(StationStatus.objects.exists())
+
+    def test_admin_approval_from_filtered_changelist(self):
+        admin_user = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(admin_user)
+        seq = current_seq()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/admin/stations/station/?is_approved__exact=0",
+                {"action": "approuver_stations", "_selected_action": [self.station.id]},
+            )
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Station.objects.get(id=self.station.id).is_approved)
+        self.assertTrue(self._row().is_approved)
+        self.assertTrue(station_ref(self.station.id)["is_approved"])
+        self.assertEqual(changes.changes_since(seq), (current_seq(), {self.station.id}))
+
+    def test_migration_backfill_matches_refresh(self):
+        Stock.objects.create(station=self.station, produit="gasoil", niveau="Faible")
+        expected = list(StationStatus.objects.values())
+        StationStatus.objects.all().delete()
+
+        backfill = importlib.import_module("stations.migrations.0021_station_status")
+        backfill.fill_station_status(django_apps, None)
+
+        self.assertEqual(list(StationStatus.objects.values()), expected)
+
+
+class ProduitNiveauCodesTests(TestCase):
+    def setUp(self):
+        self.station = Station.objects.create(nom="Shell Hippodrome")
+        self.gerant = User.objects.create_user("codes-gerant", password="pw")
+
+    def test_integer_storage_and_canonical_values(self):
+        apply_stock_updates(user=self.gerant, updates=[(self.station, "Super", "plein"), (self.station, "Diesel", "BAS")])
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT produit, niveau FROM stations_stock WHERE station_id = %s ORDER BY produit", [self.station.id])
+            self.assertEqual(cursor.fetchall(), [(1, 1), (2, 2)])
+
+        self.assertEqual(
+            list(Stock.objects.filter(station=self.station).order_by("produit").values_list("produit", "niveau")),
+            [("essence", "Plein"), ("gasoil", "Bas")],
+        )
+        self.assertEqual(Stock.objects.filter(produit="Gasoil", niveau="bas").count(), 1)
+        self.assertIn('"produit" = 2', str(Stock.objects.filter(produit="gasoil").query))
+
+    def test_unknown_values_rejected(self):
+        with self.assertRaises(ValueError):
+            apply_stock_updates(user=self.gerant, updates=[(self.station, "kerosene", "Plein")])
+        response = self.client.post(
+            "/api/device/follow/%d/" % self.station.id, {"produit": "kerosene"},
+            content_type="application/json", HTTP_X_DEVICE_ID="codes-device",
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ProduitNiveauMigrationTests(TransactionTestCase):
+    before = [("stations", "0022_hot_filter_indexes")]
+    after = [("stations", "0023_produit_niveau_codes")]
+
+    def _migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self._migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_forwards_keeps_latest_stock_and_drops_unreadable_follows(self):
+        old = self._migrate(self.before)
+        station = old.get_model("stations", "Station").objects.create(nom="Oryx Kita")
+        Stock = old.get_model("stations", "Stock")
+        latest = Stock.objects.create(station=station, produit="Super", niveau="plein")
+        Stock.objects.create(station=station, produit="essence", niveau="Rupture")
+        Stock.objects.filter(id=latest.id).update(date_maj=timezone.now() + timedelta(hours=1))
+        device = old.get_model("stations", "Device").objects.create(device_id="migration-device")
+        DeviceFollow = old.get_model("stations", "DeviceFollow")
+        DeviceFollow.objects.create(device=device, station=station, produit="kerosene")
+        DeviceFollow.objects.create(device=device, station=station, produit="Gasoil")
+
+        new = self._migrate(self.after)
+
+        stocks = new.get_model("stations", "Stock").objects.values_list("id", "produit", "niveau")
+        self.assertEqual(list(stocks), [(latest.id, "essence", "Plein")])
+        # kerosene : supprimé, pas transformé en abonnement à tous les produits (NULL)
+        follows = new.get_model("stations", "DeviceFollow").objects.values_list("produit", flat=True)
+        self.assertEqual(list(follows), ["gasoil"])
+
+
+class DeviceApiQueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(nom="Kayes")
+        cercle = Cercle.objects.create(region=region, nom="Kayes")
+        commune = Commune.objects.create(cercle=cercle, nom="Kayes Ndi")
+        cls.device = Device.objects.create(device_id="dev-follows", fcm_token="tok")
+        for i in range(5):
+            station = Station.objects.create(nom=f"Station {i}", commune=commune)
+            DeviceFollow.objects.create(device=cls.device, station=station)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_follows_single_query_when_warm(self):
+        headers = {"HTTP_X_DEVICE_ID": "dev-follows"}
+        self.client.get("/api/device/follows/", **headers)  # device en cache, last_seen à jour
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/device/follows/", **headers)
+
+        body = response.json()
+        self.assertEqual(body["count"], 5)
+        self.assertEqual(body["items"][0]["commune"], "Kayes Ndi (Kayes, Kayes)")
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+
+@enforce_query_budgets
+class AsyncViewsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(nom="Ségou")
+        cercle = Cercle.objects.create(region=region, nom="Ségou")
+        commune = Commune.objects.create(cercle=cercle, nom="Pelengana")
+        cls.station = Station.objects.create(nom="Star Oil Ségou", commune=commune, latitude=13.43, longitude=-6.26)
+        Device.objects.create(device_id="dev-async", fcm_token="tok")
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    async def test_device_follow_cycle(self):
+        headers = {"X-Device-Id": "dev-async"}
+        url = f"/api/device/follow/{self.station.id}/"
+        response = await self.async_client.post(url, {"produit": "Super"}, content_type="application/json", headers=headers)
+        self.assertEqual(response.json()["produit"], "essence")
+
+        body = (await self.async_client.get("/api/device/follows/", headers=headers)).json()
+        self.assertEqual([(i["station_id"], i["commune"]) for i in body["items"]], [(self.station.id, "Pelengana (Ségou, Ségou)")])
+
+        response = await self.async_client.post(
+            f"/api/device/unfollow/{self.station.id}/", {"produit": "essence"}, content_type="application/json", headers=headers,
+        )
+        self.assertEqual(response.json()["count"], 1)
+        self.assertEqual((await self.async_client.post(url, "{", content_type="application/json", headers=headers)).status_code, 400)
+
+        # requêtes de l'ORM async comptées par le middleware
+        self.assertGreater(metrics.snapshot()["api_follow_station"]["queries"], 0)
+
+    async def test_feed_and_geo_served_from_cache(self):
+        feed = await self.async_client.get("/api/stations.geojson")
+        self.assertEqual(feed.json()["features"][0]["properties"]["commune"], "Pelengana")
+        for path in ("/api/stations.geojson", "/api/regions/", "/api/geo/"):
+            first = await self.async_client.get(path)
+            second = await self.async_client.get(path)
+            self.assertEqual(first.content, second.content)
+
+        # 1 requête StationStatus à la construction, 0 ensuite
+        views = metrics.snapshot()
+        self.assertEqual(views["stations_geojson"]["requests"], 3)
+        self.assertEqual(views["stations_geojson"]["queries"], 1)
+
+
+    def test_viewport_feed_compressed_without_cache_entry(self):
+        for i in range(10):
+            Station.objects.create(nom=f"Station Ségou {i}", commune=self.station.commune, latitude=13.4, longitude=-6.2)
+
+        with mock.patch("stations.compression.cache") as compression_cache:
+            response = self.client.get(
+                "/api/stations.geojson", {"bbox": "-7,13,-6,14"}, HTTP_ACCEPT_ENCODING="gzip",
+            )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))["features"]), 11)
+        compression_cache.set.assert_not_called()
+        compression_cache.aset.assert_not_called()
+
+class BenchmarkTests(TestCase):
+    def test_seed_measure_and_compare(self):
+        from .benchmark import compare_runs, dataset_size, purge_dataset, run_benchmark, seed_dataset
+
+        seed_dataset(20, history_per_station=1)
+        seed_dataset(30, history_per_station=1)  # incrémental
+        self.assertEqual(dataset_size(), 30)
+
+        results = run_benchmark(iterations=2, only=["stations_geojson", "device_follows"])
+        self.assertEqual([r["endpoint"] for r in results], ["stations_geojson", "device_follows"])
+        self.assertTrue(all(r["status"] == 200 and r["bytes"] > 0 for r in results))
+
+        run = {"datasets": [{"stations": 30, "results": results}]}
+        self.assertEqual(compare_runs(run, run), [])
+        slower = {"datasets": [{"stations": 30, "results": [dict(results[0], p95_ms=results[0]["p95_ms"] * 2 + 10)]}]}
+        self.assertEqual(len(compare_runs(run, slower)), 1)
+
+        purge_dataset()
+        self.assertEqual(dataset_size(), 0)
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from .benchmark import seed_dataset
+
+        seed_dataset(2000, history_per_station=3)
+
+    def test_hot_queries_use_indexes(self):
+        from .query_plans import check_hot_queries
+
+        scans = {r["name"]: r["full_scans"] for r in check_hot_queries() if r["full_scans"]}
+        self.assertEqual(scans, {})
+
+    def test_detects_full_scan(self):
+        from .query_plans import explain, full_scans
+
+        plan = explain(Station.objects.filter(adresse="Rue 1"))
+        self.assertEqual(full_scans(plan, [Station._meta.db_table]), [Station._meta.db_table])
+
+
+@enforce_query_budgets
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("metrics", "metrics@example.com", "pw")
+        Station.objects.create(nom="Station A", latitude=12.6, longitude=-8.0)
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    def test_admin_index_and_feed_within_budget(self):
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get("/admin/").status_code, 200)
+        self.assertEqual(self.client.get("/api/stations.geojson").status_code, 200)
+
+        body = self.client.get("/metrics/").content.decode()
+        self.assertIn('malitadji_requests_total{view="stations_geojson"} 1', body)
+        self.assertIn('malitadji_query_budget_exceeded_total{view="malitadji_admin:index"} 0', body)
+
+    def test_budget_exceeded_fails(self):
+        with self.settings(QUERY_BUDGETS={"stations_geojson": 0}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get("/api/stations.geojson")
+
+        self.client.force_login(self.admin)
+        with self.settings(QUERY_BUDGETS={"malitadji_admin:index": 1}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get("/admin/")
+
+    def test_budget_exceeded_logged_in_log_mode(self):
+        with self.settings(QUERY_BUDGETS={"stations_geojson": 0}, QUERY_BUDGET_MODE="log"), \
+                self.assertLogs("malitadji.requests", "WARNING") as logs:
+            self.assertEqual(self.client.get("/api/stations.geojson").status_code, 200)
+        self.assertIn("budget de requêtes dépassé", logs.output[0])
+        self.assertEqual(metrics.snapshot()["stations_geojson"]["budget_exceeded"], 1)
+
+    def test_metrics_requires_staff_or_token(self):
+        self.assertEqual(self.client.get("/metrics/").status_code, 403)
+        with self.settings(METRICS_TOKEN="s3cret"):
+            response = self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+
+
+class NotificationTracingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gerant = User.objects.create_user("gerant-trace", "gt@example.com", "pw")
+        cls.station = Station.objects.create(nom="Station Trace", gerant=cls.gerant)
+        Stock.objects.create(station=cls.station, produit="essence", niveau="Rupture")
+        for i in range(3):
+            device = Device.objects.create(device_id=f"trace-{i}", fcm_token=f"tok-trace-{i}")
+            DeviceFollow.objects.create(device=device, station=cls.station)
+
+    def test_plein_event_is_traced(self):
+        sent = {"sent": 3, "fail": 0, "invalid": 0, "invalid_tokens": []}
+        with mock.patch("notifications.utils._send_multicast", return_value=sent) as send:
+            res = apply_stock_updates(user=self.gerant, updates=[(self.station, "essence", "Plein")])
+
+        self.assertEqual(res["push"]["sent"], 3)
+        event_id = send.call_args.args[2]["event_id"]
+        trace_id = NotificationSpan.objects.get(name="event").trace_id
+        spans = dict(NotificationSpan.objects.filter(trace_id=trace_id).values_list("name", "attrs"))
+        self.assertLessEqual({"stock_write", "spam_guard", "followers", "event", "token_lookup", "fcm_chunk", "total"}, set(spans))
+        self.assertEqual(spans["event"], {"event_id": event_id, "station_id": self.station.id, "produit": "essence", "users": 0, "devices": 3})
+        self.assertEqual(spans["total"]["event_ids"], [event_id])
+        self.assertEqual(spans["fcm_chunk"]["size"], 3)
+        self.assertEqual(spans["total"]["sent"], 3)
+
+        report = latency_report(days=1)
+        self.assertEqual(report["total"]["count"], 1)
+        self.assertEqual(report["chunks"][0]["max_size"], 50)
+
+        self.client.force_login(User.objects.create_superuser("trace-admin", "ta@example.com", "pw"))
+        response = self.client.get("/admin/notifications/latence/?days=1")
+        self.assertContains(response, event_id)
+
+    def test_one_event_id_per_stock_event(self):
+        Stock.objects.create(station=self.station, produit="gasoil", niveau="Rupture")
+        sent = {"sent": 3, "fail": 0, "invalid": 0, "invalid_tokens": []}
+        with mock.patch("notifications.utils._send_multicast", return_value=sent) as send:
+            apply_stock_updates(user=self.gerant, updates=[(self.station, "essence", "Plein"), (self.station, "gasoil", "Plein")])
+
+        pushed = {c.args[2]["produit"]: c.args[2]["event_id"] for c in send.call_args_list}
+        self.assertEqual(set(pushed), {"essence", "gasoil"})
+        self.assertNotEqual(pushed["essence"], pushed["gasoil"])
+
+        # une trace pour l'appel (étapes communes), un span par événement
+        self.assertEqual(NotificationSpan.objects.filter(name="total").count(), 1)
+        events = {a["produit"]: a["event_id"] for a in NotificationSpan.objects.filter(name="event").values_list("attrs", flat=True)}
+        self.assertEqual(events, pushed)
+
+    def test_update_without_event_is_not_traced(self):
+        apply_stock_updates(user=self.gerant, updates=[(self.station, "essence", "Faible")])
+        self.assertFalse(NotificationSpan.objects.exists())
+
+    def test_push_without_firebase_config(self):
+        with mock.patch.object(push_client, "_initialized", False), \
+                mock.patch.object(push_client, "_app", None), \
+                mock.patch.object(push_client, "_load_service_account", return_value=None), \
+                mock.patch("firebase_admin._apps", {}):
+            res = apply_stock_updates(user=self.gerant, updates=[(self.station, "essence", "Plein")])
+        self.assertEqual(res["push"]["sent"], 0)
+        self.assertEqual(res["push"]["fail"], 3)
+
+
+class TokenRegistryTests(TestCase):
+    def setUp(self):
+        self.station = Station.objects.create(nom="Shell Kati")
+
+    def test_token_moves_to_latest_device(self):
+        for device_id in ("reinstall-1", "reinstall-2"):
+            response = self.client.post(
+                "/api/device/register/", {"device_id": device_id, "fcm_token": " tok-shared "}, content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 200)
+
+        tokens = dict(Device.objects.values_list("device_id", "fcm_token"))
+        self.assertEqual(tokens, {"reinstall-1": None, "reinstall-2": "tok-shared"})
+        self.assertEqual(Device.objects.get(device_id="reinstall-2").fcm_token_hash, fcm_token_hash("tok-shared"))
+
+    def test_legacy_token_only_registration_accepted(self):
+        Device.objects.create(device_id="known", fcm_token="tok-known")
+        factory = RequestFactory()
+
+        def post(body, **headers):
+            return register_fcm_token(factory.post("/", body, content_type="application/json", **headers))
+
+        for token, registered in (("tok-known", True), ("tok-orphan", False)):
+            response = post({"token": token})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content)["registered"], registered)
+        self.assertEqual(Device.objects.count(), 1)
+
+        response = post({"token": "tok-header"}, HTTP_X_DEVICE_ID="from-header")
+        self.assertEqual(json.loads(response.content), {"ok": True, "created": True, "registered": True})
+        self.assertEqual(Device.objects.get(device_id="from-header").fcm_token, "tok-header")
+
+        response = post("{not json")
+        self.assertEqual((response.status_code, json.loads(response.content)["error"]), (400, "invalid json"))
+
+    def test_invalid_tokens_pruned_in_bulk(self):
+        for i in range(3):
+            device = Device.objects.create(device_id=f"prune-{i}", fcm_token=f"tok-prune-{i}")
+            DeviceFollow.objects.create(device=device, station=self.station)
+
+        res = {"sent": 1, "fail": 2, "invalid": 2, "invalid_tokens": ["tok-prune-0", "tok-prune-2"]}
+        message = {"device_ids": ["prune-0", "prune-1", "prune-2"], "title": "t", "body": "b"}
+        with mock.patch("notifications.utils._send_multicast", return_value=res) as send:
+            send_fcm_batch([message])
+            # un refus ne suffit pas : le token reste ciblé
+            self.assertEqual(Device.objects.filter(fcm_token_hash__isnull=False).count(), 3)
+            for _ in range(invalid_token_strikes() - 1):
+                send_fcm_batch([message])
+
+        self.assertEqual(send.call_args.args[0], ["tok-prune-0", "tok-prune-1", "tok-prune-2"])
+        self.assertEqual(
+            list(Device.objects.filter(fcm_token_hash__isnull=False).values_list("device_id", flat=True)), ["prune-1"],
+        )
+        failures = dict(Device.objects.values_list("device_id", "token_failures"))
+        self.assertEqual(failures, {"prune-0": 3, "prune-1": 0, "prune-2": 3})
+
+
+class InactiveDeviceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        flush_last_seen()
+        self.station = Station.objects.create(nom="Total Sikasso")
+        patcher = mock.patch("stations.devices._wait_for_flushes")
+        self.wait_for_flushes = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _request(self, device_id):
+        return RequestFactory().get("/", HTTP_X_DEVICE_ID=device_id)
+
+    def test_last_seen_buffered_and_flushed_in_one_update(self):
+        devices = [Device.objects.create(device_id=f"seen-{i}") for i in range(3)]
+        stale = timezone.now() - timedelta(days=1)
+        Device.objects.update(last_seen_at=stale)
+
+        with CaptureQueriesContext(connection) as ctx:
+            for device in devices:
+                self.assertTrue(touch_device(resolve_device(self._request(device.device_id))))
+        self.assertFalse(any(q["sql"].startswith("UPDATE") for q in ctx.captured_queries))
+        self.assertEqual(Device.objects.filter(last_seen_at=stale).count(), 3)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(flush_last_seen(), 3)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertFalse(Device.objects.filter(last_seen_at=stale).exists())
+
+    def test_each_device_keeps_its_own_seen_time(self):
+        devices = [Device.objects.create(device_id=f"own-{i}") for i in range(2)]
+        Device.objects.update(last_seen_at=timezone.now() - timedelta(days=1))
+        seen = [timezone.now() - timedelta(seconds=50), timezone.now()]
+
+        for device, at in zip(devices, seen):
+            with mock.patch("stations.devices.timezone.now", return_value=at):
+                touch_device(resolve_device(self._request(device.device_id)))
+        flush_last_seen()
+
+        self.assertEqual(list(Device.objects.order_by("id").values_list("last_seen_at", flat=True)), seen)
+
+    def test_idle_worker_flushes_on_timer(self):
+        device = Device.objects.create(device_id="idle")
+        Device.objects.filter(id=device.id).update(last_seen_at=timezone.now() - timedelta(days=1))
+        touch_device(resolve_device(self._request("idle")))
+
+        # un tour de la boucle du thread, sans autre requête sur ce worker
+        with mock.patch("stations.devices.time.sleep", side_effect=[None, SystemExit]) as sleep, \
+                mock.patch("stations.devices.connection"):
+            with self.assertRaises(SystemExit):
+                devices_module._flush_periodically()
+
+        sleep.assert_called_with(devices_module.last_seen_flush_seconds())
+        self.assertFalse(devices_module._seen)
+        device.refresh_from_db()
+        self.assertGreater(device.last_seen_at, timezone.now() - timedelta(minutes=1))
+
+    def test_sweep_waits_for_workers_to_flush_before_deciding(self):
+        old = timezone.now() - timedelta(days=inactive_days() + 1)
+        device = Device.objects.create(device_id="seen-elsewhere")
+        DeviceFollow.objects.create(device=device, station=self.station)
+        Device.objects.filter(id=device.id).update(last_seen_at=old)
+
+        # visite reçue par un autre worker : en tampon là-bas, écrite par son thread
+        touch_device(resolve_device(self._request("seen-elsewhere")))
+        elsewhere = dict(devices_module._seen)
+        devices_module._seen.clear()
+        self.wait_for_flushes.side_effect = lambda seconds: devices_module._write_seen(elsewhere)
+
+        self.assertEqual(deactivate_inactive_devices(), {"devices": 0, "follows": 0})
+        self.wait_for_flushes.assert_called_once_with(
+            devices_module.last_seen_flush_seconds() + devices_module.LAST_SEEN_FLUSH_GRACE
+        )
+        device.refresh_from_db()
+        self.assertTrue(device.is_active)
+        self.assertTrue(DeviceFollow.objects.get(device=device).is_active)
+
+    def test_silent_and_refused_devices_deactivated_with_follows(self):
+        old = timezone.now() - timedelta(days=inactive_days() + 1)
+        silent = Device.objects.create(device_id="silent")
+        refused = Device.objects.create(device_id="refused", token_failures=invalid_token_strikes())
+        live = Device.objects.create(device_id="live", fcm_token="tok-live")
+        Device.objects.filter(id=silent.id).update(last_seen_at=old)  # auto_now
+        for device in (silent, refused, live):
+            DeviceFollow.objects.create(device=device, station=self.station)
+        resolve_device(self._request("silent"))  # en cache
+
+        res = deactivate_inactive_devices()
+
+        self.assertEqual(res, {"devices": 2, "follows": 2})
+        self.assertEqual(list(Device.objects.filter(is_active=True).values_list("device_id", flat=True)), ["live"])
+        self.assertEqual(
+            list(DeviceFollow.objects.filter(is_active=True).values_list("device__device_id", flat=True)), ["live"],
+        )
+        self.assertFalse(resolve_device(self._request("silent"))["is_active"])
+
+        # le device revient : réactivé, compteur de refus remis à zéro
+        ref = resolve_device(self._request("refused"))
+        touch_device(ref, reactivate=True)
+        refused.refresh_from_db()
+        self.assertEqual((refused.is_active, refused.token_failures), (True, 0))
+        self.assertTrue(DeviceFollow.objects.get(device=refused).is_active)
+
+    def test_swept_follows_restored_on_token_rotation(self):
+        other = Station.objects.create(nom="Total Koutiala")
+        device = Device.objects.create(device_id="rotated", fcm_token="tok-old", token_failures=invalid_token_strikes())
+        DeviceFollow.objects.create(device=device, station=self.station)
+        DeviceFollow.objects.create(device=device, station=other, produit="gasoil")
+        # désabonnement volontaire : ne doit pas revenir
+        DeviceFollow.objects.create(device=device, station=other, produit="essence", is_active=False)
+
+        self.assertEqual(deactivate_inactive_devices(), {"devices": 1, "follows": 2})
+        self.assertEqual(self.client.get("/api/device/follows/", HTTP_X_DEVICE_ID="rotated").json()["count"], 0)
+
+        register_token("rotated", "tok-new")
+
+        active = set(DeviceFollow.objects.filter(is_active=True).values_list("station_id", "produit"))
+        self.assertEqual(active, {(self.station.id, None), (other.id, "gasoil")})
+        self.assertFalse(DeviceFollow.objects.filter(deactivated_by_sweep=True).exists())
+        self.assertEqual(self.client.get("/api/device/follows/", HTTP_X_DEVICE_ID="rotated").json()["count"], 2)
 
-# Create your tests here.
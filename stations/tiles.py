@@ -0,0 +1,174 @@
+# stations/tiles.py
+"""
+Tuiles vectorielles (MVT) des stations : /tiles/stations/{z}/{x}/{y}.pbf
+
+Même source que la carte GeoJSON / les clusters (clustering._load_stations).
+Index par processus, rattrapé sur le journal stations/changes.py.
+
+Version d'une tuile = empreinte des stations qu'elle contient (champs rendus) :
+identique dans tous les workers et après un redémarrage ou une reconstruction,
+elle sert de clé de cache et d'ETag. Mémorisée par processus ; pour chaque
+station modifiée, seules les tuiles de son ancienne et de sa nouvelle position
+sont recalculées.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+
+from django.core.cache import cache
+
+from .changes import changes_since, current_seq
+from .clustering import _cell, _load_stations
+from .mvt import encode_tile, lnglat_to_tile_px
+
+LAYER = "stations"
+# au-delà, la version d'une tuile est celle de son ancêtre à ce zoom
+MAX_TILE_ZOOM = 16
+MAX_ZOOM = 22
+TILE_TTL = 24 * 3600
+# index spatial : seau = tuile à ce zoom
+BUCKET_ZOOM = 10
+
+
+def _tile_key(z: int, x: int, y: int, version: str) -> str:
+    return f"tiles:{LAYER}:{z}:{x}:{y}:{version}"
+
+
+class TileIndex:
+    def __init__(self, seq: int):
+        self.seq = seq
+        self.stations: dict[int, dict] = {}
+        self.buckets: dict[tuple[int, int], set[int]] = {}
+        # (z, x, y) -> empreinte mémorisée du contenu de la tuile
+        self.versions: dict[tuple[int, int, int], str] = {}
+
+        for st in _load_stations().values():
+            self._add(st)
+
+    def _add(self, st: dict) -> None:
+        self.stations[st["id"]] = st
+        self.buckets.setdefault(_cell(st["lat"], st["lng"], BUCKET_ZOOM), set()).add(st["id"])
+
+    def _remove(self, station_id: int) -> dict | None:
+        st = self.stations.pop(station_id, None)
+        if st is not None:
+            key = _cell(st["lat"], st["lng"], BUCKET_ZOOM)
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(station_id)
+                if not bucket:
+                    del self.buckets[key]
+        return st
+
+    def _touch(self, st: dict) -> None:
+        for z in range(MAX_TILE_ZOOM + 1):
+            self.versions.pop((z, *_cell(st["lat"], st["lng"], z)), None)
+
+    def update(self, seq: int, station_ids: set[int]) -> None:
+        fresh = _load_stations(station_ids)
+        for sid in station_ids:
+            old = self._remove(sid)
+            if old is not None:
+                self._touch(old)
+            new = fresh.get(sid)
+            if new is not None:
+                self._add(new)
+                self._touch(new)
+        self.seq = seq
+
+    def version(self, z: int, x: int, y: int) -> str:
+        if z > MAX_TILE_ZOOM:
+            shift = z - MAX_TILE_ZOOM
+            z, x, y = MAX_TILE_ZOOM, x >> shift, y >> shift
+        version = self.versions.get((z, x, y))
+        if version is None:
+            digest = hashlib.blake2b(digest_size=8)
+            for st in sorted(self.stations_in(z, x, y), key=lambda s: s["id"]):
+                digest.update(repr(
+                    (st["id"], st["lat"], st["lng"], st["nom"], st["essence"], st["gasoil"], st["status"])
+                ).encode("utf-8"))
+            version = self.versions[(z, x, y)] = digest.hexdigest()
+        return version
+
+    def stations_in(self, z: int, x: int, y: int) -> list[dict]:
+        if z >= BUCKET_ZOOM:
+            shift = z - BUCKET_ZOOM
+            ids = self.buckets.get((x >> shift, y >> shift), ())
+        else:
+            shift = BUCKET_ZOOM - z
+            ids = [
+                sid
+                for (bx, by), bucket in self.buckets.items()
+                if bx >> shift == x and by >> shift == y
+                for sid in bucket
+            ]
+
+        out = []
+        for sid in ids:
+            st = self.stations[sid]
+            if z < BUCKET_ZOOM or _cell(st["lat"], st["lng"], z) == (x, y):
+                out.append(st)
+        return out
+
+    def render(self, z: int, x: int, y: int) -> bytes:
+        features = [
+            {
+                "id": st["id"],
+                "px": lnglat_to_tile_px(st["lng"], st["lat"], z, x, y),
+                "properties": {
+                    "id": st["id"],
+                    "nom": st["nom"],
+                    "essence": st["essence"],
+                    "gasoil": st["gasoil"],
+                    "status": st["status"],
+                },
+            }
+            for st in sorted(self.stations_in(z, x, y), key=lambda s: s["id"])
+        ]
+        return encode_tile({LAYER: features})
+
+
+_index: TileIndex | None = None
+_index_lock = threading.Lock()
+
+
+def _caught_up_index() -> TileIndex:
+    """
+    Index du processus, rattrapé sur le journal des changements (appelant : _index_lock tenu).
+    update() le modifie sur place : ne le lire que sous ce verrou.
+    """
+    global _index
+    if _index is None:
+        _index = TileIndex(current_seq())
+        return _index
+
+    seq, changed = changes_since(_index.seq)
+    if changed is None:
+        _index = TileIndex(seq)
+    elif changed:
+        _index.update(seq, changed)
+    else:
+        _index.seq = seq
+    return _index
+
+
+def tile_version(z: int, x: int, y: int) -> str:
+    with _index_lock:
+        return _caught_up_index().version(z, x, y)
+
+
+def station_tile(z: int, x: int, y: int) -> tuple[bytes, str]:
+    """
+    (octets MVT, version de la tuile) ; servi depuis le cache si la version n'a pas bougé.
+    """
+    version = tile_version(z, x, y)
+    data = cache.get(_tile_key(z, x, y, version))
+    if data is None:
+        # version relue avec le rendu : l'index a pu avancer depuis
+        with _index_lock:
+            index = _caught_up_index()
+            version = index.version(z, x, y)
+            data = index.render(z, x, y)
+        cache.set(_tile_key(z, x, y, version), data, TILE_TTL)
+    return data, version
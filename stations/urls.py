@@ -1,6 +1,13 @@
 # stations/urls.py
 from django.urls import path
-from .api_admin_geo import api_regions, api_cercles, api_communes
+from .api_admin_geo import api_regions, api_cercles, api_communes, api_geo_bundle, api_geo_latest
+from .api_clusters import stations_clusters
+from .api_freshness import stale_stations_list
+from .api_heatmap import shortages_heatmap
+from .api_manager import manager_stock_updates
+from .api_search import stations_search
+from .api_tiles import station_tiles
+from .live import stations_stream
 from . import views
 from . import api
 
@@ -15,6 +22,7 @@ urlpatterns = [
     path("manager/logout/", views.manager_logout, name="manager_logout"),
     path("politique-confidentialite/", views.politique_confidentialite, name="politique_confidentialite"),
     path("manager/stations/ajouter/", views.manager_add_station, name="manager_add_station"),
+    path("manager/stations/search/", views.manager_station_search, name="manager_station_search"),
     path("manager/stations/validation/",views.admin_station_validation,  name="admin_station_validation"),
 
     # API Device (public)
@@ -27,4 +35,29 @@ urlpatterns = [
     path("api/regions/", api_regions, name="api_regions"),
     path("api/cercles/", api_cercles, name="api_cercles"),
     path("api/communes/", api_communes, name="api_communes"),
+
+    # Bundle géo versionné (URL à empreinte, cache immuable)
+    path("api/geo/", api_geo_latest, name="api_geo_latest"),
+    path("api/geo/<str:digest>.json", api_geo_bundle, name="api_geo_bundle"),
+
+    # API Heatmap ruptures (agrégats pré-calculés)
+    path("api/shortages/heatmap/", shortages_heatmap, name="api_shortages_heatmap"),
+
+    # API Clusters carte (grille précalculée)
+    path("api/stations/clusters/", stations_clusters, name="api_stations_clusters"),
+
+    # Tuiles vectorielles (MVT) des stations
+    path("tiles/stations/<int:z>/<int:x>/<int:y>.pbf", station_tiles, name="station_tiles"),
+
+    # API Recherche (typeahead public)
+    path("api/stations/search/", stations_search, name="api_stations_search"),
+
+    # Flux SSE des changements de stock (ASGI)
+    path("api/stations/stream/", stations_stream, name="api_stations_stream"),
+
+    # API Fraîcheur (stocks non relevés depuis le seuil)
+    path("api/stations/stale/", stale_stations_list, name="api_stale_stations"),
+
+    # API Gérant (JWT) : mises à jour de stock groupées
+    path("api/manager/stocks/", manager_stock_updates, name="api_manager_stock_updates"),
 ]
@@ -1,125 +1,52 @@
 # stations/views.py
 from __future__ import annotations
 
-from datetime import timedelta
+import logging
 
+from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.db import transaction
-from django.db.models import Q
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.utils import timezone
 from django.contrib.admin.views.decorators import staff_member_required
 
-import json
 from django.shortcuts import render
 
-from .models import Region, Cercle, Commune  # ✅ adapte si besoin
+from .models import Commune  # ✅ adapte si besoin
 
 from .forms import StockForm
+from .follow_counts import follower_counts
+from .geo_cache import geo_bundle, geo_reference_lists
 from .models import (
-    DeviceFollow,
-    InAppNotification,
     Station,
-    StationFollow,
     Stock,
-    StockHistory,
 )
+from .page_cache import versioned_page
+from .search import get_index, search_stations
+from .status import status_kpis
+from .stock_updates import apply_stock_updates
 
-from notifications.utils import send_push_to_device_follows
+logger = logging.getLogger(__name__)
 
-
-# -----------------------------
-# Helpers
-# -----------------------------
-def _norm_produit(p) -> str | None:
-    if p is None:
-        return None
-    s = str(p).strip().lower()
-    if not s:
-        return None
-    if "gaso" in s or "diesel" in s:
-        return "gasoil"
-    if "ess" in s or "super" in s:
-        return "essence"
-    return s
-
-
-def _is_plein(niveau: str | None) -> bool:
-    return str(niveau or "").strip().lower() == "plein"
-
-def station_location_label(station) -> str:
-    location = station.nom
-
-    if station.commune:
-        location += f", {station.commune.nom}"
-
-        if station.commune.cercle and station.commune.cercle.region:
-            location += f" ({station.commune.cercle.region.nom})"
-
-    return location
-
-
-def create_in_app_notification(*, user, station, produit: str, niveau: str) -> InAppNotification:
-    title = "Carburant disponible" if _is_plein(niveau) else "Stock mis à jour"
-    location = station_location_label(station)
-    message = f"{location} : {str(produit).capitalize()} → {niveau}"
-
-    # Clé anti-doublon "soft" (1 notif max / minute / user / station / produit / niveau)
-    minute_key = timezone.now().strftime("%Y%m%d%H%M")
-    event_key = f"{user.id}:{station.id}:{produit}:{niveau}:{minute_key}"
-
-    obj, _ = InAppNotification.objects.get_or_create(
-        event_key=event_key,
-        defaults={
-            "user": user,
-            "station": station,
-            "produit": produit,
-            "title": title,
-            "message": message,
-        },
-    )
-    return obj
+TYPEAHEAD_LIMIT = 20
 
 
 # -----------------------------
 # ✅ HOME (mise à jour intégrée)
 # -----------------------------
+@versioned_page
 def home(request):
-    # Récupère stations + stocks en une fois (évite N+1)
-    stations = Station.objects.all().prefetch_related("stocks")
-    total_stations = stations.count()
-
-    # Dernière mise à jour
-    last_update = Stock.objects.order_by("-date_maj").values_list("date_maj", flat=True).first()
-
-    # Comptage stations ayant au moins 1 stock renseigné
-    stations_avec_stock = Stock.objects.values("station_id").distinct().count()
+    # KPIs en 1 requête sur la projection StationStatus (stations/status.py)
+    kpis = status_kpis()
+    total_stations = kpis["total_stations"]
+    stations_avec_stock = kpis["stations_avec_stock"]
+    last_update = kpis["last_update"]
 
     # Status par station (priorité: rupture > faible/bas > dispo(plein) > inconnu)
-    dispo_count = 0
-    faible_count = 0
-    rupture_count = 0
-    inconnu_count = 0
-
-    def _norm_niveau(n: str | None) -> str:
-        return str(n or "").strip().lower()
-
-    for st in stations:
-        niveaux = [_norm_niveau(s.niveau) for s in st.stocks.all()]
-
-        if not niveaux:
-            inconnu_count += 1
-            continue
-
-        if any(n == "rupture" for n in niveaux):
-            rupture_count += 1
-        elif any(n in ("faible", "bas") for n in niveaux):
-            faible_count += 1
-        elif any(n == "plein" for n in niveaux):
-            dispo_count += 1
-        else:
-            inconnu_count += 1
+    dispo_count = kpis["dispo_count"]
+    faible_count = kpis["faible_count"]
+    rupture_count = kpis["rupture_count"]
+    inconnu_count = kpis["inconnu_count"]
 
     # Pourcentages (évite division par zéro)
     denom = total_stations or 1
@@ -143,6 +70,7 @@ def home(request):
     return render(request, "stations/home.html", ctx)
 
 
+@versioned_page
 def carte(request):
     # Valeurs sélectionnées (GET)
     region_selected = (request.GET.get("region") or "").strip()
@@ -150,29 +78,23 @@ def carte(request):
     commune_selected = (request.GET.get("commune") or "").strip()
     statut_selected = (request.GET.get("statut") or "").strip()
 
-    # Listes (pour afficher dans les <select>)
-    regions = Region.objects.order_by("nom")
-
-    cercles_qs = Cercle.objects.select_related("region").order_by("nom")
-    communes_qs = Commune.objects.select_related("cercle").order_by("nom")
+    # Listes (pour afficher dans les <select>) : cache versionné, pas de requête
+    geo = geo_reference_lists()
+    regions = geo["regions"]
+    cercles = geo["cercles"]
+    communes = geo["communes"]
 
     # ✅ Optionnel : pré-filtrer les listes visibles selon la sélection
-    cercles = cercles_qs
-    communes = communes_qs
-
     if region_selected:
-        cercles = cercles.filter(region_id=region_selected)
+        cercles = [ce for ce in cercles if str(ce["region_id"]) == region_selected]
 
-        # si pas de cercle choisi, on filtre les communes par région via cercle__region
+        # si pas de cercle choisi, on filtre les communes par région via le cercle
         if not cercle_selected:
-            communes = communes.filter(cercle__region_id=region_selected)
+            cercle_ids = {ce["id"] for ce in cercles}
+            communes = [c for c in communes if c["cercle_id"] in cercle_ids]
 
     if cercle_selected:
-        communes = communes.filter(cercle_id=cercle_selected)
-
-    # ✅ JSON pour ton JS (populateCercles/populateCommunes)
-    cercles_json = json.dumps(list(cercles_qs.values("id", "nom", "region_id")))
-    communes_json = json.dumps(list(communes_qs.values("id", "nom", "cercle_id")))
+        communes = [c for c in communes if str(c["cercle_id"]) == cercle_selected]
 
     ctx = {
         "regions": regions,
@@ -184,8 +106,9 @@ def carte(request):
         "commune_selected": commune_selected,
         "statut_selected": statut_selected,
 
-        "cercles_json": cercles_json,
-        "communes_json": communes_json,
+        # ✅ JSON pour ton JS (populateCercles/populateCommunes) : bundle à empreinte,
+        # téléchargé une fois puis servi par le cache du navigateur
+        "geo_digest": geo_bundle()["digest"],
     }
     return render(request, "stations/carte.html", ctx)
 
@@ -224,14 +147,8 @@ def manager_logout(request):
 
 @login_required
 def manager_add_station(request):
-    context = {
-        "regions": Region.objects.order_by("nom"),
-        "cercles": Cercle.objects.select_related("region").order_by("nom"),
-        "communes": Commune.objects.select_related(
-            "cercle",
-            "cercle__region"
-        ).order_by("nom"),
-    }
+    # listes du cache versionné (pas de requête)
+    context = dict(geo_reference_lists())
 
     if request.method == "POST":
         nom = (request.POST.get("nom") or "").strip()
@@ -278,48 +195,34 @@ def manager_dashboard(request):
 
     message = None
     message_error = False
-    push_info = None
 
     search = request.GET.get("search", "").strip()
     station_id = request.GET.get("station") or request.POST.get("station")
 
-    stations_queryset = Station.objects.select_related(
-        "commune",
-        "commune__cercle",
-        "commune__cercle__region",
-    ).all()
-
-    if search:
-        stations_queryset = stations_queryset.filter(
-            Q(nom__icontains=search) |
-            Q(adresse__icontains=search) |
-            Q(commune__nom__icontains=search) |
-            Q(commune__cercle__nom__icontains=search) |
-            Q(commune__cercle__region__nom__icontains=search)
+    if is_super:
+        stations_queryset = Station.objects.select_related(
+            "commune",
+            "commune__cercle",
+            "commune__cercle__region",
         )
 
-    stations_queryset = stations_queryset.order_by("nom")
-
-    if is_super:
         if station_id:
-            station = get_object_or_404(
-                Station.objects.select_related(
-                    "commune",
-                    "commune__cercle",
-                    "commune__cercle__region",
-                ),
-                id=station_id
-            )
+            station = get_object_or_404(stations_queryset, id=station_id)
+        elif search:
+            # Index de recherche (sans accents) : "Segou" trouve "Ségou".
+            # Toutes les correspondances, la première par nom comme avant.
+            hits = get_index().search(search, include_unapproved=True)
+            first = min(hits, key=lambda h: (h["nom"], h["id"]), default=None)
+            station = stations_queryset.filter(id=first["id"]).first() if first else None
         else:
-            station = stations_queryset.first()
+            station = stations_queryset.order_by("nom").first()
 
         if not station:
             return render(request, "stations/manager_dashboard.html", {
-                "message": "Aucune station dans la base.",
+                "message": "Aucune station trouvée." if search else "Aucune station dans la base.",
                 "message_error": True,
                 "is_super": is_super,
                 "search": search,
-                "stations_list": stations_queryset,
             })
     else:
         station = Station.objects.select_related(
@@ -350,7 +253,16 @@ def manager_dashboard(request):
             station.commune = get_object_or_404(Commune, id=commune_id)
 
         station.save()
-        print("STATION MODIFIÉE :", station.id, station.nom, station.latitude, station.longitude, station.commune)
+        logger.info(
+            "station modifiée",
+            extra={"fields": {
+                "station_id": station.id,
+                "latitude": station.latitude,
+                "longitude": station.longitude,
+                "commune_id": station.commune_id,
+                "user_id": request.user.id,
+            }},
+        )
 
         return redirect(f"{request.path}?station={station.id}")
 
@@ -360,83 +272,20 @@ def manager_dashboard(request):
         if form.is_valid():
             produit_raw = form.cleaned_data["produit"]
             niveau_new = form.cleaned_data["niveau"]
-            produit_norm = _norm_produit(produit_raw)
 
-            with transaction.atomic():
-                stock_obj, created = Stock.objects.select_for_update().get_or_create(
-                    station=station,
-                    produit=produit_raw,
-                    defaults={"niveau": niveau_new},
+            # Même chemin d'écriture que l'API gérant (historique + notifications groupées)
+            result = apply_stock_updates(user=request.user, updates=[(station, produit_raw, niveau_new)])
+
+            # affichés après la redirection (django.contrib.messages)
+            messages.success(request, f"✅ Stock enregistré : {produit_raw} → {niveau_new}")
+            push = result["push"]
+            if push:
+                messages.info(
+                    request,
+                    f"🔔 Push: sent={push.get('sent', 0)} · fail={push.get('fail', 0)} · tokens={push.get('token_count', 0)}",
+                    extra_tags="push",
                 )
 
-                old_niveau = None if created else stock_obj.niveau
-
-                stock_obj.niveau = niveau_new
-                stock_obj.date_maj = timezone.now()
-                stock_obj.save()
-
-                StockHistory.objects.create(
-    station=station,
-    produit=produit_raw,
-    ancien_niveau=old_niveau,
-    nouveau_niveau=niveau_new,
-    updated_by=request.user,
-)
-
-                should_notify = _is_plein(niveau_new) and not _is_plein(old_niveau)
-
-                if should_notify:
-                    ten_min_ago = timezone.now() - timedelta(minutes=10)
-
-                    spam_guard = InAppNotification.objects.filter(
-                        station=station,
-                        produit=produit_raw,
-                        message__icontains=f"→ {niveau_new}",
-                        created_at__gte=ten_min_ago,
-                    ).exists()
-
-                    if not spam_guard:
-                        user_follows = (
-                            StationFollow.objects.filter(station=station, is_active=True)
-                            .filter(Q(produit__isnull=True) | Q(produit__iexact=produit_norm))
-                            .select_related("user")
-                            .distinct()
-                        )
-
-                        for follow in user_follows:
-                            create_in_app_notification(
-                                user=follow.user,
-                                station=station,
-                                produit=produit_raw,
-                                niveau=niveau_new,
-                            )
-
-                        device_follows = (
-                            DeviceFollow.objects.filter(station=station, is_active=True)
-                            .filter(Q(produit__isnull=True) | Q(produit__iexact=produit_norm))
-                            .select_related("device")
-                        )
-
-                        if device_follows.exists():
-                            result = send_push_to_device_follows(
-                                device_follows=device_follows,
-                                title="Carburant disponible",
-                                body=f"{station_location_label(station)} : {str(produit_raw).capitalize()} → {niveau_new}",
-                                data={
-                                    "station_id": str(station.id),
-                                    "produit": str(produit_norm or produit_raw),
-                                    "niveau": str(niveau_new),
-                                },
-                            )
-
-                            push_info = {
-                                "sent": result.get("sent", 0),
-                                "fail": result.get("fail", 0),
-                                "token_count": result.get("token_count", 0),
-                            }
-
-                message = f"✅ Stock enregistré : {produit_raw} → {niveau_new}"
-
             return redirect(f"{request.path}?station={station.id}")
 
         message = "❌ Formulaire invalide."
@@ -446,48 +295,53 @@ def manager_dashboard(request):
 
     stocks = Stock.objects.filter(station=station).order_by("produit")
 
-    # ==========================
-    # Statistiques des abonnés
-    # ==========================
-    followers_count = StationFollow.objects.filter(
-        station=station,
-        is_active=True
-    ).count()
-
-    device_followers_count = DeviceFollow.objects.filter(
-        station=station,
-        is_active=True
-    ).count()
-
-    followers_total = followers_count + device_followers_count
+    # Budget de requêtes (GET) : session + user + station + stocks.
+    # Listes géo et compteurs d'abonnés viennent du cache.
+    geo = geo_reference_lists()
 
     return render(
         request,
         "stations/manager_dashboard.html",
         {
             "station": station,
-            "stations_list": stations_queryset if is_super else None,
             "is_super": is_super,
             "form": form,
             "stocks": stocks,
             "message": message,
             "message_error": message_error,
-            "push_info": push_info,
             "search": search,
-            "regions": Region.objects.order_by("nom"),
-            "cercles": Cercle.objects.select_related("region").order_by("nom"),
-            "communes": Commune.objects.select_related(
-                "cercle",
-                "cercle__region"
-            ).order_by("nom"),
+            "regions": geo["regions"],
+            "cercles": geo["cercles"],
+            "communes": geo["communes"],
 
             # Statistiques abonnés
-            "followers_total": followers_total,
-            "followers_count": followers_count,
-            "device_followers_count": device_followers_count,
+            **follower_counts(station.id),
         },
     )
 
+
+@login_required
+def manager_station_search(request):
+    """
+    Typeahead du sélecteur de station (superuser) :
+    GET /manager/stations/search/?q=<texte> -> {"results": [{id, nom, commune}]}
+    """
+    if not request.user.is_superuser:
+        return JsonResponse({"results": []}, status=403)
+
+    q = (request.GET.get("q") or "").strip()
+    if len(q) < 2:
+        return JsonResponse({"results": []})
+
+    page = search_stations(q, page_size=TYPEAHEAD_LIMIT, include_unapproved=True)
+
+    return JsonResponse({
+        "results": [
+            {"id": r["id"], "nom": r["nom"], "commune": r["commune"]}
+            for r in page["results"]
+        ]
+    })
+
 def politique_confidentialite(request):
     return render(request, "politique_confidentialite.html")
 